@@ -1,36 +1,225 @@
-from typing import List
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+import asyncio
 import logging
+import numpy as np
+from ..core.cache import SemanticCache
+from .context import ContextBuilder, source_label
 from ..core.interfaces import Agent
 from ..core.models import Document
 from ..core.interfaces import LLMClient
+from ..core.metrics import REFUSALS, in_context, span
+from ..retrieval.filters import filter_key
 
 logger = logging.getLogger(__name__)
 
 
 class RagAgent(Agent):
-    def __init__(self, retriever, llm: LLMClient, top_k: int = 5, similarity_threshold: float = 0.2):
+    """Retrieval-augmented agent with an optional semantic answer cache.
+
+    When `answer_cache` is given, the retriever must expose `embed_query`,
+    `embed_queries` and `version` (as `SemanticRetriever` does): a question whose embedding is
+    close enough to one already answered over the same store snapshot (and
+    with the same filter) reuses that answer without retrieval or an LLM call.
+
+    Every answering method takes an optional `filter` (see
+    `app.retrieval.filters`) that scopes retrieval to matching chunks.
+    `answer` and `aanswer` are timed as the `answer` stage, prompt building
+    as `build_prompt`, and refusals are counted by reason.
+
+    With a `context_builder`, retrieved chunks are deduplicated, merged and
+    packed into its token budget before they go into the prompt; chunk
+    embeddings for deduplication are the vectors already in `retriever.store`
+    (`embeddings_of`), or are re-embedded with `retriever.embedder` when the
+    store cannot provide them.
+    """
+
+    def __init__(
+        self,
+        retriever,
+        llm: LLMClient,
+        top_k: int = 5,
+        similarity_threshold: float = 0.2,
+        answer_cache: Optional[SemanticCache] = None,
+        context_builder: Optional[ContextBuilder] = None,
+    ):
         self.retriever = retriever
         self.llm = llm
         self.top_k = top_k
         self.similarity_threshold = similarity_threshold
+        self.answer_cache = answer_cache
+        self.context_builder = context_builder
 
     def _format_context(self, docs: List[tuple]) -> str:
+        if self.context_builder is not None:
+            return self.context_builder.build(docs, self._chunk_embeddings(docs)).text
         parts = []
         for doc, score in docs:
-            parts.append(f"Source: {doc.source} (score={score:.3f})\n{doc.text}\n---\n")
+            parts.append(f"Source: {source_label(doc.source, doc.metadata)} (score={score:.3f})\n{doc.text}\n---\n")
         return "\n".join(parts)
 
-    def answer(self, query: str) -> str:
-        results = self.retriever.retrieve(query, k=self.top_k)
+    def _chunk_embeddings(self, docs: List[tuple]) -> Optional[np.ndarray]:
+        if len(docs) < 2 or not self.context_builder.uses_embeddings:
+            return None
+        store = getattr(self.retriever, "store", None)
+        if store is not None:
+            vectors = store.embeddings_of([doc for doc, _ in docs])
+            if vectors is not None:
+                return vectors
+        embedder = getattr(self.retriever, "embedder", None)
+        if embedder is None:
+            return None
+        return embedder.embed_array([doc.text for doc, _ in docs], normalize=True)
+
+    def answer(self, query: str, filter: Optional[Dict[str, Any]] = None) -> str:
+        with span("answer"):
+            if self.answer_cache is None:
+                return self._answer(query, filter)
+
+            version, scope = self.retriever.version, filter_key(filter)
+            emb = self.retriever.embed_query(query)
+            cached = self.answer_cache.get(emb, version, scope)
+            if cached is not None:
+                logger.debug("Answer cache hit for %r", query)
+                return cached
+            resp = self._answer(query, filter)
+            self.answer_cache.put(emb, resp, version, scope)
+            return resp
+
+    def answer_batch(self, queries: Sequence[str], filter: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Answer many questions, batching the retrieval step.
+
+        Query embedding and search run once for all uncached questions via
+        `retriever.retrieve_batch`; LLM calls are still made per question.
+        """
+        answers: List[Optional[str]] = [None] * len(queries)
+        todo = list(range(len(queries)))
+        if self.answer_cache is not None:
+            version, scope = self.retriever.version, filter_key(filter)
+            embs = self.retriever.embed_queries(queries)
+            for i in todo:
+                answers[i] = self.answer_cache.get(embs[i], version, scope)
+            todo = [i for i in todo if answers[i] is None]
+
+        batch = self.retriever.retrieve_batch([queries[i] for i in todo], k=self.top_k, filter=filter)
+        for i, results in zip(todo, batch):
+            answers[i] = self._respond(queries[i], results)
+            if self.answer_cache is not None:
+                self.answer_cache.put(embs[i], answers[i], version, scope)
+        return answers
+
+    def _answer(self, query: str, filter: Optional[Dict[str, Any]] = None) -> str:
+        return self._respond(query, self.retriever.retrieve(query, k=self.top_k, filter=filter))
+
+    def _retrieve_call(self, query: str, filter: Optional[Dict[str, Any]]):
+        return in_context(self.retriever.retrieve, query, k=self.top_k, filter=filter)
+
+    async def aanswer(self, query: str, executor=None, filter: Optional[Dict[str, Any]] = None) -> str:
+        """Async `answer` for the web server.
+
+        Query embedding and FAISS search are CPU-bound and run on `executor`;
+        the completion is awaited through `llm.agenerate`, so the event loop
+        stays free while the LLM call is in flight. Executor work runs in a
+        copy of the caller's context, so its spans join the request's trace.
+        """
+        with span("answer"):
+            loop = asyncio.get_running_loop()
+            if self.answer_cache is not None:
+                version, scope = self.retriever.version, filter_key(filter)
+                emb = await loop.run_in_executor(executor, in_context(self.retriever.embed_query, query))
+                cached = self.answer_cache.get(emb, version, scope)
+                if cached is not None:
+                    return cached
+
+            results = await loop.run_in_executor(executor, self._retrieve_call(query, filter))
+            refusal = self._refusal(results)
+            if refusal is not None:
+                resp = refusal
+            else:
+                # context packing may embed chunks, so it runs on the executor too
+                prompt = await loop.run_in_executor(executor, in_context(self._prompt, query, results))
+                resp = await self.llm.agenerate(prompt)
+            if self.answer_cache is not None:
+                self.answer_cache.put(emb, resp, version, scope)
+            return resp
+
+    def answer_stream(self, query: str, filter: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Like `answer`, but yields the reply as the LLM produces it.
+
+        A refusal or a cached answer is yielded as a single piece.
+        """
+        version = emb = None
+        scope = filter_key(filter)
+        if self.answer_cache is not None:
+            version = self.retriever.version
+            emb = self.retriever.embed_query(query)
+            cached = self.answer_cache.get(emb, version, scope)
+            if cached is not None:
+                yield cached
+                return
+
+        results = self.retriever.retrieve(query, k=self.top_k, filter=filter)
+        refusal = self._refusal(results)
+        if refusal is not None:
+            pieces = [refusal]
+            yield refusal
+        else:
+            pieces = []
+            for token in self.llm.stream(self._prompt(query, results)):
+                pieces.append(token)
+                yield token
+        if self.answer_cache is not None:
+            self.answer_cache.put(emb, "".join(pieces).strip(), version, scope)
+
+    async def aanswer_stream(
+        self, query: str, executor=None, filter: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Async `answer_stream` for the web server; blocking retrieval work
+        runs on `executor` and tokens come from `llm.astream`."""
+        loop = asyncio.get_running_loop()
+        version = emb = None
+        scope = filter_key(filter)
+        if self.answer_cache is not None:
+            version = self.retriever.version
+            emb = await loop.run_in_executor(executor, in_context(self.retriever.embed_query, query))
+            cached = self.answer_cache.get(emb, version, scope)
+            if cached is not None:
+                yield cached
+                return
+
+        results = await loop.run_in_executor(executor, self._retrieve_call(query, filter))
+        refusal = self._refusal(results)
+        if refusal is not None:
+            pieces = [refusal]
+            yield refusal
+        else:
+            pieces = []
+            prompt = await loop.run_in_executor(executor, in_context(self._prompt, query, results))
+            async for token in self.llm.astream(prompt):
+                pieces.append(token)
+                yield token
+        if self.answer_cache is not None:
+            self.answer_cache.put(emb, "".join(pieces).strip(), version, scope)
+
+    def _refusal(self, results: List[tuple]) -> Optional[str]:
         if not results:
+            REFUSALS.inc(reason="no_results")
             return "REFUSE: Insufficient context to answer this question."
 
         # simple guard: check top score
         top_score = results[0][1]
         if top_score < self.similarity_threshold:
+            REFUSALS.inc(reason="low_score")
             return "REFUSE: Retrieved content is not sufficiently relevant; cannot answer without risk of hallucination."
+        return None
+
+    def _prompt(self, query: str, results: List[tuple]) -> str:
+        with span("build_prompt", items=len(results)):
+            context = self._format_context(results)
+        return f"You are an assistant. Answer the user question using ONLY the provided context. If the context does not contain the answer, say you cannot answer.\n\nContext:\n{context}\nQuestion: {query}\nAnswer (concise, cite sources):"
 
-        context = self._format_context(results)
-        prompt = f"You are an assistant. Answer the user question using ONLY the provided context. If the context does not contain the answer, say you cannot answer.\n\nContext:\n{context}\nQuestion: {query}\nAnswer (concise, cite sources):"
-        resp = self.llm.generate(prompt)
+    def _respond(self, query: str, results: List[tuple]) -> str:
+        refusal = self._refusal(results)
+        if refusal is not None:
+            return refusal
+        resp = self.llm.generate(self._prompt(query, results))
         return resp
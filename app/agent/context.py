@@ -0,0 +1,320 @@
+"""Token-budgeted context packing for `RagAgent` prompts.
+
+Retrieved chunks often repeat each other: `chunk_text` overlaps the pieces
+of a long paragraph by 200 characters, neighbouring chunks each carry their
+own header, and similar passages appear in several places.
+`ContextBuilder` turns the retrieved `(Document, score)` list into the
+prompt context in three steps:
+
+1. drop near-duplicates with maximal marginal relevance (MMR) over the chunk
+   embeddings;
+2. merge chunks of the same source that overlap or are adjacent;
+3. pack the resulting blocks by relevance until the model's token budget is
+   used up.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+import math
+import threading
+
+import numpy as np
+
+from ..core.metrics import CONTEXT_TOKENS_SAVED, note
+from ..core.models import Document
+
+logger = logging.getLogger(__name__)
+
+# Context tokens allowed per model family; the longest matching prefix wins.
+MODEL_CONTEXT_BUDGETS: Dict[str, int] = {
+    "gpt-3.5-turbo": 3000,
+    "gpt-4": 3000,
+    "gpt-4-turbo": 6000,
+    "gpt-4o": 6000,
+    "gpt-4.1": 8000,
+}
+DEFAULT_CONTEXT_BUDGET = 3000
+
+
+def budget_for_model(model: Optional[str]) -> int:
+    """Default context token budget for `model`."""
+    best = ""
+    for prefix in MODEL_CONTEXT_BUDGETS:
+        if model and model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return MODEL_CONTEXT_BUDGETS[best] if best else DEFAULT_CONTEXT_BUDGET
+
+
+class TokenCounter:
+    """Counts tokens with `tiktoken` when it is installed; otherwise estimates
+    about four characters per token, which is close for English prose."""
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model
+        self._encoding = None
+        try:
+            import tiktoken
+        except ImportError:
+            return
+        try:
+            self._encoding = tiktoken.encoding_for_model(model or "")
+        except Exception:
+            try:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # e.g. the BPE file cannot be downloaded; keep estimating
+                self._encoding = None
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return math.ceil(len(text) / 4)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of `text` that fits in `max_tokens`."""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text)[:max_tokens])
+        return text[: max_tokens * 4]
+
+
+def suffix_prefix_overlap(a: str, b: str, min_overlap: int = 20) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b`, or 0 if
+    it is shorter than `min_overlap`."""
+    probe = b[:min_overlap]
+    if len(probe) < min_overlap:
+        return 0
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def source_label(source: str, metadata: Optional[dict] = None) -> str:
+    """`source`, plus the page range from `page_start`/`page_end` metadata if present."""
+    pages = _pages(metadata or {})
+    if pages is None:
+        return source
+    first, last = pages
+    return f"{source}, p. {first}" if first == last else f"{source}, pp. {first}-{last}"
+
+
+def _pages(metadata: dict) -> Optional[Tuple[int, int]]:
+    if metadata.get("page_start") is None:
+        return None
+    return metadata["page_start"], metadata.get("page_end", metadata["page_start"])
+
+
+@dataclass
+class _Block:
+    source: str
+    text: str
+    score: float
+    chunk_index: Optional[int]
+    ids: List[str]
+    pages: Optional[Tuple[int, int]] = None
+
+    @property
+    def label(self) -> str:
+        if self.pages is None:
+            return self.source
+        return source_label(self.source, {"page_start": self.pages[0], "page_end": self.pages[1]})
+
+
+@dataclass
+class PackedContext:
+    """The packed context plus what packing saved."""
+
+    text: str
+    tokens: int
+    tokens_before: int
+    chunks_retrieved: int
+    chunks_used: int
+    duplicates_dropped: int = 0
+    chunks_merged: int = 0
+    sources: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens
+
+
+class ContextBuilder:
+    """Builds a deduplicated, merged and budgeted context string.
+
+    Args:
+        budget: maximum context tokens; 0 uses `budget_for_model(model)`.
+        model: LLM name, for the default budget and the tokenizer.
+        mmr_lambda: relevance/diversity trade-off for ordering (1.0 ranks by
+            score alone).
+        duplicate_threshold: chunks whose embedding has at least this cosine
+            similarity to an already selected chunk are dropped.
+        min_overlap: shortest shared text (characters) that counts as overlap
+            when merging chunks of the same source.
+    """
+
+    def __init__(
+        self,
+        budget: int = 0,
+        model: Optional[str] = None,
+        mmr_lambda: float = 0.7,
+        duplicate_threshold: float = 0.95,
+        min_overlap: int = 20,
+        counter: Optional[TokenCounter] = None,
+    ):
+        self.model = model
+        self.budget = budget or budget_for_model(model)
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.counter = counter or TokenCounter(model)
+        self.requests = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def uses_embeddings(self) -> bool:
+        """Whether `build` makes use of chunk embeddings."""
+        return self.mmr_lambda < 1.0 or self.duplicate_threshold < 1.0
+
+    @staticmethod
+    def format_block(source: str, score: float, text: str) -> str:
+        return f"Source: {source} (score={score:.3f})\n{text}\n---\n"
+
+    def _mmr(self, results: Sequence[Tuple[Document, float]], embeddings: Optional[np.ndarray]) -> Tuple[List[int], int]:
+        """Result indices in MMR order, minus near-duplicates; also returns how many were dropped."""
+        order = sorted(range(len(results)), key=lambda i: -results[i][1])
+        if embeddings is None or len(results) < 2:
+            return order, 0
+        sims = embeddings @ embeddings.T
+        selected: List[int] = []
+        dropped = 0
+        remaining = order
+        while remaining:
+            if selected:
+                redundancy = sims[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            keep = [j for j, r in enumerate(redundancy) if r < self.duplicate_threshold]
+            dropped += len(remaining) - len(keep)
+            remaining = [remaining[j] for j in keep]
+            if not remaining:
+                break
+            redundancy = redundancy[keep]
+            scores = [self.mmr_lambda * results[i][1] - (1 - self.mmr_lambda) * r for i, r in zip(remaining, redundancy)]
+            best = int(np.argmax(scores))
+            selected.append(remaining.pop(best))
+        return selected, dropped
+
+    def _merge(self, blocks: List[_Block]) -> Tuple[List[_Block], int]:
+        """Merge overlapping or adjacent blocks of the same source."""
+        by_source: Dict[str, List[_Block]] = {}
+        for block in blocks:
+            by_source.setdefault(block.source, []).append(block)
+        merged: List[_Block] = []
+        merges = 0
+        for group in by_source.values():
+            if all(b.chunk_index is not None for b in group):
+                group.sort(key=lambda b: b.chunk_index)
+            current = group[0]
+            for nxt in group[1:]:
+                overlap = suffix_prefix_overlap(current.text, nxt.text, self.min_overlap)
+                adjacent = (
+                    current.chunk_index is not None
+                    and nxt.chunk_index is not None
+                    and nxt.chunk_index - current.chunk_index == 1
+                )
+                if overlap or adjacent:
+                    joiner = "" if overlap else "\n\n"
+                    pages = None
+                    if current.pages is not None and nxt.pages is not None:
+                        pages = (min(current.pages[0], nxt.pages[0]), max(current.pages[1], nxt.pages[1]))
+                    current = _Block(
+                        current.source,
+                        current.text + joiner + nxt.text[overlap:],
+                        max(current.score, nxt.score),
+                        nxt.chunk_index,
+                        current.ids + nxt.ids,
+                        pages,
+                    )
+                    merges += 1
+                else:
+                    merged.append(current)
+                    current = nxt
+            merged.append(current)
+        return merged, merges
+
+    def build(
+        self, results: Sequence[Tuple[Document, float]], embeddings: Optional[np.ndarray] = None
+    ) -> PackedContext:
+        """Pack `results` into a context string within `budget` tokens.
+
+        `embeddings` are the L2-normalized chunk vectors, one row per result;
+        without them only exact overlaps are removed.
+        """
+        naive = "\n".join(self.format_block(source_label(d.source, d.metadata), s, d.text) for d, s in results)
+        tokens_before = self.counter.count(naive)
+
+        order, dropped = self._mmr(results, embeddings)
+        blocks = [
+            _Block(results[i][0].source, results[i][0].text, results[i][1],
+                   results[i][0].metadata.get("chunk_index"), [results[i][0].id], _pages(results[i][0].metadata))
+            for i in order
+        ]
+        blocks, merges = self._merge(blocks)
+        blocks.sort(key=lambda b: -b.score)
+
+        parts: List[str] = []
+        used_ids: List[str] = []
+        sources: List[str] = []
+        remaining = self.budget
+        for block in blocks:
+            part = self.format_block(block.label, block.score, block.text)
+            cost = self.counter.count(part) + 1  # +1 for the joining newline
+            if cost <= remaining:
+                parts.append(part)
+                used_ids.extend(block.ids)
+                sources.append(block.source)
+                remaining -= cost
+        if not parts and blocks:
+            # nothing fits whole: keep as much of the best block as the budget allows
+            top = blocks[0]
+            header = self.format_block(top.label, top.score, "")
+            text = self.counter.truncate(top.text, remaining - self.counter.count(header) - 1)
+            parts.append(self.format_block(top.label, top.score, text))
+            used_ids.extend(top.ids)
+            sources.append(top.source)
+
+        text = "\n".join(parts)
+        packed = PackedContext(
+            text=text,
+            tokens=self.counter.count(text),
+            tokens_before=tokens_before,
+            chunks_retrieved=len(results),
+            chunks_used=len(used_ids),
+            duplicates_dropped=dropped,
+            chunks_merged=merges,
+            sources=sources,
+        )
+        with self._lock:
+            self.requests += 1
+            self.tokens_saved += packed.tokens_saved
+        CONTEXT_TOKENS_SAVED.observe(packed.tokens_saved)
+        note("context_tokens_saved", packed.tokens_saved)
+        logger.info(
+            "Context: %d chunks -> %d tokens (%d saved; %d duplicates dropped, %d merges)",
+            packed.chunks_retrieved, packed.tokens, packed.tokens_saved, dropped, merges,
+        )
+        return packed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "tokens_saved": self.tokens_saved, "budget": self.budget}
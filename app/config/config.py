@@ -9,16 +9,173 @@ load_dotenv()
 class Settings:
     embedding_model: str
     openai_api_key: str | None
+    openai_model: str
+    openai_base_url: str | None
+    openai_timeout: float
+    openai_max_connections: int
+    openai_max_retries: int
+    openai_requests_per_minute: float
+    openai_tokens_per_minute: float
+    openai_hedge_after: float
+    openai_coalesce: bool
     faiss_index_path: str
     top_k: int
+    retrieve_max_k: int
     similarity_threshold: float
+    ingest_workers: int | None
+    ingest_queue_depth: int
+    embed_batch_size: int
+    embed_batch_tokens: int
+    embed_max_batch: int
+    embed_workers: int
+    embedding_backend: str
+    onnx_cache_dir: str
+    embedding_service_socket: str
+    embed_service_max_batch: int
+    embed_service_wait_ms: float
+    chunk_size: int
+    chunk_overlap: int
+    chunk_by_tokens: bool
+    faiss_index_type: str
+    faiss_nlist: int
+    faiss_pq_m: int
+    faiss_pq_nbits: int
+    faiss_hnsw_m: int
+    faiss_nprobe: int
+    faiss_ef_search: int
+    faiss_train_size: int
+    faiss_filter_exact_max: int
+    faiss_storage: str
+    faiss_rerank_factor: int
+    faiss_compact_ratio: float
+    faiss_shards: int
+    faiss_shard_by: str
+    faiss_shard_workers: int
+    embedding_cache_path: str
+    embedding_cache_memory_items: int
+    embedding_cache_max_items: int
+    query_cache_size: int
+    query_cache_ttl: float
+    answer_cache_size: int
+    answer_cache_ttl: float
+    answer_cache_max_distance: float
+    context_token_budget: int
+    context_mmr_lambda: float
+    context_dedup_threshold: float
+    server_cpu_workers: int
+    chat_max_concurrency: int
+    chat_max_queue: int
+    ingest_max_concurrency: int
+    ingest_max_queue: int
+    store_registry_dir: str
+    store_memory_budget_mb: int
 
 
 def get_settings() -> Settings:
     return Settings(
         embedding_model=os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
         openai_api_key=os.getenv("OPENAI_API_KEY"),
+        openai_model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+        # any OpenAI-compatible endpoint, e.g. benchmarks/mock_openai.py
+        openai_base_url=os.getenv("OPENAI_BASE_URL") or None,
+        # pooled keep-alive connections, per-request timeout and retries of
+        # 429/5xx/timeouts with jittered backoff
+        openai_timeout=float(os.getenv("OPENAI_TIMEOUT", "30")),
+        openai_max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+        openai_max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+        # client-side rate limits (0 = unlimited); set them just below the
+        # account's limits so bursts queue here instead of failing with 429
+        openai_requests_per_minute=float(os.getenv("OPENAI_RPM", "0")),
+        openai_tokens_per_minute=float(os.getenv("OPENAI_TPM", "0")),
+        # race a second request against completions slower than this (0 = off)
+        openai_hedge_after=float(os.getenv("OPENAI_HEDGE_AFTER", "0")),
+        # concurrent identical prompts share one completion
+        openai_coalesce=os.getenv("OPENAI_COALESCE", "1").lower() in ("1", "true", "yes"),
         faiss_index_path=os.getenv("FAISS_INDEX_PATH", "./faiss.index"),
         top_k=int(os.getenv("TOP_K", "5")),
+        # largest `k` a /api/retrieve/batch request may ask for
+        retrieve_max_k=int(os.getenv("RETRIEVE_MAX_K", "100")),
         similarity_threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.2")),
+        # unset means "one extraction process per CPU core"
+        ingest_workers=int(os.environ["INGEST_WORKERS"]) if os.getenv("INGEST_WORKERS") else None,
+        ingest_queue_depth=int(os.getenv("INGEST_QUEUE_DEPTH", "8")),
+        embed_batch_size=int(os.getenv("EMBED_BATCH_SIZE", "256")),
+        # each embedding call is encoded in batches of similar token length
+        # holding at most EMBED_BATCH_TOKENS padded tokens / EMBED_MAX_BATCH
+        # texts; EMBED_WORKERS > 0 encodes `ingest` runs in that many processes
+        embed_batch_tokens=int(os.getenv("EMBED_BATCH_TOKENS", "8192")),
+        embed_max_batch=int(os.getenv("EMBED_MAX_BATCH", "128")),
+        embed_workers=int(os.getenv("EMBED_WORKERS", "0")),
+        # torch (sentence-transformers), onnx (ONNX Runtime) or onnx-int8
+        # (int8 weights); ONNX exports are cached under ONNX_CACHE_DIR
+        embedding_backend=os.getenv("EMBEDDING_BACKEND", "torch").lower(),
+        onnx_cache_dir=os.getenv("ONNX_CACHE_DIR", "./onnx_models"),
+        # with a socket path, embeddings come from the shared service started
+        # by `python -m app.main embed-server`, which batches concurrent
+        # requests for up to EMBED_SERVICE_WAIT_MS or EMBED_SERVICE_MAX_BATCH texts
+        embedding_service_socket=os.getenv("EMBEDDING_SERVICE_SOCKET", ""),
+        embed_service_max_batch=int(os.getenv("EMBED_SERVICE_MAX_BATCH", "64")),
+        embed_service_wait_ms=float(os.getenv("EMBED_SERVICE_WAIT_MS", "5")),
+        # chunk size/overlap in characters, or with CHUNK_BY_TOKENS=1 in
+        # tokens of EMBEDDING_MODEL's tokenizer (CHUNK_SIZE=0: the model's
+        # max sequence length, so chunks are never truncated when embedded)
+        chunk_size=int(os.getenv("CHUNK_SIZE", "1000")),
+        chunk_overlap=int(os.getenv("CHUNK_OVERLAP", "200")),
+        chunk_by_tokens=os.getenv("CHUNK_BY_TOKENS", "0").lower() in ("1", "true", "yes"),
+        # flat | ivf_flat | ivf_pq | hnsw | auto (pick by corpus size)
+        faiss_index_type=os.getenv("FAISS_INDEX_TYPE", "flat").lower(),
+        faiss_nlist=int(os.getenv("FAISS_NLIST", "0")),
+        faiss_pq_m=int(os.getenv("FAISS_PQ_M", "16")),
+        faiss_pq_nbits=int(os.getenv("FAISS_PQ_NBITS", "8")),
+        faiss_hnsw_m=int(os.getenv("FAISS_HNSW_M", "32")),
+        faiss_nprobe=int(os.getenv("FAISS_NPROBE", "16")),
+        faiss_ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+        faiss_train_size=int(os.getenv("FAISS_TRAIN_SIZE", "50000")),
+        # filters matching at most this many chunks are scored exactly
+        faiss_filter_exact_max=int(os.getenv("FAISS_FILTER_EXACT_MAX", "20000")),
+        # float32 | float16 | int8 | pq; lossy encodings keep a memory-mapped
+        # float32 copy and re-score FAISS_RERANK_FACTOR * k candidates
+        # (0 = no copy, smallest disk footprint, quantized scores)
+        faiss_storage=os.getenv("FAISS_STORAGE", "float32").lower(),
+        faiss_rerank_factor=int(os.getenv("FAISS_RERANK_FACTOR", "4")),
+        # deletes are tombstoned; compact in the background once this fraction
+        # of a store is deleted (0 = only on `python -m app.main delete --compact`)
+        faiss_compact_ratio=float(os.getenv("FAISS_COMPACT_RATIO", "0.2")),
+        # FAISS_SHARDS > 1 splits the CLI corpus into independently persisted
+        # shards searched in parallel; FAISS_SHARD_BY is source | hash and
+        # FAISS_SHARD_WORKERS the search threads (0 = one per shard)
+        faiss_shards=int(os.getenv("FAISS_SHARDS", "1")),
+        faiss_shard_by=os.getenv("FAISS_SHARD_BY", "source").lower(),
+        faiss_shard_workers=int(os.getenv("FAISS_SHARD_WORKERS", "0")),
+        # kept next to the index by default, not in whatever directory the
+        # app is started from; set EMBEDDING_CACHE_PATH empty to disable it
+        embedding_cache_path=os.getenv(
+            "EMBEDDING_CACHE_PATH", os.getenv("FAISS_INDEX_PATH", "./faiss.index") + ".embeddings.sqlite"
+        ),
+        embedding_cache_memory_items=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000")),
+        embedding_cache_max_items=int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "1000000")),
+        # sizes of 0 disable the query/answer caches
+        query_cache_size=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+        query_cache_ttl=float(os.getenv("QUERY_CACHE_TTL", "300")),
+        answer_cache_size=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+        answer_cache_ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        answer_cache_max_distance=float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.05")),
+        # prompt context: token budget (0 = default for OPENAI_MODEL), MMR
+        # relevance weight and the cosine similarity above which chunks are
+        # dropped as near-duplicates
+        context_token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "0")),
+        context_mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+        context_dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95")),
+        # web server: bounded CPU pool plus per-endpoint admission limits;
+        # requests beyond max concurrency + max queue get a 429
+        server_cpu_workers=int(os.getenv("SERVER_CPU_WORKERS", "4")),
+        chat_max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "32")),
+        chat_max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+        # uploads are ingested by this many background job workers; at most
+        # INGEST_MAX_QUEUE jobs wait before /api/ingest answers 429
+        ingest_max_concurrency=int(os.getenv("INGEST_MAX_CONCURRENCY", "2")),
+        ingest_max_queue=int(os.getenv("INGEST_MAX_QUEUE", "16")),
+        # per-document stores of the web server; 0 MB means no memory limit
+        store_registry_dir=os.getenv("STORE_REGISTRY_DIR", "./stores"),
+        store_memory_budget_mb=int(os.getenv("STORE_MEMORY_BUDGET_MB", "1024")),
     )
@@ -0,0 +1,154 @@
+"""Small in-process caches shared by the retriever and the agent."""
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+import threading
+import time
+
+import numpy as np
+
+from .metrics import CACHE_LOOKUPS
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire `ttl` seconds after insert.
+
+    A `max_items` of 0 disables the cache (every `get` misses). With a
+    `name`, lookups are also counted in `rag_cache_lookups_total`.
+    """
+
+    def __init__(self, max_items: int, ttl: float, clock: Callable[[], float] = time.monotonic,
+                 name: Optional[str] = None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or self._clock() - item[0] > self.ttl:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                self._count("miss")
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            self._count("hit")
+            return item[1]
+
+    def _count(self, result: str) -> None:
+        if self.name is not None:
+            CACHE_LOOKUPS.inc(cache=self.name, result=result)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self._clock(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SemanticCache:
+    """Cache keyed by embedding proximity instead of exact equality.
+
+    `get` returns the value of the most similar live entry if its cosine
+    distance to the query embedding is at most `max_distance`. Entries are
+    tied to a store `version`: looking up with a different version drops
+    everything, since answers computed over an older snapshot may be stale.
+    Entries are also tagged with a `scope` (e.g. a search filter) and only
+    match lookups in the same scope. Embeddings are expected to be
+    L2-normalized. With a `name`, lookups are also counted in
+    `rag_cache_lookups_total`.
+    """
+
+    def __init__(
+        self,
+        max_items: int,
+        ttl: float,
+        max_distance: float = 0.05,
+        clock: Callable[[], float] = time.monotonic,
+        name: Optional[str] = None,
+    ):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._version: Any = None
+        self._entries: List[Tuple[float, np.ndarray, Any, Hashable]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: Any) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _expire(self) -> None:
+        cutoff = self._clock() - self.ttl
+        if self._entries and self._entries[0][0] < cutoff:
+            self._entries = [e for e in self._entries if e[0] >= cutoff]
+            self._matrix = None
+
+    def get(self, embedding: np.ndarray, version: Any = None, scope: Hashable = None) -> Any:
+        with self._lock:
+            self._check_version(version)
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                self._count("miss")
+                return None
+            if self._matrix is None:
+                self._matrix = np.stack([e[1] for e in self._entries])
+            sims = self._matrix @ np.asarray(embedding, dtype=np.float32).ravel()
+            out_of_scope = [i for i, e in enumerate(self._entries) if e[3] != scope]
+            sims[out_of_scope] = -np.inf
+            best = int(np.argmax(sims))
+            if 1.0 - float(sims[best]) > self.max_distance:
+                self.misses += 1
+                self._count("miss")
+                return None
+            self.hits += 1
+            self._count("hit")
+            return self._entries[best][2]
+
+    def _count(self, result: str) -> None:
+        if self.name is not None:
+            CACHE_LOOKUPS.inc(cache=self.name, result=result)
+
+    def put(self, embedding: np.ndarray, value: Any, version: Any = None, scope: Hashable = None) -> None:
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            # entries stay in insertion order, so the oldest is evicted first
+            self._entries.append((self._clock(), np.asarray(embedding, dtype=np.float32).ravel().copy(), value, scope))
+            if len(self._entries) > self.max_items:
+                del self._entries[: len(self._entries) - self.max_items]
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,8 +1,16 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Iterable, List
+import asyncio
+import functools
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Sequence, Union
+import numpy as np
 from .models import Document
 
+# Embeddings may be passed around either as Python lists (the original API)
+# or as float32 NumPy arrays (the zero-copy path used for bulk ingestion).
+EmbeddingMatrix = Union[np.ndarray, Sequence[Sequence[float]]]
+EmbeddingVector = Union[np.ndarray, Sequence[float]]
+
 
 class Loader(ABC):
     @abstractmethod
@@ -15,15 +23,68 @@ class Embedder(ABC):
     def embed(self, texts: Iterable[str]) -> List[List[float]]:
         """Return embeddings for given texts."""
 
+    def embed_array(self, texts: Iterable[str], normalize: bool = False) -> np.ndarray:
+        """Return embeddings as a C-contiguous float32 array of shape (n, dim).
+
+        When `normalize` is true every row is L2-normalized. Implementations
+        should override this to avoid the list round trip.
+        """
+        arr = np.ascontiguousarray(np.asarray(self.embed(texts), dtype=np.float32))
+        if normalize and arr.size:
+            norms = np.linalg.norm(arr, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            arr /= norms
+        return arr
+
+    @property
+    def dimension(self) -> int:
+        """Length of the embedding vectors.
+
+        The default embeds a probe string; implementations that can read the
+        dimension from configuration should override this.
+        """
+        return self.embed_array(["dimension probe"]).shape[1]
+
+    def warm_up(self) -> None:
+        """Load models and run one embedding so the first real query is fast."""
+        self.embed_array(["warm up"])
+
 
 class VectorStore(ABC):
     @abstractmethod
-    def add(self, docs: List[Document], embeddings: List[List[float]]) -> None:
-        pass
+    def add(self, docs: List[Document], embeddings: EmbeddingMatrix, normalized: bool = False) -> None:
+        """Add docs with their embeddings (list of lists or float32 array).
+
+        Pass `normalized=True` when the rows are already L2-normalized so the
+        store can use them without copying.
+        """
 
     @abstractmethod
-    def search(self, embedding: List[float], k: int):
-        """Return list of tuples (Document, score)."""
+    def search(self, embedding: EmbeddingVector, k: int, normalized: bool = False, filter: Optional[dict] = None):
+        """Return list of tuples (Document, score).
+
+        `filter` restricts results to documents whose source/metadata match
+        (see `app.retrieval.filters`).
+        """
+
+    def search_batch(
+        self, embeddings: EmbeddingMatrix, k: int, normalized: bool = False, filter: Optional[dict] = None
+    ):
+        """Return one list of (Document, score) per query row.
+
+        The default loops over `search`; stores should override it with a
+        single batched lookup.
+        """
+        return [
+            self.search(row, k, normalized=normalized, filter=filter)
+            for row in np.asarray(embeddings, dtype=np.float32)
+        ]
+
+    def embeddings_of(self, docs: Sequence[Document]) -> Optional[np.ndarray]:
+        """Return the stored, L2-normalized vectors of `docs` (one row each),
+        or None when the store cannot, e.g. because one of them is missing.
+        The default stores keep no vectors to hand out."""
+        return None
 
     @abstractmethod
     def persist(self, path: str) -> None:
@@ -36,8 +97,12 @@ class VectorStore(ABC):
 
 class Retriever(ABC):
     @abstractmethod
-    def retrieve(self, query: str, k: int):
-        """Return list of (Document, score)."""
+    def retrieve(self, query: str, k: int, filter: Optional[dict] = None):
+        """Return list of (Document, score), optionally restricted by `filter`."""
+
+    def retrieve_batch(self, queries: Sequence[str], k: int, filter: Optional[dict] = None):
+        """Return one list of (Document, score) per query."""
+        return [self.retrieve(q, k, filter=filter) for q in queries]
 
 
 class LLMClient(ABC):
@@ -45,8 +110,34 @@ class LLMClient(ABC):
     def generate(self, prompt: str, **kwargs) -> str:
         """Generate text for a prompt."""
 
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        """Async `generate`. The default runs `generate` in a worker thread;
+        network-bound clients should override it with a native async call."""
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Yield the completion in pieces as they are produced.
+
+        The default yields the whole `generate` result at once; streaming
+        clients override it to yield tokens.
+        """
+        yield self.generate(prompt, **kwargs)
+
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Async `stream`; the default yields the whole `agenerate` result."""
+        yield await self.agenerate(prompt, **kwargs)
+
 
 class Agent(ABC):
     @abstractmethod
-    def answer(self, query: str) -> str:
-        """Process query, call retriever as a tool and return grounded answer."""
+    def answer(self, query: str, filter: Optional[dict] = None) -> str:
+        """Process query, call retriever as a tool and return grounded answer.
+
+        `filter` is passed to the retriever to scope the evidence.
+        """
+
+    async def aanswer(self, query: str, executor=None, filter: Optional[dict] = None) -> str:
+        """Async `answer`; blocking work runs on `executor` (default pool if None)."""
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, functools.partial(self.answer, query, filter=filter)
+        )
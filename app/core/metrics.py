@@ -0,0 +1,318 @@
+"""In-process metrics and per-request timing spans.
+
+`METRICS` holds counters, histograms and callback gauges and renders them in
+the Prometheus text exposition format for the web server's `/metrics`
+endpoint. Pipeline stages are timed with `span`:
+
+    with span("search", items=len(queries)):
+        ...
+
+Every span observes its duration into `rag_stage_seconds{stage=...}` (and
+`items` into `rag_batch_size{stage=...}`), and adds it to the request's
+`Trace` if one is active (see `trace`). A span costs two `perf_counter`
+calls, a bisect and a lock, so it is always on.
+
+The active trace lives in a context variable: it follows `await`s, but
+`loop.run_in_executor` does not copy the context, so executor work that should
+be attributed to the request goes through `in_context`.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import contextvars
+import functools
+import math
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+TOKEN_BUCKETS = (0, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_number(value)}" for name, labels, value in self.samples()]
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _labels(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with `_sum` and `_count` per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: [count per bucket (last is +Inf), sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                yield (f"{self.name}_bucket", _labels(self.labelnames + ("le",), key + (_number(bound),)),
+                       cumulative)
+            yield f"{self.name}_sum", _labels(self.labelnames, key), total
+            yield f"{self.name}_count", _labels(self.labelnames, key), cumulative
+
+
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or a mapping of label values to numbers
+    when the gauge has labels.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], GaugeValue], labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def samples(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                yield self.name, _labels(self.labelnames, key), v
+        else:
+            yield self.name, "", value
+
+
+class MetricsRegistry:
+    """Named metrics, rendered together in registration order.
+
+    `counter` and `histogram` return the existing metric when the name is
+    already registered, so modules can declare theirs at import time;
+    `gauge` replaces an existing callback (e.g. when a new server app is
+    created).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_add(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_add(Histogram, name, help, labelnames, buckets)
+
+    def gauge(self, name: str, help: str, fn: Callable[[], GaugeValue], labelnames: Sequence[str] = ()) -> Gauge:
+        with self._lock:
+            gauge = self._metrics[name] = Gauge(name, help, fn, labelnames)
+            return gauge
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+STAGE_SECONDS = METRICS.histogram("rag_stage_seconds", "Wall time per pipeline stage.", ("stage",))
+STAGE_ERRORS = METRICS.counter("rag_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+BATCH_SIZE = METRICS.histogram("rag_batch_size", "Items per call of a batched stage.", ("stage",), SIZE_BUCKETS)
+CACHE_LOOKUPS = METRICS.counter("rag_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+REFUSALS = METRICS.counter("rag_refusals_total", "Answers refused without calling the LLM.", ("reason",))
+CONTEXT_TOKENS_SAVED = METRICS.histogram(
+    "rag_context_tokens_saved", "Prompt tokens saved per request by context packing.", (), TOKEN_BUCKETS
+)
+
+
+class Trace:
+    """Per-request accumulation of stage timings.
+
+    A stage that runs more than once in a request (e.g. `search` per
+    retrieved document) is summed; `calls` records how often it ran.
+    Per-request quantities other than time (see `note`) are summed in
+    `values`.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def add_value(self, name: str, value: float) -> None:
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def breakdown(self) -> dict:
+        """Milliseconds per stage, in the order stages first ran, plus the
+        total and any noted `values`."""
+        with self._lock:
+            stages = {s: {"ms": round(t * 1000, 3), "calls": self.calls[s]} for s, t in self.stages.items()}
+            values = dict(self.values)
+        out = {"total_ms": round((time.perf_counter() - self.start) * 1000, 3), "stages": stages}
+        if values:
+            out["values"] = values
+        return out
+
+
+_current: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("rag_trace", default=None)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Collect the spans of the enclosed code (and of `in_context` calls) in a new `Trace`."""
+    current = Trace()
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def note(name: str, value: float) -> None:
+    """Add `value` to `name` in the active trace's `values`, if any."""
+    current = _current.get()
+    if current is not None:
+        current.add_value(name, value)
+
+
+class span:
+    """Time a pipeline stage; see the module docstring."""
+
+    __slots__ = ("stage", "items", "_start")
+
+    def __init__(self, stage: str, items: Optional[int] = None):
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self) -> "span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        elapsed = time.perf_counter() - self._start
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        if self.items is not None:
+            BATCH_SIZE.observe(self.items, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage)
+        current = _current.get()
+        if current is not None:
+            current.add(self.stage, elapsed)
+
+
+def in_context(fn: Callable, *args, **kwargs) -> Callable[[], object]:
+    """`fn` bound to `args` that runs in a copy of the caller's context.
+
+    Use for `loop.run_in_executor` so spans in the worker thread land in
+    the caller's trace.
+    """
+    return functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
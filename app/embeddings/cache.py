@@ -0,0 +1,193 @@
+"""Persistent embedding cache that wraps any `Embedder`.
+
+Vectors are keyed by `sha256(model name + normalized text)` and stored as raw
+float32 bytes in SQLite, with a bounded in-memory LRU in front of it. Batch
+calls only send cache misses to the wrapped model.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from ..core.interfaces import Embedder
+from ..core.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of host parameters per statement.
+_SQL_CHUNK = 500
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbedder(Embedder):
+    """Caching decorator for an `Embedder`.
+
+    Args:
+        inner: the embedder that computes misses.
+        path: SQLite file holding the on-disk cache (`":memory:"` for tests).
+        model_name: part of the cache key; defaults to `inner.model_name`.
+        memory_items: size of the in-memory LRU.
+        max_disk_items: the on-disk cache evicts least-recently-used rows
+            beyond this count.
+    """
+
+    def __init__(
+        self,
+        inner: Embedder,
+        path: str,
+        model_name: Optional[str] = None,
+        memory_items: int = 10_000,
+        max_disk_items: int = 1_000_000,
+    ):
+        self.inner = inner
+        self.model_name = model_name or getattr(inner, "model_name", type(inner).__name__)
+        self.memory_items = memory_items
+        self.max_disk_items = max_disk_items
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (key BLOB PRIMARY KEY, vec BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors(last_used)")
+        self._disk_count = self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\x00{normalize_text(text)}".encode("utf-8")).digest()
+
+    def _remember(self, key: bytes, vec: np.ndarray) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found: Dict[bytes, np.ndarray] = {}
+        for i in range(0, len(keys), _SQL_CHUNK):
+            chunk = keys[i : i + _SQL_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = self._db.execute(f"SELECT key, vec FROM vectors WHERE key IN ({marks})", chunk).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+            if rows:
+                now = time.time()
+                self._db.executemany("UPDATE vectors SET last_used = ? WHERE key = ?", [(now, k) for k, _ in rows])
+        return found
+
+    def _write_disk(self, items: Dict[bytes, np.ndarray]) -> None:
+        now = time.time()
+        cur = self._db.executemany(
+            "INSERT OR IGNORE INTO vectors (key, vec, last_used) VALUES (?, ?, ?)",
+            [(k, v.tobytes(), now) for k, v in items.items()],
+        )
+        self._disk_count += max(cur.rowcount, 0)
+        overflow = self._disk_count - self.max_disk_items
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM vectors WHERE key IN (SELECT key FROM vectors ORDER BY last_used, rowid LIMIT ?)", (overflow,)
+            )
+            self._disk_count -= overflow
+
+    def embed_array(self, texts: Iterable[str], normalize: bool = False) -> np.ndarray:
+        texts = list(texts)
+        keys = [self._key(t) for t in texts]
+        with self._lock:
+            vectors: Dict[bytes, np.ndarray] = {}
+            for key in keys:
+                if key in self._memory and key not in vectors:
+                    self._memory.move_to_end(key)
+                    vectors[key] = self._memory[key]
+            memory_hits = sum(1 for k in keys if k in vectors)
+            self.memory_hits += memory_hits
+
+            lookup = list({k for k in keys if k not in vectors})
+            if lookup:
+                from_disk = self._read_disk(lookup)
+                for key, vec in from_disk.items():
+                    self._remember(key, vec)
+                vectors.update(from_disk)
+                self.disk_hits += sum(1 for k in keys if k in from_disk)
+
+            # only unique misses go to the model
+            pending: Dict[bytes, str] = {}
+            for key, text in zip(keys, texts):
+                if key not in vectors:
+                    pending.setdefault(key, text)
+            misses = sum(1 for k in keys if k not in vectors)
+            self.misses += misses
+        disk_hits = len(keys) - misses - memory_hits
+        for result, n in (("memory_hit", memory_hits), ("disk_hit", disk_hits), ("miss", misses)):
+            if n:
+                CACHE_LOOKUPS.inc(n, cache="embedding", result=result)
+
+        if pending:
+            computed = self.inner.embed_array(list(pending.values()))
+            fresh = {key: computed[i].copy() for i, key in enumerate(pending)}
+            with self._lock:
+                for key, vec in fresh.items():
+                    self._remember(key, vec)
+                self._write_disk(fresh)
+                self._db.commit()
+            vectors.update(fresh)
+        elif lookup:
+            with self._lock:
+                self._db.commit()  # persist last_used updates
+
+        if not texts:
+            return self.inner.embed_array([], normalize=normalize)
+        out = np.stack([vectors[k] for k in keys]).astype(np.float32, copy=False)
+        if normalize:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            out /= norms
+        return out
+
+    def embed(self, texts: Iterable[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    @property
+    def dimension(self) -> int:
+        return self.inner.dimension
+
+    def warm_up(self) -> None:
+        # bypass the cache: a hit would leave the inner model unloaded
+        self.inner.warm_up()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_items": len(self._memory),
+            "disk_items": self._disk_count,
+        }
+
+    def close(self) -> None:
+        """Close the SQLite file and the inner embedder (e.g. its encode processes)."""
+        with self._lock:
+            self._db.close()
+        if hasattr(self.inner, "close"):
+            self.inner.close()
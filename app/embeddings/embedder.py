@@ -1,24 +1,267 @@
-from typing import Iterable, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Sequence
+import json
 import logging
+import multiprocessing
+import os
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from ..core.interfaces import Embedder
+from ..core.metrics import span
 
 logger = logging.getLogger(__name__)
 
+# Pooling modes that each contribute `word_embedding_dimension` to the output.
+_POOLING_MODES = (
+    "pooling_mode_cls_token",
+    "pooling_mode_max_tokens",
+    "pooling_mode_mean_tokens",
+    "pooling_mode_mean_sqrt_len_tokens",
+    "pooling_mode_weightedmean_tokens",
+    "pooling_mode_lasttoken",
+)
+
+
+def _local_model_dir(model_name: str) -> Optional[str]:
+    """Directory holding the model's files, if it is on disk already."""
+    if os.path.isdir(model_name):
+        return model_name
+    try:
+        from huggingface_hub import snapshot_download
+    except ImportError:
+        return None
+    # sentence-transformers resolves bare names under its own organisation
+    candidates = [model_name] if "/" in model_name else [f"sentence-transformers/{model_name}", model_name]
+    for repo_id in candidates:
+        try:
+            return snapshot_download(repo_id, local_files_only=True)
+        except Exception:
+            continue
+    return None
+
+
+def model_config_dimension(model_name: str) -> Optional[int]:
+    """Read a sentence-transformers model's output dimension from its config.
+
+    Walks `modules.json` and applies the Pooling and Dense layer configs, so
+    no weights are loaded and no forward pass runs. Returns None when the
+    model is not available locally or its layout is not understood.
+    """
+    path = _local_model_dir(model_name)
+    if path is None or not os.path.exists(os.path.join(path, "modules.json")):
+        return None
+    with open(os.path.join(path, "modules.json"), encoding="utf-8") as f:
+        modules = sorted(json.load(f), key=lambda m: int(m.get("idx", 0)))
+    dim = None
+    for module in modules:
+        kind = module.get("type", "").rsplit(".", 1)[-1]
+        config_path = os.path.join(path, module.get("path", ""), "config.json")
+        if kind not in ("Pooling", "Dense") or not os.path.exists(config_path):
+            continue
+        with open(config_path, encoding="utf-8") as f:
+            config = json.load(f)
+        if kind == "Pooling":
+            modes = sum(bool(config.get(mode)) for mode in _POOLING_MODES)
+            dim = config["word_embedding_dimension"] * max(modes, 1)
+        else:
+            dim = config["out_features"]
+    return dim
+
+
+def model_max_seq_length(model_name: str) -> Optional[int]:
+    """Longest input, in tokens, the model embeds without truncating.
+
+    Read from `sentence_bert_config.json`; None when the model is not on
+    disk or does not set it.
+    """
+    path = _local_model_dir(model_name)
+    config_path = os.path.join(path, "sentence_bert_config.json") if path else None
+    if config_path is None or not os.path.exists(config_path):
+        return None
+    with open(config_path, encoding="utf-8") as f:
+        return json.load(f).get("max_seq_length")
+
+
+def load_tokenizer(model_name: str):
+    """The model's Hugging Face tokenizer, loaded without the model weights."""
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(_local_model_dir(model_name) or model_name)
+
+
+def token_budget_batches(
+    lengths: Sequence[int], batch_tokens: int, max_batch_size: int, bucket_ratio: float = 0.8
+) -> List[np.ndarray]:
+    """Group positions into batches of similar token length.
+
+    Positions are sorted longest first. A batch holds at most
+    `max_batch_size` texts, keeps its padded size (`len(batch) * longest`)
+    within `batch_tokens` and only takes texts at least `bucket_ratio` times
+    as long as its longest, so at most ~1 - `bucket_ratio` of it is padding.
+    Short texts share large batches and long ones get small batches.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(-lengths, kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = max(1, int(lengths[order[start]]))
+        size = max(1, min(max_batch_size, batch_tokens // longest))
+        end = start + 1
+        while end < len(order) and end - start < size and lengths[order[end]] >= longest * bucket_ratio:
+            end += 1
+        batches.append(order[start:end])
+        start = end
+    return batches
+
+
+# the model of an encode pool worker process (see `SentenceEmbedder.workers`)
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # share the cores between the workers instead of oversubscribing them
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode(model, texts: List[str], normalize: bool) -> np.ndarray:
+    return model.encode(
+        texts,
+        batch_size=len(texts),
+        show_progress_bar=False,
+        convert_to_numpy=True,
+        normalize_embeddings=normalize,
+    )
+
+
+def _encode_in_worker(texts: List[str], normalize: bool) -> np.ndarray:
+    return _encode(_worker_model, texts, normalize)
+
 
 class SentenceEmbedder(Embedder):
     """Embedder using `sentence-transformers`.
 
-    This class is pluggable and implements a simple `embed` method returning
-    lists of floats.
+    This class is pluggable and implements `embed_array`, which returns the
+    model output as a contiguous float32 array, plus the list-returning
+    `embed` kept for callers that need plain Python values.
+
+    Importing `sentence_transformers` (and torch) and loading the weights
+    take seconds, so both are deferred until the first embedding call or an
+    explicit `warm_up()`.
+
+    Args:
+        model_name: sentence-transformers model name or local path.
+        batch_tokens: padded tokens per encoder batch; texts are bucketed by
+            token length with `token_budget_batches`.
+        max_batch_size: most texts in one batch, however short.
+        bucket_ratio: shortest-to-longest token ratio allowed in a batch.
+        workers: encode in this many processes, each with its own copy of
+            the model and `cpu_count // workers` torch threads. Used for
+            calls that make at least two batches; 0 encodes in-process.
     """
 
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        logger.info("Loading embedder model: %s", model_name)
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        batch_tokens: int = 8192,
+        max_batch_size: int = 128,
+        bucket_ratio: float = 0.8,
+        workers: int = 0,
+    ):
+        self.model_name = model_name
+        self.batch_tokens = batch_tokens
+        self.max_batch_size = max_batch_size
+        self.bucket_ratio = bucket_ratio
+        self.workers = workers
+        self._model = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        """The `SentenceTransformer`, imported and loaded on first access."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    logger.info("Loading embedder model: %s", self.model_name)
+                    from sentence_transformers import SentenceTransformer
+
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        """Output dimension, from the model config when it is on disk."""
+        if not self.loaded:
+            dim = model_config_dimension(self.model_name)
+            if dim is not None:
+                return dim
+        return self.model.get_sentence_embedding_dimension()
+
+    def token_lengths(self, texts: Sequence[str]) -> List[int]:
+        """Tokens per text as the model will see them (special tokens
+        included, truncated at the model's max sequence length)."""
+        model = self.model
+        encoded = model.tokenizer(
+            list(texts), truncation=True, max_length=model.max_seq_length, verbose=False
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def batches(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """Positions of `texts` grouped into token-budgeted batches."""
+        return token_budget_batches(
+            self.token_lengths(texts), self.batch_tokens, self.max_batch_size, self.bucket_ratio
+        )
+
+    def embed_array(self, texts: Iterable[str], normalize: bool = False) -> np.ndarray:
+        """Encode `texts` in length-bucketed batches; rows keep the input order."""
+        texts = list(texts)
+        model = self.model
+        with span("embed", items=len(texts)):
+            if not texts:
+                return np.zeros((0, self.dimension), dtype=np.float32)
+            batches = self.batches(texts)
+            if self.workers > 0 and len(batches) > 1:
+                pool = self._encode_pool()
+                futures = [pool.submit(_encode_in_worker, [texts[i] for i in b], normalize) for b in batches]
+                results = [f.result() for f in futures]
+            else:
+                results = [_encode(model, [texts[i] for i in b], normalize) for b in batches]
+            out = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+            for positions, rows in zip(batches, results):
+                out[positions] = rows
+        return out
+
+    def _encode_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                logger.info("Starting %d encode processes with %d threads each", self.workers, threads)
+                # spawn: forking a process that already runs torch threads can deadlock
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, threads),
+                )
+            return self._pool
+
+    def close(self) -> None:
+        """Stop the encode processes, if any were started."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
 
     def embed(self, texts: Iterable[str]) -> List[List[float]]:
-        arr = self.model.encode(list(texts), show_progress_bar=False)
         # ensure Python lists for serialization
-        return [list(map(float, row)) for row in np.array(arr)]
+        return self.embed_array(texts).tolist()
@@ -0,0 +1,247 @@
+"""Sentence embeddings with ONNX Runtime instead of PyTorch.
+
+The configured sentence-transformers model (transformer, pooling and any
+Dense/Normalize layers) is exported once to an ONNX graph, optionally with
+dynamic int8 weight quantization, and cached on disk together with its
+tokenizer. Later processes only load that artifact: neither torch nor
+sentence-transformers is imported, which makes startup and CPU inference
+cheaper. Exporting needs torch (and `onnx` for int8); running needs
+`onnxruntime` and `tokenizers`.
+"""
+
+from typing import Dict, Iterable, List, Sequence
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import warnings
+import numpy as np
+from ..core.interfaces import Embedder
+from ..core.metrics import span
+from .embedder import model_config_dimension, token_budget_batches
+
+logger = logging.getLogger(__name__)
+
+# bump when the exported graph changes so old artifacts are not reused
+EXPORT_VERSION = 1
+_OPSET = 17
+_CONFIG = "onnx_config.json"
+
+
+def artifact_dir(model_name: str, cache_dir: str) -> str:
+    """Where the export of `model_name` is cached under `cache_dir`."""
+    source = os.path.abspath(model_name) if os.path.isdir(model_name) else model_name
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.basename(os.path.normpath(model_name)))
+    digest = hashlib.sha256(f"{EXPORT_VERSION}:{source}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{slug}-{digest}")
+
+
+def export_onnx(model_name: str, out_dir: str, quantize: bool = False) -> str:
+    """Export `model_name` to `out_dir` (model.onnx, tokenizer.json, config).
+
+    With `quantize`, `model.int8.onnx` is written next to the float model.
+    The directory is built under a temporary name and renamed into place, so
+    concurrent exports never expose a half-written artifact. Returns
+    `out_dir`.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    logger.info("Exporting %s to ONNX in %s", model_name, out_dir)
+    model = SentenceTransformer(model_name, device="cpu").eval()
+    sample = model.tokenize(["an example sentence", "another"])
+    inputs = [name for name, value in sample.items() if isinstance(value, torch.Tensor)]
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *tensors):
+            return self.inner(dict(zip(inputs, tensors)))["sentence_embedding"]
+
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".onnx-export-", dir=parent)
+    try:
+        axes = {name: {0: "batch", 1: "sequence"} for name in inputs}
+        with warnings.catch_warnings(), torch.no_grad():
+            warnings.simplefilter("ignore")
+            torch.onnx.export(
+                _Wrapper(model),
+                tuple(sample[name] for name in inputs),
+                os.path.join(tmp, "model.onnx"),
+                input_names=inputs,
+                output_names=["sentence_embedding"],
+                dynamic_axes={**axes, "sentence_embedding": {0: "batch"}},
+                opset_version=_OPSET,
+                dynamo=False,
+            )
+        if quantize:
+            _quantize(os.path.join(tmp, "model.onnx"), os.path.join(tmp, "model.int8.onnx"))
+        model.tokenizer.backend_tokenizer.save(os.path.join(tmp, "tokenizer.json"))
+        with open(os.path.join(tmp, _CONFIG), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model_name": model_name,
+                    "export_version": EXPORT_VERSION,
+                    "inputs": inputs,
+                    "dimension": model.get_sentence_embedding_dimension(),
+                    "max_seq_length": model.max_seq_length,
+                },
+                f,
+                indent=2,
+            )
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.replace(tmp, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return out_dir
+
+
+def _quantize(src: str, dst: str) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info("Quantizing %s to int8", src)
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+
+
+class OnnxEmbedder(Embedder):
+    """`Embedder` running an exported sentence-transformers model with ONNX Runtime.
+
+    Produces the same vectors as `SentenceEmbedder` for the same model (to
+    float rounding, or to ~1e-4 cosine with int8). The export is created on
+    first use when it is not cached yet; after that, loading it takes a
+    fraction of a second and imports no torch. Texts are batched by token
+    length like `SentenceEmbedder` does.
+
+    Args:
+        model_name: sentence-transformers model name or local path.
+        cache_dir: directory holding exported models (see `artifact_dir`).
+        quantize: run int8 dynamically quantized weights (smaller and faster
+            on CPU, slightly less exact); the int8 file is created from the
+            cached float export if missing.
+        batch_tokens, max_batch_size, bucket_ratio: see `token_budget_batches`.
+        threads: ONNX Runtime intra-op threads; 0 lets it use every core.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        cache_dir: str = "./onnx_models",
+        quantize: bool = False,
+        batch_tokens: int = 8192,
+        max_batch_size: int = 128,
+        bucket_ratio: float = 0.8,
+        threads: int = 0,
+    ):
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.quantize = quantize
+        self.batch_tokens = batch_tokens
+        self.max_batch_size = max_batch_size
+        self.bucket_ratio = bucket_ratio
+        self.threads = threads
+        self.path = artifact_dir(model_name, cache_dir)
+        self._session = None
+        self._tokenizer = None
+        self._pad_id = 0
+        self._config: Dict = {}
+        self._lock = threading.Lock()
+
+    @property
+    def model_file(self) -> str:
+        return os.path.join(self.path, "model.int8.onnx" if self.quantize else "model.onnx")
+
+    @property
+    def loaded(self) -> bool:
+        return self._session is not None
+
+    def _load(self) -> None:
+        if self._session is not None:
+            return
+        with self._lock:
+            if self._session is not None:
+                return
+            if not os.path.exists(os.path.join(self.path, _CONFIG)):
+                export_onnx(self.model_name, self.path, quantize=self.quantize)
+            elif not os.path.exists(self.model_file):
+                _quantize(os.path.join(self.path, "model.onnx"), self.model_file)
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            with open(os.path.join(self.path, _CONFIG), encoding="utf-8") as f:
+                self._config = json.load(f)
+            logger.info("Loading ONNX embedder: %s", self.model_file)
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.threads > 0:
+                options.intra_op_num_threads = self.threads
+            tokenizer = Tokenizer.from_file(os.path.join(self.path, "tokenizer.json"))
+            # padding is done per length bucket in `_encode_batch`
+            self._pad_id = (tokenizer.padding or {}).get("pad_id", 0)
+            tokenizer.no_padding()
+            tokenizer.enable_truncation(self._config["max_seq_length"])
+            self._tokenizer = tokenizer
+            self._session = onnxruntime.InferenceSession(
+                self.model_file, options, providers=["CPUExecutionProvider"]
+            )
+
+    @property
+    def dimension(self) -> int:
+        """Output dimension, from the export or the model config; no model is loaded."""
+        config_path = os.path.join(self.path, _CONFIG)
+        if os.path.exists(config_path):
+            with open(config_path, encoding="utf-8") as f:
+                return json.load(f)["dimension"]
+        dim = model_config_dimension(self.model_name)
+        if dim is not None:
+            return dim
+        self._load()
+        return self._config["dimension"]
+
+    def _encode_batch(self, encodings: Sequence) -> np.ndarray:
+        width = max(len(e.ids) for e in encodings)
+        feeds = {}
+        for name, field, fill in (
+            ("input_ids", "ids", self._pad_id),
+            ("attention_mask", "attention_mask", 0),
+            ("token_type_ids", "type_ids", 0),
+        ):
+            if name in self._config["inputs"]:
+                arr = np.full((len(encodings), width), fill, dtype=np.int64)
+                for row, encoding in enumerate(encodings):
+                    values = getattr(encoding, field)
+                    arr[row, : len(values)] = values
+                feeds[name] = arr
+        return self._session.run(None, feeds)[0]
+
+    def embed_array(self, texts: Iterable[str], normalize: bool = False) -> np.ndarray:
+        """Encode `texts` in length-bucketed batches; rows keep the input order."""
+        texts = list(texts)
+        self._load()
+        with span("embed", items=len(texts)):
+            out = np.zeros((len(texts), self._config["dimension"]), dtype=np.float32)
+            if not texts:
+                return out
+            encodings = self._tokenizer.encode_batch(texts)
+            batches = token_budget_batches(
+                [len(e.ids) for e in encodings], self.batch_tokens, self.max_batch_size, self.bucket_ratio
+            )
+            for positions in batches:
+                out[positions] = self._encode_batch([encodings[i] for i in positions])
+            if normalize:
+                norms = np.linalg.norm(out, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                out /= norms
+        return out
+
+    def embed(self, texts: Iterable[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
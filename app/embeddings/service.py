@@ -0,0 +1,363 @@
+"""A shared embedding service for several app processes on one host.
+
+One process holds the model (`EmbeddingServer`, started with
+`python -m app.main embed-server`) and every uvicorn worker or CLI talks to
+it over a Unix socket through `EmbeddingClient`, an ordinary `Embedder`.
+The host keeps a single copy of the model in RAM, and concurrent requests
+from all processes are merged by `MicroBatcher` into one encoder call per
+few-millisecond window, which is far cheaper than encoding each query alone.
+
+Wire format, in both directions: frames of a 4-byte big-endian length and a
+payload. A request is one JSON frame, `{"op": "embed", "texts": [...],
+"normalize": bool}` or `{"op": "info"}`. The reply is a JSON frame (`{"rows":
+n, "dim": d}`, the info, or `{"error": message}`), followed for embeddings by
+one frame of `n * d` raw float32 values in row-major order.
+"""
+
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import numpy as np
+from ..core.interfaces import Embedder
+from ..core.metrics import span
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct("!I")
+
+
+def _read_exact(sock: socket.socket, size: int) -> bytearray:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while view:
+        n = sock.recv_into(view)
+        if n == 0:
+            raise ConnectionError("embedding service connection closed")
+        view = view[n:]
+    return buf
+
+
+def read_frame(sock: socket.socket) -> bytearray:
+    (size,) = _LENGTH.unpack(_read_exact(sock, _LENGTH.size))
+    return _read_exact(sock, size)
+
+
+def write_frames(sock: socket.socket, *payloads: bytes) -> None:
+    sock.sendall(b"".join(_LENGTH.pack(len(p)) + p for p in payloads))
+
+
+class _Request:
+    __slots__ = ("texts", "normalize", "future")
+
+    def __init__(self, texts: List[str], normalize: bool):
+        self.texts = texts
+        self.normalize = normalize
+        self.future: Future = Future()
+
+
+class MicroBatcher:
+    """Merges concurrent `embed` calls into batched calls of `embedder`.
+
+    A background thread takes the first waiting request, then keeps
+    collecting for up to `max_wait` seconds or until `max_batch` texts are
+    pending, and encodes them with one `embed_array` call per `normalize`
+    flag. A request that would push the batch past `max_batch` starts the
+    next batch instead, so one larger than `max_batch` is encoded on its
+    own. When a
+    merged call fails, its requests are retried one at a time so that only
+    the offending one gets the error.
+
+    Args:
+        embedder: the in-process embedder doing the work.
+        max_batch: texts that close a batch early.
+        max_wait: seconds the first request of a batch waits for company.
+    """
+
+    def __init__(self, embedder: Embedder, max_batch: int = 64, max_wait: float = 0.005):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = 0
+        self.batches = 0
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def embed(self, texts: List[str], normalize: bool = False) -> np.ndarray:
+        request = _Request(texts, normalize)
+        self._queue.put(request)
+        return request.future.result()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        carried: Optional[_Request] = None
+        while True:
+            first = carried if carried is not None else self._queue.get()
+            carried = None
+            if first is None:
+                return
+            pending = [first]
+            size = len(first.texts)
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while size < self.max_batch:
+                try:
+                    request = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                if size + len(request.texts) > self.max_batch:
+                    carried = request
+                    break
+                pending.append(request)
+                size += len(request.texts)
+            self._encode(pending)
+            if stop:
+                return
+
+    def _encode(self, pending: List[_Request]) -> None:
+        self.requests += len(pending)
+        for normalize in (False, True):
+            group = [r for r in pending if r.normalize == normalize]
+            if not group:
+                continue
+            self.batches += 1
+            texts = [t for r in group for t in r.texts]
+            try:
+                with span("embed_service_batch", items=len(texts)):
+                    out = self.embedder.embed_array(texts, normalize=normalize)
+            except Exception as exc:
+                if len(group) == 1:
+                    group[0].future.set_exception(exc)
+                    continue
+                # one bad request must not fail the others merged with it
+                logger.warning("Embedding batch of %d requests failed; retrying them one by one", len(group))
+                for r in group:
+                    self._encode_alone(r)
+                continue
+            start = 0
+            for r in group:
+                r.future.set_result(out[start : start + len(r.texts)])
+                start += len(r.texts)
+
+    def _encode_alone(self, request: _Request) -> None:
+        try:
+            request.future.set_result(self.embedder.embed_array(request.texts, normalize=request.normalize))
+        except Exception as exc:
+            request.future.set_exception(exc)
+
+
+def _remove_stale_socket(path: str) -> None:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        # left behind by a service that died without cleaning up
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise FileExistsError(f"an embedding service is already listening on {path}")
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    block_on_close = False
+
+
+class EmbeddingServer:
+    """Serves `embedder` on the Unix socket `path` through a `MicroBatcher`.
+
+    Each client connection gets a thread and may send any number of
+    requests. A stale socket file at `path` (nothing accepts connections on
+    it) is replaced; if another server is listening there, `FileExistsError`
+    is raised. Use as a context manager or `start`/`serve_forever` and
+    `stop`.
+    """
+
+    def __init__(self, embedder: Embedder, path: str, max_batch: int = 64, max_wait: float = 0.005):
+        self.embedder = embedder
+        self.path = path
+        if os.path.exists(path):
+            _remove_stale_socket(path)
+        self.batcher = MicroBatcher(embedder, max_batch=max_batch, max_wait=max_wait)
+        self._server = _UnixServer(path, self._handler())
+        self._thread: Optional[threading.Thread] = None
+        self._connections: Set[socket.socket] = set()
+        self._lock = threading.Lock()
+
+    def start(self) -> "EmbeddingServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="embed-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        # clients see the connection drop instead of waiting on a stopped batcher
+        with self._lock:
+            for sock in self._connections:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.batcher.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __enter__(self) -> "EmbeddingServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _reply(self, request: dict) -> Tuple[dict, bytes]:
+        op = request.get("op")
+        if op == "info":
+            return {"dim": self.embedder.dimension, "model": getattr(self.embedder, "model_name", None)}, b""
+        if op == "embed":
+            texts = request.get("texts")
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("texts must be a list of strings")
+            out = self.batcher.embed(texts, bool(request.get("normalize")))
+            out = np.ascontiguousarray(out, dtype=np.float32)
+            return {"rows": out.shape[0], "dim": out.shape[1]}, out.tobytes()
+        raise ValueError(f"unknown op {op!r}")
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def setup(self) -> None:
+                with server._lock:
+                    server._connections.add(self.request)
+
+            def finish(self) -> None:
+                with server._lock:
+                    server._connections.discard(self.request)
+
+            def handle(self) -> None:
+                while True:
+                    try:
+                        request = json.loads(read_frame(self.request))
+                    except OSError:
+                        return
+                    try:
+                        header, body = server._reply(request)
+                    except Exception as exc:
+                        logger.exception("Embedding request failed")
+                        header, body = {"error": f"{type(exc).__name__}: {exc}"}, None
+                    frames = [json.dumps(header).encode("utf-8")]
+                    if body is not None and "rows" in header:
+                        frames.append(body)
+                    try:
+                        write_frames(self.request, *frames)
+                    except OSError:
+                        return
+
+        return Handler
+
+
+class EmbeddingClient(Embedder):
+    """`Embedder` that sends every call to an `EmbeddingServer`.
+
+    Each thread keeps its own connection open and reconnects once if the
+    service restarted. Connecting waits up to `connect_timeout` seconds for
+    the socket to appear, so the app may start before the service.
+    """
+
+    def __init__(self, path: str, connect_timeout: float = 30.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self._info: Optional[dict] = None
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _call(self, request: dict) -> Tuple[dict, Optional[bytearray]]:
+        payload = json.dumps(request).encode("utf-8")
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None)
+            fresh = sock is None
+            if fresh:
+                sock = self._local.sock = self._connect()
+            try:
+                write_frames(sock, payload)
+                header = json.loads(read_frame(sock))
+                body = read_frame(sock) if "rows" in header else None
+                break
+            except OSError:
+                sock.close()
+                self._local.sock = None
+                # embedding is idempotent: retry once on a connection the
+                # service may have dropped while it was idle
+                if fresh or attempt:
+                    raise
+        if "error" in header:
+            raise RuntimeError(f"embedding service: {header['error']}")
+        return header, body
+
+    @property
+    def model_name(self) -> Optional[str]:
+        return self.info()["model"]
+
+    def info(self) -> dict:
+        if self._info is None:
+            self._info = self._call({"op": "info"})[0]
+        return self._info
+
+    @property
+    def dimension(self) -> int:
+        return self.info()["dim"]
+
+    def embed_array(self, texts: Iterable[str], normalize: bool = False) -> np.ndarray:
+        texts = list(texts)
+        with span("embed", items=len(texts)):
+            if not texts:
+                return np.zeros((0, self.dimension), dtype=np.float32)
+            header, body = self._call({"op": "embed", "texts": texts, "normalize": normalize})
+            return np.frombuffer(body, dtype=np.float32).reshape(header["rows"], header["dim"])
+
+    def embed(self, texts: Iterable[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def close(self) -> None:
+        """Close this thread's connection."""
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
@@ -0,0 +1,88 @@
+"""Content-hash manifest used for incremental re-ingestion.
+
+The manifest lives next to the FAISS index (`<FAISS_INDEX_PATH>.manifest.json`)
+and records, for every ingested file, the SHA-256 of its bytes, the ids
+of the chunks it produced and a digest of each chunk's metadata. Chunk ids
+are themselves content hashes (see `pdf_loader.chunk_id`), so comparing id
+lists tells which chunks of a changed file are new and which are stale;
+comparing the digests tells which unchanged chunks moved (new page,
+`chunk_index` or offsets) and need their metadata rewritten.
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+
+
+def manifest_path(index_path: str) -> str:
+    return index_path + ".manifest.json"
+
+
+def metadata_digest(metadata: dict) -> str:
+    blob = json.dumps(metadata, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()[:16]
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+@dataclass
+class FileEntry:
+    sha256: str
+    chunks: List[str] = field(default_factory=list)
+    # metadata_digest of each chunk, parallel to `chunks`; empty in old manifests
+    metadata: List[str] = field(default_factory=list)
+
+
+class IngestManifest:
+    """Mapping of source path -> `FileEntry`, persisted as JSON."""
+
+    VERSION = 1
+
+    def __init__(self, files: Optional[Dict[str, FileEntry]] = None):
+        self.files: Dict[str, FileEntry] = files or {}
+
+    @classmethod
+    def load(cls, path: str) -> "IngestManifest":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls({src: FileEntry(**entry) for src, entry in data.get("files", {}).items()})
+
+    def save(self, path: str) -> None:
+        # write-then-rename so a crash never leaves a truncated manifest
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "files": {s: asdict(e) for s, e in self.files.items()}}, f)
+        os.replace(tmp, path)
+
+    def sha256(self, source: str) -> Optional[str]:
+        entry = self.files.get(source)
+        return entry.sha256 if entry else None
+
+    def chunk_ids(self, source: str) -> List[str]:
+        entry = self.files.get(source)
+        return list(entry.chunks) if entry else []
+
+    def metadata_digests(self, source: str) -> Dict[str, str]:
+        """Chunk id -> recorded metadata digest (empty if none were recorded)."""
+        entry = self.files.get(source)
+        if not entry or len(entry.metadata) != len(entry.chunks):
+            return {}
+        return dict(zip(entry.chunks, entry.metadata))
+
+    def record(self, source: str, sha256: str, chunk_ids: List[str], digests: Optional[List[str]] = None) -> None:
+        self.files[source] = FileEntry(sha256, list(chunk_ids), list(digests or []))
+
+    def forget(self, source: str) -> List[str]:
+        """Drop `source` (e.g. after deleting it from the index); returns its chunk ids."""
+        entry = self.files.pop(source, None)
+        return list(entry.chunks) if entry else []
@@ -1,64 +1,261 @@
-from typing import List, Dict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
 import logging
-import uuid
 from pypdf import PdfReader
 from ..core.models import Document
 from ..core.interfaces import Loader
+from ..core.metrics import span
 
 logger = logging.getLogger(__name__)
 
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    """Chunk text into roughly `chunk_size` char pieces with overlap.
+@dataclass
+class Chunk:
+    """A piece of page text and where it came from.
 
-    This is a simple, robust strategy that keeps sentence boundaries where possible.
+    `char_start` is an offset into the text of page `page_start` and
+    `char_end` an exclusive offset into the text of page `page_end`.
     """
-    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    chunks: List[str] = []
-    buffer = ""
-    for para in paragraphs:
-        if len(buffer) + len(para) + 2 <= chunk_size:
-            buffer = buffer + "\n\n" + para if buffer else para
-        else:
+
+    text: str
+    page_start: int
+    page_end: int
+    char_start: int
+    char_end: int
+
+
+class CharSizer:
+    """Measures chunks in characters."""
+
+    separator = len("\n\n")
+
+    def length(self, text: str) -> int:
+        return len(text)
+
+    def windows(self, text: str, size: int, overlap: int) -> Iterator[Tuple[int, int]]:
+        """`(start, end)` character spans of overlapping windows covering `text`."""
+        yield from _windows(len(text), size, overlap, lambda i: i, lambda i: i)
+
+
+class TokenSizer:
+    """Measures chunks in tokens of a Hugging Face (fast) tokenizer.
+
+    Chunks sized this way fit the embedding model's max sequence length, so
+    nothing is silently truncated at encode time. Special tokens are not
+    counted; leave room for them in the chunk size.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.separator = self.length("\n\n")
+
+    def _encode(self, text: str, offsets: bool = False):
+        return self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=offsets, verbose=False)
+
+    def length(self, text: str) -> int:
+        return len(self._encode(text)["input_ids"])
+
+    def windows(self, text: str, size: int, overlap: int) -> Iterator[Tuple[int, int]]:
+        """`(start, end)` character spans of windows of at most `size` tokens."""
+        spans = self._encode(text, offsets=True)["offset_mapping"]
+        if not spans:
+            yield 0, len(text)
+            return
+        yield from _windows(len(spans), size, overlap, lambda i: spans[i][0], lambda i: spans[i - 1][1])
+
+
+def _windows(n: int, size: int, overlap: int, start_of, end_of) -> Iterator[Tuple[int, int]]:
+    # stop once a window reaches the end, so no window lies inside the previous one
+    step = max(1, size - overlap)
+    start = 0
+    while True:
+        end = min(start + size, n)
+        yield start_of(start), end_of(end)
+        if end >= n:
+            return
+        start += step
+
+
+def _paragraphs(text: str) -> Iterator[Tuple[int, int]]:
+    """`(start, end)` of every non-blank paragraph, stripped of outer whitespace."""
+    pos = 0
+    for part in text.split("\n\n"):
+        stripped = part.strip()
+        if stripped:
+            start = pos + len(part) - len(part.lstrip())
+            yield start, start + len(stripped)
+        pos += len(part) + 2
+
+
+def iter_chunks(
+    pages: Iterable[Tuple[int, str]],
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    sizer=None,
+) -> Iterator[Chunk]:
+    """Chunk `(page_number, text)` pairs lazily, in one pass.
+
+    Consecutive paragraphs (split on blank lines) are grouped while they fit
+    in `chunk_size`, measured by `sizer` (`CharSizer` by default, or a
+    `TokenSizer`); a group may span pages. A paragraph longer than
+    `chunk_size` is split into windows overlapping by `overlap`. Every
+    paragraph is measured once and every chunk joined once, so time and
+    memory are linear in the input, and pages are consumed as they arrive.
+    """
+    sizer = sizer or CharSizer()
+    buffer: List[Tuple[int, int, int, str]] = []  # (page, start, end, text)
+    used = 0
+
+    def flush() -> Chunk:
+        first, last = buffer[0], buffer[-1]
+        return Chunk("\n\n".join(p[3] for p in buffer), first[0], last[0], first[1], last[2])
+
+    for page, text in pages:
+        for start, end in _paragraphs(text):
+            para = text[start:end]
+            size = sizer.length(para)
+            cost = size + sizer.separator if buffer else size
+            if used + cost <= chunk_size:
+                buffer.append((page, start, end, para))
+                used += cost
+                continue
             if buffer:
-                chunks.append(buffer)
-            # split long paragraph
-            start = 0
-            while start < len(para):
-                part = para[start : start + chunk_size]
-                chunks.append(part)
-                start += chunk_size - overlap
-            buffer = ""
+                yield flush()
+                buffer, used = [], 0
+            if size <= chunk_size:
+                buffer.append((page, start, end, para))
+                used = size
+                continue
+            for a, b in sizer.windows(para, chunk_size, overlap):
+                yield Chunk(para[a:b], page, page, start + a, start + b)
     if buffer:
-        chunks.append(buffer)
-    return chunks
+        yield flush()
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """Chunk text into roughly `chunk_size` char pieces with overlap.
+
+    A single-page `iter_chunks`; it keeps paragraph boundaries where possible.
+    """
+    return [c.text for c in iter_chunks([(1, text)], chunk_size, overlap)]
+
+
+def chunk_id(source: str, text: str, occurrence: int = 0) -> str:
+    """Deterministic chunk id: a hash of the source path and chunk text.
+
+    Re-loading an unchanged file yields the same ids, which lets incremental
+    ingestion tell new chunks from ones already in the index. `occurrence`
+    disambiguates identical chunks repeated within one file.
+    """
+    digest = hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()[:32]
+    return digest if occurrence == 0 else f"{digest}-{occurrence}"
 
 
 class PdfLoader(Loader):
-    """Loads a PDF and returns a list of chunked `Document` objects."""
+    """Loads a PDF and returns a list of chunked `Document` objects.
+
+    Args:
+        chunk_size: maximum chunk length in characters or, with `token_model`,
+            in tokens. In token mode 0 (or anything above the model's limit)
+            means the model's max sequence length minus its special tokens.
+        chunk_overlap: overlap of the windows a too-long paragraph is split into.
+        token_model: sentence-transformers model whose tokenizer sizes the
+            chunks. It is loaded on first use, so the loader stays cheap to
+            pickle into ingestion worker processes.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, token_model: Optional[str] = None):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.token_model = token_model
+        self._sizer = None
+        self._limit = chunk_size
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_sizer"] = None
+        return state
+
+    def _sizing(self):
+        """`(sizer, chunk_size)`, loading the tokenizer on first use in token mode."""
+        if self.token_model is None:
+            return None, self.chunk_size
+        if self._sizer is None:
+            from ..embeddings.embedder import load_tokenizer, model_max_seq_length
+
+            tokenizer = load_tokenizer(self.token_model)
+            limit = model_max_seq_length(self.token_model) or tokenizer.model_max_length
+            limit -= tokenizer.num_special_tokens_to_add()
+            if self.chunk_size > limit:
+                logger.warning("chunk_size %d exceeds %s's limit; using %d tokens",
+                               self.chunk_size, self.token_model, limit)
+            self._limit = min(self.chunk_size, limit) if self.chunk_size > 0 else limit
+            self._sizer = TokenSizer(tokenizer)
+        return self._sizer, self._limit
+
+    def load(self, path: str, progress: Optional[Callable[[int, int], None]] = None) -> List[Document]:
+        """Parse and chunk `path`, one page at a time.
 
-    def load(self, path: str) -> List[Document]:
+        `progress`, if given, is called as `progress(pages_parsed, pages_total)`
+        after each page is extracted. Timed as the `load_pdf` stage (items:
+        chunks).
+        """
+        with span("load_pdf") as timing:
+            docs = self.chunk(path, self.iter_pages(path, progress))
+            timing.items = len(docs)
+        return docs
+
+    def iter_pages(
+        self, path: str, progress: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[Tuple[int, str]]:
+        """Yield `(page_number, text)` as pages are extracted; unreadable pages are empty."""
         logger.info("Loading PDF: %s", path)
         reader = PdfReader(path)
-        texts = []
+        total = len(reader.pages)
         for i, page in enumerate(reader.pages):
             try:
                 txt = page.extract_text() or ""
             except Exception:
                 txt = ""
-            texts.append((i + 1, txt))
-
-        combined = "\n\n".join(f"Page {p}\n{t}" for p, t in texts if t.strip())
-        chunks = chunk_text(combined)
-        docs = []
-        for i, c in enumerate(chunks):
-            docs.append(
-                Document(
-                    id=str(uuid.uuid4()),
-                    text=c,
-                    metadata={"chunk_index": i},
-                    source=path,
-                )
+            if progress is not None:
+                progress(i + 1, total)
+            yield i + 1, txt
+
+    def extract(
+        self, path: str, progress: Optional[Callable[[int, int], None]] = None
+    ) -> List[Tuple[int, str]]:
+        """Text of every page as `(page_number, text)`; unreadable pages are empty."""
+        return list(self.iter_pages(path, progress))
+
+    def iter_documents(self, path: str, pages: Iterable[Tuple[int, str]]) -> Iterator[Document]:
+        """Chunk `pages` (from `iter_pages` or `extract`) into `Document`s for `path`.
+
+        Metadata records `chunk_index`, the pages the chunk spans
+        (`page_start`, `page_end`, and `page` = `page_start` for filters) and
+        its `char_start`/`char_end` offsets within those pages' text.
+        """
+        sizer, size = self._sizing()
+        seen: Dict[str, int] = {}
+        for i, c in enumerate(iter_chunks(pages, size, self.chunk_overlap, sizer)):
+            occurrence = seen.get(c.text, 0)
+            seen[c.text] = occurrence + 1
+            yield Document(
+                id=chunk_id(path, c.text, occurrence),
+                text=c.text,
+                metadata={
+                    "chunk_index": i,
+                    "page": c.page_start,
+                    "page_start": c.page_start,
+                    "page_end": c.page_end,
+                    "char_start": c.char_start,
+                    "char_end": c.char_end,
+                },
+                source=path,
             )
+
+    def chunk(self, path: str, pages: Iterable[Tuple[int, str]]) -> List[Document]:
+        """`iter_documents` as a list."""
+        docs = list(self.iter_documents(path, pages))
         logger.info("Created %d chunks for %s", len(docs), path)
         return docs
@@ -0,0 +1,259 @@
+"""Staged, streaming ingestion pipeline.
+
+PDF extraction and chunking run in a process pool, their results flow
+through a bounded queue into fixed-size embedding batches, and each batch is
+added to the vector store as soon as it is embedded. Peak memory is bounded
+by `queue_depth` files plus one embedding batch, independent of corpus size.
+
+With an `IngestManifest` the pipeline is incremental: files whose hash is
+unchanged are skipped before parsing, and for changed files only chunks whose
+content-hash id is new are embedded while stale ones are deleted.
+"""
+
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+import logging
+import os
+import queue
+import threading
+import time
+
+from ..core.interfaces import Embedder, Loader, VectorStore
+from ..core.models import Document
+from .manifest import IngestManifest, file_sha256, metadata_digest
+from .pdf_loader import PdfLoader
+
+logger = logging.getLogger(__name__)
+
+# Sentinel pushed onto the queue once every file has been extracted.
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Work done by one pipeline stage.
+
+    `seconds` is busy time summed over all workers of the stage, so for the
+    parallel extract stage it can exceed the wall-clock time.
+    """
+
+    name: str
+    items: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    failed: int = 0
+    skipped: int = 0
+    chunks: int = 0
+    removed: int = 0
+    wall_seconds: float = 0.0
+    stages: Dict[str, StageStats] = field(
+        default_factory=lambda: {name: StageStats(name) for name in ("extract", "embed", "add")}
+    )
+
+    def summary(self) -> str:
+        lines = [
+            f"Ingested {self.chunks} chunks from {self.files} files "
+            f"({self.skipped} unchanged, {self.failed} failed, {self.removed} stale chunks removed) "
+            f"in {self.wall_seconds:.2f}s"
+        ]
+        units = {"extract": "files", "embed": "chunks", "add": "chunks"}
+        for stage in self.stages.values():
+            lines.append(
+                f"  {stage.name:<8} {stage.items:>8} {units[stage.name]:<6} "
+                f"{stage.seconds:>8.2f}s busy  {stage.throughput:>10.1f} {units[stage.name]}/s"
+            )
+        return "\n".join(lines)
+
+
+def _extract(
+    loader: Loader, path: str, hash_files: bool, known_sha: Optional[str]
+) -> Tuple[str, Optional[str], Optional[List[Document]], float]:
+    """Worker entry point: hash, load and chunk one file, timing the work.
+
+    Returns `(path, sha256, docs, seconds)`. `docs` is `None` when loading
+    failed and an empty list when the hash matches `known_sha` (unchanged).
+    """
+    start = time.perf_counter()
+    sha = None
+    try:
+        if hash_files:
+            sha = file_sha256(path)
+        docs = [] if sha is not None and sha == known_sha else loader.load(path)
+    except Exception:
+        logger.exception("Failed to load %s", path)
+        docs = None
+    return path, sha, docs, time.perf_counter() - start
+
+
+class _InlineExecutor(Executor):
+    """Runs submitted calls synchronously; used when `workers == 0`."""
+
+    def submit(self, fn, *args, **kwargs):
+        fut: Future = Future()
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            fut.set_exception(exc)
+        return fut
+
+
+class IngestPipeline:
+    """Extract -> chunk -> embed -> add, with bounded memory.
+
+    Args:
+        embedder: computes embeddings for each batch.
+        store: receives each embedded batch via `add`.
+        loader: picklable `Loader` run inside the worker processes.
+        workers: extraction processes; `None` uses all cores, `0` runs
+            extraction inline in the calling process.
+        queue_depth: maximum number of extracted files waiting to be embedded
+            (and, separately, in flight in the pool).
+        batch_size: number of chunks per `embed_array`/`add` call.
+        manifest: enables incremental ingestion; updated in place as files
+            are processed (saving it is left to the caller).
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        store: VectorStore,
+        loader: Optional[Loader] = None,
+        workers: Optional[int] = None,
+        queue_depth: int = 8,
+        batch_size: int = 256,
+        manifest: Optional[IngestManifest] = None,
+    ):
+        self.embedder = embedder
+        self.store = store
+        self.loader = loader or PdfLoader()
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.queue_depth = max(1, queue_depth)
+        self.batch_size = max(1, batch_size)
+        self.manifest = manifest
+
+    def _make_executor(self) -> Executor:
+        if self.workers <= 0:
+            return _InlineExecutor()
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    def _produce(self, paths: Iterable[str], out: "queue.Queue", stop: threading.Event, errors: list) -> None:
+        """Submit files to the pool, keeping at most `queue_depth` in flight,
+        and forward results to `out` in input order."""
+        try:
+            with self._make_executor() as pool:
+                pending: Deque[Future] = deque()
+                for path in paths:
+                    if stop.is_set():
+                        for fut in pending:
+                            fut.cancel()
+                        return
+                    known = self.manifest.sha256(path) if self.manifest else None
+                    pending.append(pool.submit(_extract, self.loader, path, self.manifest is not None, known))
+                    if len(pending) >= self.queue_depth:
+                        out.put(pending.popleft().result())
+                while pending:
+                    out.put(pending.popleft().result())
+        except BaseException as exc:  # surface in the consumer thread
+            errors.append(exc)
+        finally:
+            out.put(_DONE)
+
+    def _flush(self, batch: List[Document], stats: IngestStats) -> None:
+        embed_stats, add_stats = stats.stages["embed"], stats.stages["add"]
+
+        start = time.perf_counter()
+        embeddings = self.embedder.embed_array([d.text for d in batch], normalize=True)
+        embed_stats.seconds += time.perf_counter() - start
+        embed_stats.items += len(batch)
+
+        start = time.perf_counter()
+        self.store.add(batch, embeddings, normalized=True)
+        add_stats.seconds += time.perf_counter() - start
+        add_stats.items += len(batch)
+        stats.chunks += len(batch)
+
+    def _reconcile(self, path: str, sha: str, docs: List[Document], stats: IngestStats) -> Optional[List[Document]]:
+        """Diff a file's chunks against the manifest.
+
+        Deletes stale chunks from the store, records the new chunk list and
+        returns the chunks that still need embedding, or `None` when the
+        file is unchanged. Besides new chunks these are the unchanged ones
+        whose metadata moved (e.g. a page was inserted before them); they are
+        tombstoned here and re-added, so their page and offsets stay correct.
+        """
+        if sha == self.manifest.sha256(path):
+            stats.skipped += 1
+            return None
+        old_ids = set(self.manifest.chunk_ids(path))
+        old_digests = self.manifest.metadata_digests(path)
+        new_ids = [d.id for d in docs]
+        digests = [metadata_digest(d.metadata) for d in docs]
+        stale = old_ids.difference(new_ids)
+        if stale:
+            stats.removed += self.store.delete(stale)
+        moved = {d.id for d, digest in zip(docs, digests) if d.id in old_ids and old_digests.get(d.id) != digest}
+        if moved:
+            self.store.delete(moved)
+        self.manifest.record(path, sha, new_ids, digests)
+        return [d for d in docs if d.id not in old_ids or d.id in moved]
+
+    def run(self, paths: Iterable[str]) -> IngestStats:
+        stats = IngestStats()
+        results: "queue.Queue" = queue.Queue(maxsize=self.queue_depth)
+        errors: list = []
+        stop = threading.Event()
+        started = time.perf_counter()
+
+        producer = threading.Thread(
+            target=self._produce, args=(paths, results, stop, errors), name="ingest-extract", daemon=True
+        )
+        producer.start()
+
+        batch: List[Document] = []
+        extract_stats = stats.stages["extract"]
+        drained = False
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    drained = True
+                    break
+                path, sha, docs, elapsed = item
+                extract_stats.seconds += elapsed
+                if docs is None:
+                    stats.failed += 1
+                    continue
+                extract_stats.items += 1
+                if self.manifest is not None:
+                    docs = self._reconcile(path, sha, docs, stats)
+                    if docs is None:
+                        continue
+                stats.files += 1
+                batch.extend(docs)
+                while len(batch) >= self.batch_size:
+                    self._flush(batch[: self.batch_size], stats)
+                    del batch[: self.batch_size]
+            if batch:
+                self._flush(batch, stats)
+        except BaseException:
+            # unblock the producer so the pool shuts down before re-raising
+            stop.set()
+            while not drained:
+                drained = results.get() is _DONE
+            raise
+        finally:
+            producer.join()
+        if errors:
+            raise errors[0]
+        stats.wall_seconds = time.perf_counter() - started
+        return stats
@@ -1,6 +1,44 @@
-from typing import Optional
-import openai
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+import asyncio
+import json
+import re
+import threading
+import time
 from ..core.interfaces import LLMClient
+from ..core.metrics import METRICS, span
+from .resilience import (
+    AsyncSingleFlight,
+    RateLimiter,
+    RetryPolicy,
+    SingleFlight,
+    ahedge,
+    hedge,
+    is_retryable,
+    status_code,
+)
+
+LLM_TOKENS = METRICS.counter("rag_llm_tokens_total", "Tokens billed by the LLM API.", ("kind",))
+LLM_RETRIES = METRICS.counter("rag_llm_retries_total", "LLM calls retried, by status or error.", ("reason",))
+LLM_COALESCED = METRICS.counter("rag_llm_coalesced_total", "LLM calls served by an identical in-flight call.")
+LLM_HEDGES = METRICS.counter("rag_llm_hedges_total", "Hedged LLM calls, by which call won.", ("winner",))
+LLM_THROTTLED = METRICS.histogram("rag_llm_throttle_seconds", "Time LLM calls waited for the client-side rate limit.")
+
+
+def _record_usage(resp) -> None:
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if n:
+            LLM_TOKENS.inc(n, kind=kind.split("_")[0])
+
+
+def _content(resp) -> str:
+    _record_usage(resp)
+    # response shape is the same in both SDKs: choices[0].message.content
+    return (getattr(resp.choices[0].message, "content", "") or "").strip()
 
 
 class OpenAILLM(LLMClient):
@@ -9,12 +47,56 @@ class OpenAILLM(LLMClient):
     The old SDK exposes `openai.ChatCompletion.create(...)`. The new 1.x SDK
     exposes a client class `openai.OpenAI()` with `client.chat.completions.create(...)`.
     This wrapper detects the available interface and calls the correct method.
+    With the 1.x SDK, `agenerate` uses `openai.AsyncOpenAI()` so the web
+    server's event loop is never blocked on a completion.
+
+    Under load:
+    - the 1.x clients share keep-alive connection pools of `max_connections`
+      with a per-request `timeout`; `base_url` points them at any
+      OpenAI-compatible server.
+    - every call first takes a request and its estimated tokens (prompt
+      characters / 4 plus `max_tokens`) from a `RateLimiter`
+      (`requests_per_minute`, `tokens_per_minute`; 0 = unlimited).
+    - 429s, timeouts, connection errors and 5xx are retried up to
+      `max_retries` times with jittered backoff; a 429's `Retry-After` also
+      pauses the rate limiter for every other caller.
+    - with `coalesce`, concurrent identical requests share one call.
+    - with `hedge_after > 0`, a completion still running after that many
+      seconds is raced against a second identical request.
+
+    Completions are timed as the `llm` stage and their token usage is
+    counted in `rag_llm_tokens_total`.
     """
 
-    def __init__(self, api_key: Optional[str]):
+    def __init__(
+        self,
+        api_key: Optional[str],
+        model: str = "gpt-3.5-turbo",
+        base_url: Optional[str] = None,
+        timeout: float = 30.0,
+        max_connections: int = 20,
+        max_retries: int = 3,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        hedge_after: float = 0.0,
+        coalesce: bool = True,
+    ):
         if not api_key:
             raise ValueError("OPENAI_API_KEY not provided")
+        # imported here: the SDK adds most of a second to every startup
+        import openai
 
+        self.model = model
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.retry = RetryPolicy(max_retries=max_retries)
+        self.hedge_after = hedge_after
+        self.coalesce = coalesce
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
         # Set API key in module for both interfaces to pick up
         try:
             openai.api_key = api_key
@@ -24,40 +106,262 @@ class OpenAILLM(LLMClient):
 
         # Prefer the new 1.x client if available
         self._use_new_client = hasattr(openai, "OpenAI")
+        self._async_client = None
+        self._async_loop = None
+        self._async_closer = None
+        self._client_args = {}
         if self._use_new_client:
-            # instantiate the new-style client (it will read the api_key set above)
-            self._client = openai.OpenAI()
+            import httpx
+
+            # retries are ours, so the SDK's own are disabled
+            self._client_args = {"api_key": api_key, "base_url": base_url, "timeout": timeout, "max_retries": 0}
+            self._client = openai.OpenAI(http_client=httpx.Client(limits=self._limits(), timeout=timeout),
+                                         **self._client_args)
         else:
             # fallback to the legacy module-level API
             self._client = openai
 
+    def _limits(self):
+        import httpx
+
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections, keepalive_expiry=60.0)
+
+    async def _aclient(self):
+        """The async client for the running loop (connections cannot move between loops)."""
+        import openai
+
+        if not hasattr(openai, "AsyncOpenAI") or not self._use_new_client:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            import httpx
+
+            self._drop_async_client()
+            http_client = httpx.AsyncClient(limits=self._limits(), timeout=self.timeout)
+            self._async_client = openai.AsyncOpenAI(http_client=http_client, **self._client_args)
+            self._async_loop = loop
+            # asyncio.run() finalizes live async generators before it closes
+            # the loop, so this one closes the client while the loop still runs
+            self._async_closer = self._close_with_loop(self._async_client)
+            await self._async_closer.asend(None)
+        return self._async_client
+
+    @staticmethod
+    async def _close_with_loop(client):
+        try:
+            yield
+        finally:
+            await client.close()
+
+    def _drop_async_client(self) -> None:
+        """Close the async client on its own loop, unless that loop already did."""
+        closer, loop = self._async_closer, self._async_loop
+        self._async_client = self._async_loop = self._async_closer = None
+        if closer is None or loop.is_closed():
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(closer.aclose(), loop)
+        else:
+            loop.run_until_complete(closer.aclose())
+
+    def _request(self, prompt: str, kwargs: dict) -> dict:
+        return {
+            "model": kwargs.get("model", self.model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get("temperature", 0.0),
+            "max_tokens": kwargs.get("max_tokens", 512),
+        }
+
+    @staticmethod
+    def _cost(request: dict) -> int:
+        """Tokens a request counts against the tokens-per-minute limit (estimated)."""
+        chars = sum(len(m["content"]) for m in request["messages"])
+        return chars // 4 + request["max_tokens"]
+
+    def _create(self):
+        if self._use_new_client:
+            return self._client.chat.completions.create
+        return self._client.ChatCompletion.create
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        """Seconds to wait before retrying after `exc`; re-raises it when final."""
+        if attempt >= self.retry.max_retries or not is_retryable(exc):
+            raise exc
+        delay = self.retry.delay(attempt, exc)
+        status = status_code(exc)
+        if status == 429:
+            self.limiter.pause(delay)
+        LLM_RETRIES.inc(reason=str(status or type(exc).__name__))
+        return delay
+
+    def _retry(self, request: dict, call: Callable[[], object]):
+        for attempt in range(self.retry.max_retries + 1):
+            waited = self.limiter.acquire(self._cost(request))
+            if waited:
+                LLM_THROTTLED.observe(waited)
+            try:
+                return call()
+            except Exception as exc:
+                time.sleep(self._backoff(attempt, exc))
+
+    async def _aretry(self, request: dict, call: Callable[[], object]):
+        for attempt in range(self.retry.max_retries + 1):
+            waited = await self.limiter.aacquire(self._cost(request))
+            if waited:
+                LLM_THROTTLED.observe(waited)
+            try:
+                return await call()
+            except Exception as exc:
+                await asyncio.sleep(self._backoff(attempt, exc))
+
+    def _complete(self, request: dict) -> str:
+        return self._retry(request, lambda: _content(self._create()(**request)))
+
+    async def _acomplete(self, request: dict) -> str:
+        client = await self._aclient()
+        if client is None:
+            # legacy SDK has no async client; fall back to a worker thread
+            return await asyncio.to_thread(self._complete, request)
+        return await self._aretry(request, lambda: self._acreate(client, request))
+
+    @staticmethod
+    async def _acreate(client, request: dict) -> str:
+        return _content(await client.chat.completions.create(**request))
+
+    def _hedged(self, request: dict) -> str:
+        if self.hedge_after <= 0:
+            return self._complete(request)
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(self.max_connections, thread_name_prefix="llm-hedge")
+        text, hedged = hedge(lambda: self._complete(request), self.hedge_after, self._hedge_pool)
+        LLM_HEDGES.inc(winner="hedge" if hedged else "first")
+        return text
+
+    async def _ahedged(self, request: dict) -> str:
+        if self.hedge_after <= 0:
+            return await self._acomplete(request)
+        text, hedged = await ahedge(lambda: self._acomplete(request), self.hedge_after)
+        LLM_HEDGES.inc(winner="hedge" if hedged else "first")
+        return text
+
+    @staticmethod
+    def _key(request: dict) -> str:
+        return json.dumps(request, sort_keys=True)
+
     def generate(self, prompt: str, **kwargs) -> str:
-        model = kwargs.get("model", "gpt-3.5-turbo")
-        temperature = kwargs.get("temperature", 0.0)
-        max_tokens = kwargs.get("max_tokens", 512)
+        request = self._request(prompt, kwargs)
+        with span("llm"):
+            if not self.coalesce:
+                return self._hedged(request)
+            text, shared = self._flight.do(self._key(request), lambda: self._hedged(request))
+        if shared:
+            LLM_COALESCED.inc()
+        return text
 
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        request = self._request(prompt, kwargs)
+        with span("llm"):
+            if not self.coalesce:
+                return await self._ahedged(request)
+            text, shared = await self._aflight.do(self._key(request), lambda: self._ahedged(request))
+        if shared:
+            LLM_COALESCED.inc()
+        return text
+
+    @staticmethod
+    def _delta(chunk) -> str:
+        if not chunk.choices:
+            return ""
+        delta = chunk.choices[0].delta
+        # 1.x returns objects, the legacy SDK returns dict-like deltas
+        content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+        return content or ""
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Rate limited, and retried until the stream starts; never coalesced or hedged."""
+        request = self._request(prompt, kwargs)
+        for chunk in self._retry(request, lambda: self._create()(stream=True, **request)):
+            text = self._delta(chunk)
+            if text:
+                yield text
+
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        client = await self._aclient()
+        if client is None:
+            async for text in super().astream(prompt, **kwargs):
+                yield text
+            return
+        request = self._request(prompt, kwargs)
+        resp = await self._aretry(request, lambda: client.chat.completions.create(stream=True, **request))
+        async for chunk in resp:
+            text = self._delta(chunk)
+            if text:
+                yield text
+
+    def close(self) -> None:
+        """Close the pooled connections and the hedging threads."""
+        self._drop_async_client()
         if self._use_new_client:
-            # new 1.x style: client.chat.completions.create(...)
-            resp = self._client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            # response shape mirrors previous SDK: choices[0].message.content
-            return getattr(resp.choices[0].message, "content", "").strip()
-        else:
-            # legacy API
-            resp = self._client.ChatCompletion.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            return resp.choices[0].message.content.strip()
+            self._client.close()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+
+    async def aclose(self) -> None:
+        """`close`, waiting for the async client of the running loop to close."""
+        if self._async_loop is asyncio.get_running_loop():
+            closer = self._async_closer
+            self._async_client = self._async_loop = self._async_closer = None
+            await closer.aclose()
+        self.close()
 
 
 class DummyLLM(LLMClient):
-    def generate(self, prompt: str, **kwargs) -> str:
+    """Offline LLM that echoes the prompt.
+
+    `latency` seconds pass before the reply (or its first token), mimicking a
+    model's time to first token; `stream`/`astream` then yield the reply word
+    by word, sleeping `token_delay` seconds between words. Benchmarks use
+    both to measure the pipeline around a realistic LLM.
+    """
+
+    def __init__(self, token_delay: float = 0.0, latency: float = 0.0):
+        self.token_delay = token_delay
+        self.latency = latency
+
+    def _reply(self, prompt: str) -> str:
         # Very small, safe fallback for offline usage.
         return """I am running in offline/dummy mode. Here is the context provided:\n""" + prompt
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        with span("llm"):
+            if self.latency:
+                time.sleep(self.latency)
+            return self._reply(prompt)
+
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        with span("llm"):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self._reply(prompt)
+
+    def _tokens(self, prompt: str) -> List[str]:
+        # keep the separators so the joined stream equals `generate`
+        return re.findall(r"\S+\s*|\s+", self._reply(prompt))
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        for token in self._tokens(prompt):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield token
+
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for token in self._tokens(prompt):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield token
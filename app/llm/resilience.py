@@ -0,0 +1,281 @@
+"""Building blocks for calling a rate-limited remote API under load.
+
+- `RateLimiter`: token buckets for requests and tokens per minute, so bursts
+  are smoothed on our side instead of being answered with 429s.
+- `RetryPolicy`: exponential backoff with full jitter that honours
+  `Retry-After`.
+- `SingleFlight` / `AsyncSingleFlight`: concurrent calls with the same key
+  share one in-flight call.
+- `hedge` / `ahedge`: start a second, identical call when the first is
+  slower than a threshold and return whichever finishes first.
+
+`OpenAILLM` combines them; they know nothing about OpenAI themselves.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Executor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures import wait
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+import asyncio
+import contextvars
+import random
+import threading
+import time
+
+T = TypeVar("T")
+
+# status codes worth retrying: timeouts, rate limits (and server errors, >= 500)
+RETRYABLE_STATUS = (408, 429)
+_RETRYABLE_NAMES = ("APIConnectionError", "APITimeoutError", "Timeout", "RateLimitError", "ServiceUnavailableError")
+
+
+class TokenBucket:
+    """Refills at `rate` per second up to `capacity`.
+
+    `reserve` always succeeds and returns how long the caller has to wait
+    before its reservation is covered; the balance may go negative, so
+    waiting callers are served in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Make the next reservation wait at least `seconds` (e.g. after a 429)."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class RateLimiter:
+    """Client-side requests-per-minute and tokens-per-minute limits.
+
+    Either limit may be 0 (unlimited). Bursts of up to `burst_seconds` worth
+    of the per-minute allowance pass without waiting.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, burst_seconds: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.buckets = []
+        self.requests = self.tokens = None
+        if requests_per_minute > 0:
+            rate = requests_per_minute / 60.0
+            self.requests = TokenBucket(rate, max(1.0, rate * burst_seconds), clock)
+            self.buckets.append(self.requests)
+        if tokens_per_minute > 0:
+            rate = tokens_per_minute / 60.0
+            self.tokens = TokenBucket(rate, max(1.0, rate * burst_seconds), clock)
+            self.buckets.append(self.tokens)
+
+    def delay(self, tokens: int) -> float:
+        """Reserve one request and `tokens`; returns the seconds to wait."""
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.reserve(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.reserve(tokens))
+        return max(waits)
+
+    def acquire(self, tokens: int) -> float:
+        wait_for = self.delay(tokens)
+        if wait_for:
+            time.sleep(wait_for)
+        return wait_for
+
+    async def aacquire(self, tokens: int) -> float:
+        wait_for = self.delay(tokens)
+        if wait_for:
+            await asyncio.sleep(wait_for)
+        return wait_for
+
+    def pause(self, seconds: float) -> None:
+        for bucket in self.buckets:
+            bucket.pause(seconds)
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds from the `Retry-After` (or `retry-after-ms`) header of a failed response."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(exc, (ConnectionError, TimeoutError)) or type(exc).__name__ in _RETRYABLE_NAMES
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt `n` sleeps a uniform
+    random time up to `min(max_delay, base_delay * 2**n)`, or the server's
+    `Retry-After` if that is longer."""
+
+    max_retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+
+    def delay(self, attempt: int, exc: Optional[BaseException] = None) -> float:
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = retry_after(exc) if exc is not None else None
+        return max(backoff, min(hint, self.max_delay)) if hint is not None else backoff
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Thread-safe call coalescing: while a call for `key` is running, other
+    callers with the same key wait for its result instead of calling `fn`."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """Returns `(result, shared)`; `shared` is True for followers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+
+_LEADER_CANCELLED = object()
+
+
+class AsyncSingleFlight:
+    """`SingleFlight` for coroutines running on an event loop."""
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Returns `(result, shared)` like `SingleFlight.do`. If the leader is
+        cancelled (its client went away), its followers are not: the first
+        of them to wake up calls `fn` again as the new leader."""
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        future = self._calls.get(slot)
+        while future is not None:
+            # shielded: a follower giving up must not cancel the shared call
+            value = await asyncio.shield(future)
+            if value is not _LEADER_CANCELLED:
+                return value, True
+            future = self._calls.get(slot)
+        future = self._calls[slot] = loop.create_future()
+        try:
+            value = await fn()
+        except asyncio.CancelledError:
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody else waits
+            raise
+        else:
+            future.set_result(value)
+            return value, False
+        finally:
+            del self._calls[slot]
+
+
+def hedge(fn: Callable[[], T], after: float, executor: Executor) -> Tuple[T, bool]:
+    """Run `fn` on `executor`; if it has not finished after `after` seconds,
+    run it again and return the first success as `(result, hedged_won)`.
+
+    The losing call is not interrupted (threads cannot be), only ignored.
+    Each call runs in its own copy of the caller's context.
+    """
+    first = executor.submit(contextvars.copy_context().run, fn)
+    try:
+        return first.result(timeout=after), False
+    except FutureTimeout:
+        pass
+    second = executor.submit(contextvars.copy_context().run, fn)
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result(), future is second
+            error = future.exception()
+    raise error
+
+
+async def ahedge(fn: Callable[[], Awaitable[T]], after: float) -> Tuple[T, bool]:
+    """Async `hedge`; the losing call is cancelled."""
+    first = asyncio.ensure_future(fn())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=after)
+        if not done:
+            tasks.add(asyncio.ensure_future(fn()))
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    # e.g. the call cancelled itself; the other one may still succeed
+                    continue
+                if task.exception() is None:
+                    return task.result(), task is not first
+                error = task.exception()
+        raise error if error is not None else asyncio.CancelledError()
+    finally:
+        for task in tasks:
+            task.cancel()
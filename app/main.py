@@ -1,10 +1,13 @@
 """CLI entrypoint for the RAG application.
 
 This module wires together the major components (config, embedder, vector
-store, retriever, LLM and agent) and exposes two CLI commands:
+store, retriever, LLM and agent) and exposes three CLI commands:
 
 - `ingest`: Load PDF files, chunk, embed, and persist a FAISS index.
+- `delete`: Remove PDFs or chunks from the persisted index.
 - `chat`: Start an interactive CLI chat that queries the agent.
+- `embed-server`: Serve the embedding model to every app process on the
+  host over a Unix socket (see `EMBEDDING_SERVICE_SOCKET`).
 
 The functions in this file are intentionally thin: they compose higher-level
 components from pluggable implementations in `app.*` packages. Keeping this
@@ -13,64 +16,228 @@ module focused on orchestration follows the Single Responsibility Principle.
 
 import argparse
 import logging
+import threading
 from typing import Tuple
 
 from .config.config import get_settings
 from .ingestion.pdf_loader import PdfLoader
+from .ingestion.manifest import IngestManifest, manifest_path
+from .ingestion.pipeline import IngestPipeline
 from .embeddings.embedder import SentenceEmbedder
-from .retrieval.faiss_store import FaissVectorStore
+from .embeddings.onnx_embedder import OnnxEmbedder
+from .embeddings.service import EmbeddingClient, EmbeddingServer
+from .embeddings.cache import CachedEmbedder
+from .retrieval.faiss_store import FaissVectorStore, IndexParams, persisted_dim
+from .retrieval.sharded_store import ShardedVectorStore
 from .retrieval.retriever import SemanticRetriever
 from .llm.llm_client import OpenAILLM, DummyLLM
 from .agent.agent import RagAgent
+from .agent.context import ContextBuilder
+from .core.cache import SemanticCache
 
 
 logging.basicConfig(level=logging.INFO)
 
 
-def build_components() -> Tuple:
+def make_store(settings, dim: int, sharded: bool = True):
+    """Create an empty FAISS store using the index settings from `.env`.
+
+    With `FAISS_SHARDS > 1` (and `sharded`) this is a `ShardedVectorStore`
+    of that many shards.
+    """
+    params = IndexParams(
+        index_type=settings.faiss_index_type,
+        nlist=settings.faiss_nlist,
+        pq_m=settings.faiss_pq_m,
+        pq_nbits=settings.faiss_pq_nbits,
+        hnsw_m=settings.faiss_hnsw_m,
+        nprobe=settings.faiss_nprobe,
+        ef_search=settings.faiss_ef_search,
+        train_size=settings.faiss_train_size,
+        filter_exact_max=settings.faiss_filter_exact_max,
+        storage=settings.faiss_storage,
+        rerank_factor=settings.faiss_rerank_factor,
+        compact_ratio=settings.faiss_compact_ratio,
+    )
+    if sharded and settings.faiss_shards > 1:
+        return ShardedVectorStore(
+            dim,
+            params,
+            shards=settings.faiss_shards,
+            shard_by=settings.faiss_shard_by,
+            workers=settings.faiss_shard_workers,
+        )
+    return FaissVectorStore(dim, params)
+
+
+def make_retriever(settings, embedder, store) -> SemanticRetriever:
+    """Create a retriever with the configured exact query cache."""
+    return SemanticRetriever(
+        embedder, store, cache_size=settings.query_cache_size, cache_ttl=settings.query_cache_ttl
+    )
+
+
+def make_agent(settings, retriever, llm) -> RagAgent:
+    """Create an agent with the configured semantic answer cache and
+    token-budgeted context packing."""
+    answer_cache = None
+    if settings.answer_cache_size > 0:
+        answer_cache = SemanticCache(
+            settings.answer_cache_size,
+            settings.answer_cache_ttl,
+            max_distance=settings.answer_cache_max_distance,
+            name="answer",
+        )
+    return RagAgent(
+        retriever,
+        llm,
+        top_k=settings.top_k,
+        similarity_threshold=settings.similarity_threshold,
+        answer_cache=answer_cache,
+        context_builder=make_context_builder(settings),
+    )
+
+
+def make_context_builder(settings) -> ContextBuilder:
+    """Create the prompt context packer for the configured model's budget."""
+    return ContextBuilder(
+        budget=settings.context_token_budget,
+        model=settings.openai_model,
+        mmr_lambda=settings.context_mmr_lambda,
+        duplicate_threshold=settings.context_dedup_threshold,
+    )
+
+
+def make_loader(settings) -> PdfLoader:
+    """Create the PDF loader with the configured chunk sizing."""
+    return PdfLoader(
+        chunk_size=settings.chunk_size,
+        chunk_overlap=settings.chunk_overlap,
+        token_model=settings.embedding_model if settings.chunk_by_tokens else None,
+    )
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def make_embedder(settings, workers: int = 0, use_service: bool = True):
+    """Create the embedding provider, wrapped in the persistent cache.
+
+    Cheap: the model is imported and loaded on first use (or `warm_up()`).
+    `EMBEDDING_BACKEND` picks sentence-transformers on torch or ONNX Runtime
+    (exporting the model on first use). `workers` > 0 adds a multi-process
+    encode pool to the torch backend, started on first use.
+
+    When `EMBEDDING_SERVICE_SOCKET` is set (and `use_service`), this returns
+    a client of the shared embedding service instead; the service process
+    holds the model and the cache.
+    """
+    if use_service and settings.embedding_service_socket:
+        return EmbeddingClient(settings.embedding_service_socket)
+    backend = settings.embedding_backend
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"unknown EMBEDDING_BACKEND {backend!r}; expected one of {EMBEDDING_BACKENDS}")
+    if backend == "torch":
+        embedder = SentenceEmbedder(
+            settings.embedding_model,
+            batch_tokens=settings.embed_batch_tokens,
+            max_batch_size=settings.embed_max_batch,
+            workers=workers,
+        )
+    else:
+        embedder = OnnxEmbedder(
+            settings.embedding_model,
+            cache_dir=settings.onnx_cache_dir,
+            quantize=backend == "onnx-int8",
+            batch_tokens=settings.embed_batch_tokens,
+            max_batch_size=settings.embed_max_batch,
+        )
+    if settings.embedding_cache_path:
+        # repeated texts are never re-encoded; int8 vectors differ slightly,
+        # so they are cached apart from the float ones
+        embedder = CachedEmbedder(
+            embedder,
+            settings.embedding_cache_path,
+            model_name=settings.embedding_model + ("#int8" if backend == "onnx-int8" else ""),
+            memory_items=settings.embedding_cache_memory_items,
+            max_disk_items=settings.embedding_cache_max_items,
+        )
+    return embedder
+
+
+def make_llm(settings):
+    """Prefer OpenAI when an API key is configured; otherwise fall back to the
+    `DummyLLM` implementation so the app remains runnable offline."""
+    if settings.openai_api_key:
+        try:
+            return OpenAILLM(
+                settings.openai_api_key,
+                model=settings.openai_model,
+                base_url=settings.openai_base_url,
+                timeout=settings.openai_timeout,
+                max_connections=settings.openai_max_connections,
+                max_retries=settings.openai_max_retries,
+                requests_per_minute=settings.openai_requests_per_minute,
+                tokens_per_minute=settings.openai_tokens_per_minute,
+                hedge_after=settings.openai_hedge_after,
+                coalesce=settings.openai_coalesce,
+            )
+        except Exception:
+            # If LLM init fails, continue with dummy (safe fallback).
+            return DummyLLM()
+    return DummyLLM()
+
+
+def store_dimension(settings, embedder, rebuild: bool = False) -> int:
+    """Dimension for the FAISS store: the embedder's, checked against the
+    persisted index unless it is about to be rebuilt.
+
+    Raises `ValueError` when the persisted index was built with vectors of
+    another size (e.g. `EMBEDDING_MODEL` changed since it was ingested).
+    """
+    dim = embedder.dimension
+    persisted = None if rebuild else persisted_dim(settings.faiss_index_path)
+    if persisted is not None and persisted != dim:
+        raise ValueError(
+            f"the index at {settings.faiss_index_path} holds {persisted}-dimensional vectors but "
+            f"{settings.embedding_model} produces {dim}-dimensional ones; re-ingest with "
+            "`ingest --rebuild` or point FAISS_INDEX_PATH at another index"
+        )
+    return dim
+
+
+def build_components(ingest: bool = False, rebuild: bool = False) -> Tuple:
     """Create and return the core application components.
 
     Returns a tuple: (settings, embedder, store, retriever, llm, agent).
+    With `ingest`, the embedder gets the `EMBED_WORKERS` encode processes;
+    with `rebuild`, the persisted index is about to be replaced and its
+    dimension is not checked.
 
     Design notes:
-    - The embedder is created from the configured model name.
-    - A small sample embedding is computed to derive dimensionality for FAISS.
+    - The embedder is created from the configured model name but not loaded;
+      the model is imported and loaded on the first embedding call.
+    - The FAISS dimension comes from the model's config files, so startup
+      runs no forward pass; see `store_dimension`.
     - If an OpenAI API key is not supplied, a `DummyLLM` is used so the app
       remains runnable offline for testing.
     """
     settings = get_settings()
 
-    # Create an embedding provider (pluggable implementation)
-    embedder = SentenceEmbedder(settings.embedding_model)
-
-    # Determine the embedding dimensionality by encoding a short sample.
-    # This keeps the FAISS store generic and avoids exposing internal model
-    # details to the rest of the system.
-    sample_embedding = embedder.embed(["hello"])[0]
-    dim = len(sample_embedding)
+    # Create an embedding provider (pluggable implementation).
+    embedder = make_embedder(settings, workers=settings.embed_workers if ingest else 0)
 
-    # Create a FAISS-backed vector store using the deduced dimension.
-    store = FaissVectorStore(dim)
+    # Create a FAISS-backed vector store with the configured index type.
+    store = make_store(settings, store_dimension(settings, embedder, rebuild))
 
     # Retriever composes embedder + store and exposes a `retrieve` method.
-    retriever = SemanticRetriever(embedder, store)
+    retriever = make_retriever(settings, embedder, store)
 
-    # LLM selection: prefer OpenAI when an API key is configured; otherwise
-    # fall back to the `DummyLLM` implementation for local testing.
-    if settings.openai_api_key:
-        try:
-            llm = OpenAILLM(settings.openai_api_key)
-        except Exception:
-            # If LLM init fails, continue with dummy (safe fallback).
-            llm = DummyLLM()
-    else:
-        llm = DummyLLM()
+    llm = make_llm(settings)
 
     # The agent coordinates retrieval and LLM generation and exposes
     # the high-level `answer` method used by the CLI and web server.
-    agent = RagAgent(
-        retriever, llm, top_k=settings.top_k, similarity_threshold=settings.similarity_threshold
-    )
+    agent = make_agent(settings, retriever, llm)
 
     return settings, embedder, store, retriever, llm, agent
 
@@ -79,34 +246,80 @@ def cmd_ingest(args: argparse.Namespace) -> None:
     """CLI handler: ingest PDF files into the FAISS vector store.
 
     Steps:
-    1. Build components (embedder + store)
-    2. Load and chunk PDFs
-    3. Compute embeddings for chunks
-    4. Add chunks to the vector store and persist to disk
+    1. Build components (embedder + store) and load the persisted index and
+       its manifest, so re-runs add to the existing corpus
+    2. Stream the PDFs through the ingestion pipeline: extraction and
+       chunking run in a process pool, unchanged files are skipped, and only
+       new chunks are embedded in fixed-size batches and added incrementally
+    3. Persist the store and manifest to disk and print per-stage throughput
+    """
+    settings, embedder, store, retriever, llm, agent = build_components(ingest=True, rebuild=args.rebuild)
+    try:
+        index_path = settings.faiss_index_path
+        manifest = IngestManifest()
+        if not args.rebuild:
+            store.load(index_path)
+            # a manifest without its index would make us skip every file
+            if len(store.docs):
+                manifest = IngestManifest.load(manifest_path(index_path))
+
+        # CLI flags override the `.env` settings for a single run.
+        pipeline = IngestPipeline(
+            embedder,
+            store,
+            loader=make_loader(settings),
+            workers=args.workers if args.workers is not None else settings.ingest_workers,
+            queue_depth=args.queue_depth or settings.ingest_queue_depth,
+            batch_size=args.batch_size or settings.embed_batch_size,
+            manifest=manifest,
+        )
+        stats = pipeline.run(args.paths)
+
+        # Persist (index + metadata) before the manifest so the manifest never
+        # describes chunks the index does not hold. Persist path is configurable
+        # via `FAISS_INDEX_PATH` in `.env`.
+        store.persist(index_path)
+        manifest.save(manifest_path(index_path))
+
+        print(stats.summary())
+        if isinstance(embedder, CachedEmbedder):
+            print(f"Embedding cache: {embedder.stats()}")
+        print(f"Ingested {stats.chunks} new chunks ({store.live_count()} total); persisted to {index_path}")
+        rerank = " + full-precision copy on disk for re-ranking" if store.full is not None else ""
+        print(f"Index: {store.index_type}/{store.storage}, ~{store.bytes_per_vector()} bytes per vector{rerank}")
+        if isinstance(store, ShardedVectorStore):
+            print(f"Shards ({store.shard_by}): {store.shard_sizes()} chunks")
+    finally:
+        # stops the encode processes started for EMBED_WORKERS
+        if hasattr(embedder, "close"):
+            embedder.close()
+
+
+def cmd_delete(args: argparse.Namespace) -> None:
+    """CLI handler: delete PDFs (or single chunks) from the persisted index.
+
+    Deleted chunks are tombstoned, so nothing is re-embedded and the other
+    files' vectors are untouched; `--compact` reclaims their space right
+    away instead of when `FAISS_COMPACT_RATIO` is reached. Deleted files
+    are dropped from the manifest, so ingesting them again re-adds them.
     """
     settings, embedder, store, retriever, llm, agent = build_components()
+    index_path = settings.faiss_index_path
+    store.load(index_path)
+    manifest = IngestManifest.load(manifest_path(index_path))
 
-    loader = PdfLoader()
-    all_docs = []
-    all_texts = []
-
-    # Load and chunk each supplied path. We collect both Document objects and
-    # their raw text to compute embeddings in a single batch for efficiency.
-    for path in args.paths:
-        docs = loader.load(path)
-        all_docs.extend(docs)
-        all_texts.extend([d.text for d in docs])
+    removed = store.delete(args.ids) if args.ids else 0
+    for source in args.sources:
+        count = store.delete_by_source(source)
+        manifest.forget(source)
+        print(f"{source}: {count} chunks deleted")
+        removed += count
+    if args.compact:
+        store.compact()
 
-    # Compute embeddings in batch; embedder implementations should be
-    # optimized for batching and may use GPU if available.
-    embeddings = embedder.embed(all_texts)
-
-    # Add to FAISS and persist (index + metadata). Persist path is
-    # configurable via `FAISS_INDEX_PATH` in `.env`.
-    store.add(all_docs, embeddings)
-    store.persist(settings.faiss_index_path)
-
-    print(f"Ingested {len(all_docs)} chunks; persisted to {settings.faiss_index_path}")
+    store.persist(index_path)
+    manifest.save(manifest_path(index_path))
+    print(f"Deleted {removed} chunks ({store.live_count()} remain); persisted to {index_path}")
 
 
 def cmd_chat(args: argparse.Namespace) -> None:
@@ -124,6 +337,16 @@ def cmd_chat(args: argparse.Namespace) -> None:
     except Exception:
         logging.getLogger(__name__).info("No persisted index found; starting fresh.")
 
+    # Load the embedding model while the user types the first question; a
+    # failure here surfaces again (with its traceback) on the first query.
+    def warm_up():
+        try:
+            embedder.warm_up()
+        except Exception as exc:
+            logging.getLogger(__name__).warning("Embedder warm-up failed: %s", exc)
+
+    threading.Thread(target=warm_up, name="embedder-warm-up", daemon=True).start()
+
     print("Starting interactive chat. Type 'exit' or press Enter on an empty line to quit.")
     while True:
         # Prompt the user for a question. Trim whitespace to detect exit.
@@ -132,13 +355,41 @@ def cmd_chat(args: argparse.Namespace) -> None:
             # Graceful exit of the interactive loop
             break
 
-        # Use the agent to provide a grounded answer. The agent will refuse
-        # to hallucinate if the retrieval step yields insufficient evidence.
-        response = agent.answer(q)
-
+        # Use the agent to provide a grounded answer, printing tokens as the
+        # LLM produces them. The agent will refuse to hallucinate if the
+        # retrieval step yields insufficient evidence.
         print("\n--- Answer ---")
-        print(response)
-        print("--- End ---\n")
+        for token in agent.answer_stream(q):
+            print(token, end="", flush=True)
+        print("\n--- End ---\n")
+
+
+def cmd_embed_server(args: argparse.Namespace) -> None:
+    """Run the shared embedding service until interrupted.
+
+    The model is loaded before the socket is opened, so clients that wait
+    for the socket (see `EmbeddingClient`) never see a cold model.
+    """
+    settings = get_settings()
+    path = args.socket or settings.embedding_service_socket
+    if not path:
+        raise SystemExit("set EMBEDDING_SERVICE_SOCKET or pass --socket")
+    embedder = make_embedder(settings, use_service=False)
+    embedder.warm_up()
+    server = EmbeddingServer(
+        embedder,
+        path,
+        max_batch=args.max_batch or settings.embed_service_max_batch,
+        max_wait=(args.max_wait_ms if args.max_wait_ms is not None else settings.embed_service_wait_ms) / 1000.0,
+    )
+    print(f"Embedding service for {settings.embedding_model} listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"Served {server.batcher.stats()}")
 
 
 def main() -> None:
@@ -146,21 +397,43 @@ def main() -> None:
 
     Commands:
       - ingest <paths...>
+      - delete [paths...] [--id ID] [--compact]
       - chat
+      - embed-server [--socket PATH]
     """
     parser = argparse.ArgumentParser("RAG Agent CLI")
     sub = parser.add_subparsers(dest="cmd")
 
     p_ingest = sub.add_parser("ingest", help="Ingest PDFs and build FAISS index")
     p_ingest.add_argument("paths", nargs="+", help="PDF paths to ingest")
+    p_ingest.add_argument("--workers", type=int, help="extraction processes (0 = in-process)")
+    p_ingest.add_argument("--queue-depth", type=int, help="max extracted files buffered before embedding")
+    p_ingest.add_argument("--batch-size", type=int, help="chunks per embedding batch")
+    p_ingest.add_argument(
+        "--rebuild", action="store_true", help="ignore the existing index and manifest and start over"
+    )
+
+    p_delete = sub.add_parser("delete", help="Delete PDFs or chunks from the FAISS index")
+    p_delete.add_argument("sources", nargs="*", help="PDF paths as they were ingested")
+    p_delete.add_argument("--id", dest="ids", action="append", default=[], help="chunk id (repeatable)")
+    p_delete.add_argument("--compact", action="store_true", help="reclaim the deleted vectors now")
 
     sub.add_parser("chat", help="Start interactive chat")
 
+    p_serve = sub.add_parser("embed-server", help="Serve the embedding model over a Unix socket")
+    p_serve.add_argument("--socket", help="socket path (default: EMBEDDING_SERVICE_SOCKET)")
+    p_serve.add_argument("--max-batch", type=int, help="texts that close a micro-batch early")
+    p_serve.add_argument("--max-wait-ms", type=float, help="how long a micro-batch collects requests")
+
     args = parser.parse_args()
     if args.cmd == "ingest":
         cmd_ingest(args)
+    elif args.cmd == "delete":
+        cmd_delete(args)
     elif args.cmd == "chat":
         cmd_chat(args)
+    elif args.cmd == "embed-server":
+        cmd_embed_server(args)
     else:
         parser.print_help()
 
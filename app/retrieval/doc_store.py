@@ -0,0 +1,387 @@
+"""Columnar, memory-mapped storage for the `Document`s behind a vector index.
+
+Instead of pickling a list of `Document` objects, each field is stored as a
+column: texts, ids and JSON-encoded metadata as one UTF-8 blob plus an int64
+offsets array each, and sources dictionary-encoded as int32 codes. Persisted
+columns are memory-mapped on load, so opening a store is O(1) in the number
+of documents and a `Document` is only materialized when it is indexed, e.g.
+for the top-k hits of a search.
+
+Filtered search uses secondary indexes (posting lists) from `source` and
+metadata values to positions, i.e. FAISS vector ids. The `source` index is
+derived from the dictionary codes; a metadata field's index is built the
+first time a filter names it, kept up to date on `extend`, and persisted
+alongside the columns.
+"""
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+import json
+import mmap
+import os
+import shutil
+
+import numpy as np
+
+from ..core.models import Document
+from .filters import NormalizedFilter, encode_value, encoded_values, field_value
+
+# field -> encoded value -> positions
+Postings = Dict[str, Dict[str, np.ndarray]]
+
+_COLUMNS = ("texts", "ids", "meta")
+
+
+def _pack(values: Sequence[bytes]):
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    if values:
+        np.cumsum([len(v) for v in values], out=offsets[1:])
+    return b"".join(values), offsets
+
+
+class _Column:
+    """A UTF-8 blob plus offsets; row `i` is `blob[off[i]:off[i+1]]`."""
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return bytes(self.blob[int(self.offsets[i]) : int(self.offsets[i + 1])])
+
+    def get(self, i: int) -> str:
+        return self.raw(i).decode("utf-8")
+
+    @classmethod
+    def empty(cls) -> "_Column":
+        return cls(b"", np.zeros(1, dtype=np.int64))
+
+
+class DocStore:
+    """Append-only sequence of `Document`s with a columnar on-disk format.
+
+    Documents loaded from disk live in memory-mapped columns; documents added
+    afterwards are kept as objects in a tail list until the next `persist`.
+    Supports `len()`, indexing, slicing and iteration like a list.
+    """
+
+    def __init__(self, docs: Optional[Iterable[Document]] = None):
+        self._cols: Dict[str, _Column] = {name: _Column.empty() for name in _COLUMNS}
+        self._source_codes = np.zeros(0, dtype=np.int32)
+        self._sources: List[str] = []
+        self._tail: List[Document] = []
+        self._mmaps: List[mmap.mmap] = []
+        self._id_positions: Optional[Dict[str, int]] = None
+        # posting lists over the persisted rows, per indexed field
+        self._base_postings: Postings = {}
+        # posting lists over the tail; "source" is always maintained, other
+        # fields once their base index exists
+        self._tail_postings: Dict[str, Dict[str, array]] = {"source": {}}
+        if docs:
+            self.extend(docs)
+
+    # -- sequence protocol -------------------------------------------------
+
+    @property
+    def _base_len(self) -> int:
+        return len(self._source_codes)
+
+    def __len__(self) -> int:
+        return self._base_len + len(self._tail)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("DocStore index out of range")
+        base = self._base_len
+        if i >= base:
+            return self._tail[i - base]
+        return Document(
+            id=self._cols["ids"].get(i),
+            text=self._cols["texts"].get(i),
+            metadata=json.loads(self._cols["meta"].get(i)),
+            source=self._sources[self._source_codes[i]],
+        )
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def extend(self, docs: Iterable[Document]) -> None:
+        start = len(self)
+        docs = list(docs)
+        self._tail.extend(docs)
+        if self._id_positions is not None:
+            for offset, d in enumerate(docs):
+                self._id_positions[d.id] = start + offset
+        for field, postings in self._tail_postings.items():
+            for offset, d in enumerate(docs):
+                for value in encoded_values(field_value(d, field)):
+                    postings.setdefault(value, array("q")).append(start + offset)
+
+    def append(self, doc: Document) -> None:
+        self.extend([doc])
+
+    # -- column access without materializing Documents ---------------------
+
+    def id_at(self, i: int) -> str:
+        base = self._base_len
+        return self._tail[i - base].id if i >= base else self._cols["ids"].get(i)
+
+    def source_at(self, i: int) -> str:
+        base = self._base_len
+        return self._tail[i - base].source if i >= base else self._sources[self._source_codes[i]]
+
+    def iter_ids(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.id_at(i)
+
+    def position_of(self, doc_id: str) -> Optional[int]:
+        """Position of the document with `doc_id` (index built on first use)."""
+        if self._id_positions is None:
+            self._id_positions = {doc_id: i for i, doc_id in enumerate(self.iter_ids())}
+        return self._id_positions.get(doc_id)
+
+    # -- secondary indexes -------------------------------------------------
+
+    def _build_base_postings(self, field: str) -> Dict[str, np.ndarray]:
+        base = self._base_len
+        if field == "source":
+            codes = np.asarray(self._source_codes)
+            order = np.argsort(codes, kind="stable").astype(np.int64)
+            bounds = np.cumsum(np.bincount(codes, minlength=len(self._sources)))
+            return {
+                json.dumps(source): order[start:end]
+                for source, start, end in zip(self._sources, np.r_[0, bounds[:-1]], bounds)
+                if end > start
+            }
+        lists: Dict[str, List[int]] = {}
+        meta = self._cols["meta"]
+        for i in range(base):
+            row = json.loads(meta.get(i))
+            if field not in row:
+                continue
+            for value in encoded_values(row[field]):
+                lists.setdefault(value, []).append(i)
+        return {value: np.asarray(positions, dtype=np.int64) for value, positions in lists.items()}
+
+    def _postings(self, field: str):
+        """`(base, tail)` posting lists for `field`, building them if needed."""
+        if field not in self._base_postings:
+            self._base_postings[field] = self._build_base_postings(field)
+        if field not in self._tail_postings:
+            tail: Dict[str, array] = {}
+            base = self._base_len
+            for offset, d in enumerate(self._tail):
+                for value in encoded_values(field_value(d, field)):
+                    tail.setdefault(value, array("q")).append(base + offset)
+            self._tail_postings[field] = tail
+        return self._base_postings[field], self._tail_postings[field]
+
+    def select(self, filter: NormalizedFilter) -> np.ndarray:
+        """Sorted positions of the documents matching a normalized filter.
+
+        Work is proportional to the sizes of the posting lists involved, not
+        to the number of documents (after a field's first use).
+        """
+        result: Optional[np.ndarray] = None
+        for field, values in filter.items():
+            base, tail = self._postings(field)
+            parts = [base[v] for v in values if v in base]
+            parts += [np.frombuffer(tail[v], dtype=np.int64) for v in values if v in tail]
+            matched = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+            result = matched if result is None else np.intersect1d(result, matched, assume_unique=True)
+            if not len(result):
+                break
+        return result if result is not None else np.arange(len(self), dtype=np.int64)
+
+    def memory_bytes(self) -> int:
+        """Approximate heap held by documents not yet persisted.
+
+        Memory-mapped columns are backed by the page cache and not counted.
+        """
+        # rough per-object overhead for the Document, its strings and dict
+        return sum(len(d.text) + len(d.id) + len(d.source) + 200 for d in self._tail)
+
+    def without(self, positions: Iterable[int]) -> "DocStore":
+        """A new store with every document except `positions`, in order.
+
+        This store is not modified, so it can keep serving reads while the
+        copy is made.
+        """
+        cols, codes, tail = self._kept(positions)
+        store = DocStore()
+        store._install(cols, codes, list(self._sources))
+        store.extend(tail)
+        return store
+
+    def _kept(self, positions: Iterable[int]):
+        """Columns and source codes of the persisted rows not in `positions`,
+        plus the kept tail documents.
+
+        Columns are copied as the contiguous runs between dropped rows, not
+        row by row, so dropping a few rows costs one pass over the blobs.
+        """
+        dropped = np.unique(np.fromiter((int(p) for p in positions), dtype=np.int64))
+        base = self._base_len
+        in_base = dropped[dropped < base]
+        bounds = np.concatenate([[-1], in_base, [base]])
+        runs = [(int(a) + 1, int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a + 1]
+        cols = {}
+        for name in _COLUMNS:
+            col = self._cols[name]
+            parts, offsets, size = [], [np.zeros(1, dtype=np.int64)], 0
+            for start, end in runs:
+                lo, hi = int(col.offsets[start]), int(col.offsets[end])
+                parts.append(bytes(col.blob[lo:hi]))
+                offsets.append(np.asarray(col.offsets[start + 1 : end + 1], dtype=np.int64) - lo + size)
+                size += hi - lo
+            cols[name] = (b"".join(parts), np.concatenate(offsets))
+        keep = np.ones(base, dtype=bool)
+        keep[in_base] = False
+        codes = np.asarray(self._source_codes[keep], dtype=np.int32)
+        gone = set((dropped[dropped >= base] - base).tolist())
+        tail = [d for i, d in enumerate(self._tail) if i not in gone]
+        return cols, codes, tail
+
+    # -- persistence -------------------------------------------------------
+
+    def _encoded_rows(self, keep: Optional[Sequence[int]] = None):
+        """Yield `(id, text, meta, source)` with the string fields as bytes."""
+        rows = range(len(self)) if keep is None else keep
+        base = self._base_len
+        for i in rows:
+            if i < base:
+                yield (
+                    self._cols["ids"].raw(i),
+                    self._cols["texts"].raw(i),
+                    self._cols["meta"].raw(i),
+                    self._sources[self._source_codes[i]],
+                )
+            else:
+                d = self._tail[i - base]
+                yield (
+                    d.id.encode("utf-8"),
+                    d.text.encode("utf-8"),
+                    json.dumps(d.metadata, default=str).encode("utf-8"),
+                    d.source,
+                )
+
+    def _columns_for(self, keep: Optional[Sequence[int]] = None):
+        ids, texts, metas, codes = [], [], [], []
+        sources: List[str] = []
+        lookup: Dict[str, int] = {}
+        for doc_id, text, meta, source in self._encoded_rows(keep):
+            ids.append(doc_id)
+            texts.append(text)
+            metas.append(meta)
+            if source not in lookup:
+                lookup[source] = len(sources)
+                sources.append(source)
+            codes.append(lookup[source])
+        cols = {"ids": _pack(ids), "texts": _pack(texts), "meta": _pack(metas)}
+        return cols, np.asarray(codes, dtype=np.int32), sources
+
+    def _install(self, cols, codes: np.ndarray, sources: List[str], postings: Optional[Postings] = None) -> None:
+        self._cols = {name: _Column(blob, offsets) for name, (blob, offsets) in cols.items()}
+        self._source_codes = codes
+        self._sources = sources
+        self._tail = []
+        self._id_positions = None
+        self._base_postings = postings or {}
+        self._tail_postings = {field: {} for field in ("source", *self._base_postings)}
+
+    def _close(self) -> None:
+        self._cols = {name: _Column.empty() for name in _COLUMNS}
+        self._source_codes = np.zeros(0, dtype=np.int32)
+        for m in self._mmaps:
+            m.close()
+        self._mmaps = []
+
+    def _merged_postings(self) -> Postings:
+        """Metadata posting lists over all rows, for the fields indexed so far."""
+        merged: Postings = {}
+        for field in self._base_postings:
+            if field == "source":
+                continue
+            base, tail = self._postings(field)
+            merged[field] = {
+                value: np.concatenate([base.get(value, np.zeros(0, dtype=np.int64)),
+                                       np.frombuffer(tail.get(value, array("q")), dtype=np.int64)])
+                for value in set(base) | set(tail)
+            }
+        return merged
+
+    def persist(self, directory: str) -> None:
+        """Write all columns into `directory` and re-open them memory-mapped."""
+        cols, codes, sources = self._columns_for()
+        postings = self._merged_postings()
+        tmp = directory + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, (blob, offsets) in cols.items():
+            with open(os.path.join(tmp, name + ".bin"), "wb") as f:
+                f.write(blob)
+            np.save(os.path.join(tmp, name + ".idx.npy"), offsets)
+        np.save(os.path.join(tmp, "sources.idx.npy"), codes)
+        with open(os.path.join(tmp, "sources.json"), "w", encoding="utf-8") as f:
+            json.dump(sources, f)
+        keys = [[field, value] for field, values in postings.items() for value in values]
+        lists = [postings[field][value] for field, value in keys]
+        blob, offsets = _pack([np.asarray(positions, dtype=np.int64).tobytes() for positions in lists])
+        np.save(os.path.join(tmp, "postings.npy"), np.frombuffer(blob, dtype=np.int64))
+        np.save(os.path.join(tmp, "postings.idx.npy"), offsets // 8)
+        with open(os.path.join(tmp, "postings.json"), "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+
+        # release our own maps before swapping directories (required on Windows)
+        self._close()
+        old = directory + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, old)
+        os.replace(tmp, directory)
+        shutil.rmtree(old, ignore_errors=True)
+        self._open(directory)
+
+    def _open(self, directory: str) -> None:
+        cols = {}
+        for name in _COLUMNS:
+            offsets = np.load(os.path.join(directory, name + ".idx.npy"), mmap_mode="r")
+            blob: object = b""
+            if int(offsets[-1]) > 0:
+                with open(os.path.join(directory, name + ".bin"), "rb") as f:
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mmaps.append(m)
+                blob = m
+            cols[name] = (blob, offsets)
+        codes = np.load(os.path.join(directory, "sources.idx.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "sources.json"), encoding="utf-8") as f:
+            sources = json.load(f)
+        postings: Postings = {}
+        if os.path.exists(os.path.join(directory, "postings.json")):
+            with open(os.path.join(directory, "postings.json"), encoding="utf-8") as f:
+                keys = json.load(f)
+            positions = np.load(os.path.join(directory, "postings.npy"), mmap_mode="r")
+            offsets = np.load(os.path.join(directory, "postings.idx.npy"))
+            for (field, value), start, end in zip(keys, offsets[:-1], offsets[1:]):
+                # re-key with the current encoding (older stores keyed 3.0 apart from 3)
+                value = encode_value(json.loads(value))
+                field_postings = postings.setdefault(field, {})
+                if value in field_postings:
+                    field_postings[value] = np.union1d(field_postings[value], positions[start:end])
+                else:
+                    field_postings[value] = positions[start:end]
+        self._install(cols, codes, sources, postings)
+
+    @classmethod
+    def load(cls, directory: str) -> "DocStore":
+        store = cls()
+        store._open(directory)
+        return store
@@ -1,48 +1,643 @@
-from typing import List, Tuple
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import logging
+import math
 import faiss
 import numpy as np
 import pickle
 import os
+import threading
 from ..core.models import Document
-from ..core.interfaces import VectorStore
+from .doc_store import DocStore
+from .filters import normalize_filter
+from .full_vectors import FullPrecisionVectors
+from ..core.interfaces import VectorStore, EmbeddingMatrix, EmbeddingVector
+from ..core.metrics import span
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "auto")
+# How vectors are encoded inside the index; `ivf_pq` always uses `pq`.
+STORAGE_TYPES = ("float32", "float16", "int8", "pq")
+
+_SQ_TYPES = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+# Corpus-size cut-offs used by `index_type="auto"`.
+AUTO_FLAT_MAX = 50_000
+AUTO_HNSW_MAX = 1_000_000
+AUTO_IVF_FLAT_MAX = 10_000_000
+
+# Vectors reconstructed at a time when scoring a filtered subset exactly.
+_SUBSET_CHUNK = 16_384
+# Upper bound for the HNSW beam when widening it for a selective filter.
+_MAX_EF_SEARCH = 4096
+
+
+@dataclass
+class IndexParams:
+    """Build and query parameters for `FaissVectorStore`.
+
+    Attributes:
+        index_type: one of `INDEX_TYPES`. `auto` picks a type from the corpus
+            size the first time the index is built.
+        nlist: IVF cell count; 0 derives it from the corpus size (~4*sqrt(n)).
+        pq_m: IVF-PQ sub-quantizers (must divide the embedding dimension).
+        pq_nbits: bits per PQ code.
+        hnsw_m: HNSW graph degree.
+        ef_construction: HNSW build-time beam width.
+        nprobe: IVF cells visited per query.
+        ef_search: HNSW query-time beam width.
+        train_size: vectors sampled to train IVF indexes; also the number of
+            vectors buffered in an exact index before training happens.
+        filter_exact_max: filtered searches matching at most this many
+            vectors score just those vectors exactly; larger selections are
+            pushed into the index search as an ID selector.
+        storage: vector encoding, one of `STORAGE_TYPES`: `float32` (exact),
+            `float16` (half the memory), `int8` scalar quantization (a
+            quarter) or `pq` product quantization (`pq_m` codes of
+            `pq_nbits` bits). Applies to every index type but `ivf_pq`.
+        rerank_factor: with lossy storage, keep a full-precision copy of the
+            vectors in a memory-mapped file and re-score `k * rerank_factor`
+            index candidates against it; 0 keeps no copy.
+        compact_ratio: deleted vectors are only tombstoned; once this
+            fraction of the index is tombstoned a background compaction
+            reclaims them. 0 leaves compaction to explicit `compact` calls.
+    """
+
+    index_type: str = "flat"
+    nlist: int = 0
+    pq_m: int = 16
+    pq_nbits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 40
+    nprobe: int = 16
+    ef_search: int = 64
+    train_size: int = 50_000
+    filter_exact_max: int = 20_000
+    storage: str = "float32"
+    rerank_factor: int = 0
+    compact_ratio: float = 0.2
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"unknown index type {self.index_type!r}; expected one of {INDEX_TYPES}")
+        if self.storage not in STORAGE_TYPES:
+            raise ValueError(f"unknown storage {self.storage!r}; expected one of {STORAGE_TYPES}")
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IndexParams":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+def _resolve_auto(n: int) -> str:
+    if n < AUTO_FLAT_MAX:
+        return "flat"
+    if n < AUTO_HNSW_MAX:
+        return "hnsw"
+    if n < AUTO_IVF_FLAT_MAX:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def bytes_per_vector(dim: int, index_type: str, storage: str, params: IndexParams) -> int:
+    """Approximate index memory per vector for a structure and encoding."""
+    code = {
+        "float32": 4 * dim,
+        "float16": 2 * dim,
+        "int8": dim,
+        "pq": math.ceil(params.pq_m * params.pq_nbits / 8),
+    }["pq" if index_type == "ivf_pq" else storage]
+    overhead = {"flat": 0, "ivf_flat": 8, "ivf_pq": 8, "hnsw": 8 * params.hnsw_m}[index_type]
+    return code + overhead
+
+
+def persisted_dim(path: str) -> Optional[int]:
+    """Dimension of the index persisted at `path`, without loading it.
+
+    Read from `.params.json` (`.shards.json` for a `ShardedVectorStore`);
+    indexes persisted before the dimension was recorded fall back to the
+    header of a memory-mapped `.index`. Returns None when nothing is
+    persisted.
+    """
+    for meta in (".params.json", ".shards.json"):
+        if os.path.exists(path + meta):
+            with open(path + meta, encoding="utf-8") as f:
+                dim = json.load(f).get("dim")
+            if dim:
+                return int(dim)
+    if os.path.exists(path + ".index"):
+        return faiss.read_index(path + ".index", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY).d
+    return None
 
 
 class FaissVectorStore(VectorStore):
-    def __init__(self, dim: int):
+    """FAISS-backed vector store with selectable index types.
+
+    IVF indexes and int8/PQ storage need training, so vectors are first
+    collected in an exact `IndexFlatIP`. Once `params.train_size` vectors
+    have been added (or when `build`/`persist` is called) the store trains
+    the target index on a sample and moves the buffered vectors into it;
+    later adds go straight to the trained index.
+
+    With lossy `params.storage` and `params.rerank_factor > 0`, `full` holds
+    a full-precision copy of every vector on disk (see
+    `app.retrieval.full_vectors`) used to re-score search candidates.
+
+    Deletes are tombstones: the FAISS ids (positions) of deleted chunks are
+    masked out of every search until a compaction drops them from the index,
+    the documents and the full-precision copy together.
+    """
+
+    def __init__(self, dim: int, params: Optional[IndexParams] = None):
         self.dim = dim
-        self.index = faiss.IndexFlatIP(dim)
-        self.docs: List[Document] = []
+        self.params = params or IndexParams()
+        # `index_type`/`storage` describe what is actually in `self.index`;
+        # they differ from `params` until a deferred build has happened.
+        self.index_type, self.storage = "flat", "float32"
+        target, storage = self.params.index_type, self.params.storage
+        if target in ("flat", "hnsw") and not self._needs_training(target, storage):
+            self.index_type, self.storage = target, storage
+        self.index = self._new_index(self.index_type, 0, self.storage)
+        self.full = FullPrecisionVectors(dim) if self._keeps_full_copy() else None
+        self.docs = DocStore()
+        # sorted positions of deleted vectors, masked until compaction
+        self.tombstones = np.zeros(0, dtype=np.int64)
+        self.compaction: Optional[threading.Thread] = None
+        # bumped on every mutation so caches can tell when results went stale
+        self.version = 0
+        # background ingest adds batches while chat requests search
+        self._lock = threading.RLock()
+        # serializes changes; `compact` holds only this one while it builds
+        # the compacted structures, so searches keep running meanwhile
+        self._write_lock = threading.RLock()
+
+    def _new_index(self, index_type: str, n: int, storage: str = "float32"):
+        p = self.params
+        ip = faiss.METRIC_INNER_PRODUCT
+        if index_type == "ivf_pq":
+            storage = "pq"
+        if storage == "pq" and self.dim % p.pq_m:
+            raise ValueError(f"pq_m={p.pq_m} must divide the embedding dimension {self.dim}")
+        if index_type == "flat":
+            if storage == "float32":
+                return faiss.IndexFlatIP(self.dim)
+            if storage == "pq":
+                return faiss.IndexPQ(self.dim, p.pq_m, p.pq_nbits, ip)
+            return faiss.IndexScalarQuantizer(self.dim, _SQ_TYPES[storage], ip)
+        if index_type == "hnsw":
+            if storage == "float32":
+                index = faiss.IndexHNSWFlat(self.dim, p.hnsw_m, ip)
+            elif storage == "pq":
+                index = faiss.IndexHNSWPQ(self.dim, p.pq_m, p.hnsw_m, p.pq_nbits, ip)
+            else:
+                index = faiss.IndexHNSWSQ(self.dim, _SQ_TYPES[storage], p.hnsw_m, ip)
+            index.hnsw.efConstruction = p.ef_construction
+            return index
+        nlist = p.nlist or max(1, int(4 * math.sqrt(n)))
+        # never ask for more cells than there are training points
+        nlist = max(1, min(nlist, n)) if n else nlist
+        quantizer = faiss.IndexFlatIP(self.dim)
+        if storage == "float32":
+            return faiss.IndexIVFFlat(quantizer, self.dim, nlist, ip)
+        if storage == "pq":
+            return faiss.IndexIVFPQ(quantizer, self.dim, nlist, p.pq_m, p.pq_nbits, ip)
+        return faiss.IndexIVFScalarQuantizer(quantizer, self.dim, nlist, _SQ_TYPES[storage], ip)
+
+    def _target_type(self) -> str:
+        if self.params.index_type == "auto":
+            return _resolve_auto(self.index.ntotal)
+        return self.params.index_type
+
+    def _target(self) -> Tuple[str, str]:
+        """The (index type, storage) the store is building towards."""
+        target = self._target_type()
+        return target, "pq" if target == "ivf_pq" else self.params.storage
+
+    @staticmethod
+    def _needs_training(index_type: str, storage: str) -> bool:
+        return index_type in ("ivf_flat", "ivf_pq") or storage in ("int8", "pq")
+
+    def _keeps_full_copy(self) -> bool:
+        lossy = self.params.storage != "float32" or self.params.index_type == "ivf_pq"
+        return self.params.rerank_factor > 0 and lossy
+
+    def _buffering(self) -> bool:
+        return (self.index_type, self.storage) == ("flat", "float32")
+
+    def _min_train(self, storage: str) -> int:
+        if storage == "pq":
+            return 1 << self.params.pq_nbits
+        return 1
+
+    def build(self) -> None:
+        """Move buffered vectors into the configured (or auto-selected) index.
+
+        Trains IVF indexes on a random sample of at most `train_size` vectors.
+        A no-op when the target structure is already built.
+        """
+        with self._write_lock, self._lock:
+            self._build()
 
-    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+    def _build(self) -> None:
+        target, storage = self._target()
+        n = self.index.ntotal
+        if (target, storage) == (self.index_type, self.storage) or n == 0:
+            return
+        if not self._buffering():
+            # only the exact buffer is ever converted; a built index stays
+            return
+        if n < self._min_train(storage):
+            logger.info("Only %d vectors; keeping exact index instead of %s/%s", n, target, storage)
+            return
+
+        vectors = self.index.reconstruct_n(0, n)
+        index = self._new_index(target, n, storage)
+        self._train(index, vectors, f"{target}/{storage}")
+        index.add(vectors)
+        self.index = index
+        self.index_type, self.storage = target, storage
+        self.version += 1
+
+    def _train(self, index, vectors: np.ndarray, label: str) -> None:
+        if index.is_trained:
+            return
+        n = len(vectors)
+        sample = vectors
+        if n > self.params.train_size:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, self.params.train_size, replace=False)]
+        logger.info("Training %s index on %d of %d vectors", label, len(sample), n)
+        index.train(np.ascontiguousarray(sample))
+
+    def _search_params(self, sel=None, selectivity: float = 1.0):
+        """Per-query parameters; with an ID selector `sel` matching a
+        `selectivity` fraction of the index, the IVF probe count and HNSW beam
+        are widened so enough selected candidates are still visited."""
+        extra = {} if sel is None else {"sel": sel}
+        selectivity = max(selectivity, 1.0 / max(1, self.index.ntotal))
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            nlist = faiss.extract_index_ivf(self.index).nlist
+            nprobe = min(nlist, math.ceil(self.params.nprobe / selectivity))
+            return faiss.SearchParametersIVF(nprobe=nprobe, **extra)
+        if self.index_type == "hnsw":
+            ef = self.params.ef_search
+            if sel is not None:
+                ef = max(ef, min(_MAX_EF_SEARCH, math.ceil(ef / selectivity)))
+            return faiss.SearchParametersHNSW(efSearch=ef, **extra)
+        return faiss.SearchParameters(**extra) if extra else None
+
+    def _vectors(self, positions: np.ndarray) -> np.ndarray:
+        """Vectors at `positions`: full precision when a copy is kept,
+        otherwise decoded from the index."""
+        if self.full is not None:
+            return self.full.take(positions)
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            ivf = faiss.extract_index_ivf(self.index)
+            if ivf.direct_map.no():
+                ivf.make_direct_map()
+        return self.index.reconstruct_batch(positions)
+
+    def embeddings_of(self, docs: Sequence[Document]) -> Optional[np.ndarray]:
+        """Stored vectors of `docs` by chunk id (see `_vectors`), or None if
+        one of them is not in the store. Rows are re-normalized, since
+        decoded int8/PQ vectors are only approximately unit length."""
+        with self._lock:
+            positions = [self.docs.position_of(doc.id) for doc in docs]
+            if any(p is None for p in positions):
+                return None
+            vectors = np.array(self._vectors(np.asarray(positions, dtype=np.int64)), dtype=np.float32)
         norms = np.linalg.norm(vectors, axis=1, keepdims=True)
         norms[norms == 0] = 1.0
         return vectors / norms
 
-    def add(self, docs: List[Document], embeddings: List[List[float]]) -> None:
-        arr = np.array(embeddings, dtype="float32")
-        arr = self._normalize(arr)
-        self.index.add(arr)
-        self.docs.extend(docs)
-
-    def search(self, embedding: List[float], k: int) -> List[Tuple[Document, float]]:
-        vec = np.array([embedding], dtype="float32")
-        vec = self._normalize(vec)
-        D, I = self.index.search(vec, k)
-        results = []
-        for score, idx in zip(D[0], I[0]):
-            if idx < 0 or idx >= len(self.docs):
+    def _reranks(self) -> bool:
+        return self.full is not None and self.storage != "float32"
+
+    def _rerank(self, queries: np.ndarray, candidates: np.ndarray, k: int):
+        """Re-score index `candidates` (one row per query) with the
+        full-precision copy and keep the best `k`."""
+        nq = queries.shape[0]
+        D = np.full((nq, k), -np.inf, dtype=np.float32)
+        I = np.full((nq, k), -1, dtype=np.int64)
+        for row, (query, ids) in enumerate(zip(queries, candidates)):
+            ids = ids[ids >= 0]
+            if len(ids) == 0:
                 continue
-            results.append((self.docs[int(idx)], float(score)))
+            scores = self.full.take(ids) @ query
+            top = np.argsort(-scores, kind="stable")[:k]
+            D[row, : len(top)] = scores[top]
+            I[row, : len(top)] = ids[top]
+        return D, I
+
+    def _search_subset(self, queries: np.ndarray, k: int, positions: np.ndarray):
+        """Exact top-k over just `positions`; costs O(len(positions)), not O(ntotal)."""
+        nq = queries.shape[0]
+        best_scores = np.zeros((nq, 0), dtype=np.float32)
+        best_ids = np.zeros((nq, 0), dtype=np.int64)
+        for start in range(0, len(positions), _SUBSET_CHUNK):
+            ids = np.ascontiguousarray(positions[start : start + _SUBSET_CHUNK], dtype=np.int64)
+            scores = np.concatenate([best_scores, queries @ self._vectors(ids).T], axis=1)
+            cand = np.concatenate([best_ids, np.broadcast_to(ids, (nq, len(ids)))], axis=1)
+            keep = min(k, scores.shape[1])
+            top = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_ids = np.take_along_axis(cand, top, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_ids, order, axis=1)
+
+    def _as_matrix(self, vectors, normalized: bool) -> np.ndarray:
+        """Return a C-contiguous float32 (n, dim) matrix ready for FAISS.
+
+        Arrays that are already float32, contiguous and normalized are passed
+        through as-is; anything else is copied once and normalized in place.
+        """
+        arr = np.ascontiguousarray(vectors, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if normalized:
+            return arr
+        if isinstance(vectors, np.ndarray) and np.may_share_memory(arr, vectors):
+            # never mutate the caller's buffer
+            arr = arr.copy()
+        faiss.normalize_L2(arr)
+        return arr
+
+    def add(self, docs: List[Document], embeddings: EmbeddingMatrix, normalized: bool = False) -> None:
+        if len(docs) == 0:
+            return
+        arr = self._as_matrix(embeddings, normalized)
+        if arr.shape[0] != len(docs):
+            raise ValueError(f"got {len(docs)} docs but {arr.shape[0]} embeddings")
+        with self._write_lock, self._lock, span("add", items=len(docs)):
+            self.index.add(arr)
+            if self.full is not None:
+                self.full.append(arr)
+            self.docs.extend(docs)
+            self.version += 1
+            # explicit targets train as soon as the sample buffer is full;
+            # `auto` waits for `build`/`persist`, when the corpus size is known
+            if (
+                self.params.index_type != "auto"
+                and self._buffering()
+                and self._target() != ("flat", "float32")
+                and self.index.ntotal >= self.params.train_size
+            ):
+                self._build()
+
+    def search(
+        self, embedding: EmbeddingVector, k: int, normalized: bool = False, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        vec = self._as_matrix(embedding, normalized)
+        if vec.shape[0] != 1:
+            raise ValueError("search takes a single embedding; use search_batch for several")
+        return self.search_batch(vec, k, normalized=True, filter=filter)[0]
+
+    def search_batch(
+        self,
+        embeddings: EmbeddingMatrix,
+        k: int,
+        normalized: bool = False,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search N query vectors with a single FAISS call.
+
+        Returns one `(Document, score)` list per row of `embeddings`. With a
+        `filter` (see `app.retrieval.filters`) only matching documents are
+        returned: the secondary indexes resolve it to vector ids, and FAISS
+        only scores those ids.
+
+        With a full-precision copy, quantized indexes return
+        `k * params.rerank_factor` candidates that are re-scored exactly.
+
+        Tombstoned vectors are excluded with an ID selector (or, for indexes
+        that take none, by fetching that many extra candidates).
+        """
+        mat = self._as_matrix(embeddings, normalized)
+        if mat.shape[0] == 0:
+            return []
+        wanted = normalize_filter(filter)
+        with self._lock, span("search", items=mat.shape[0]):
+            dead = self.tombstones
+            if len(dead) and self.live_count() <= 0:
+                # everything is tombstoned and compaction has not run yet
+                return [[] for _ in range(mat.shape[0])]
+            rerank = self._reranks()
+            fetch = k * self.params.rerank_factor if rerank else k
+            if wanted is None and not len(dead):
+                D, I = self.index.search(mat, fetch, params=self._search_params())
+            elif wanted is None and not self._takes_selector():
+                extra = min(self.index.ntotal, fetch + len(dead))
+                D, I = self.index.search(mat, extra, params=self._search_params())
+            elif wanted is None:
+                sel = faiss.IDSelectorNot(faiss.IDSelectorBatch(dead))
+                params = self._search_params(sel, 1.0 - len(dead) / self.index.ntotal)
+                D, I = self.index.search(mat, fetch, params=params)
+            else:
+                positions = self.docs.select(wanted)
+                if len(dead):
+                    positions = np.setdiff1d(positions, dead, assume_unique=True)
+                if len(positions) == 0:
+                    return [[] for _ in range(mat.shape[0])]
+                if len(positions) <= self.params.filter_exact_max:
+                    # scored on full-precision vectors already when a copy is kept
+                    D, I = self._search_subset(mat, k, positions)
+                    rerank = False
+                else:
+                    sel = faiss.IDSelectorBatch(positions)
+                    params = self._search_params(sel, len(positions) / self.index.ntotal)
+                    D, I = self.index.search(mat, fetch, params=params)
+            if len(dead):
+                I = np.where(np.isin(I, dead), -1, I)
+            if rerank:
+                D, I = self._rerank(mat, I, k)
+            results = []
+            for scores, ids in zip(D, I):
+                hits = []
+                for score, idx in zip(scores, ids):
+                    if idx < 0 or idx >= len(self.docs):
+                        continue
+                    hits.append((self.docs[int(idx)], float(score)))
+                    if len(hits) == k:
+                        break
+                results.append(hits)
         return results
 
+    def _takes_selector(self) -> bool:
+        # FAISS's IndexPQ rejects search parameters with an ID selector
+        return not (self.index_type == "flat" and self.storage == "pq")
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Tombstone the chunks with the given ids; returns how many were live.
+
+        Searches stop returning them at once. Once `params.compact_ratio` of
+        the index is tombstoned a background thread runs `compact`.
+        """
+        with self._write_lock, self._lock:
+            positions = (self.docs.position_of(doc_id) for doc_id in set(ids))
+            return self._tombstone([p for p in positions if p is not None])
+
+    def delete_by_source(self, source: str) -> int:
+        """Tombstone every chunk of `source`, found through the source index."""
+        with self._write_lock, self._lock:
+            return self._tombstone(self.docs.select(normalize_filter({"source": source})))
+
+    def upsert(self, docs: List[Document], embeddings: EmbeddingMatrix, normalized: bool = False) -> int:
+        """Replace the chunks with the ids of `docs` (adding the new ones);
+        returns how many existing chunks were replaced."""
+        with self._write_lock, self._lock:
+            replaced = self.delete(d.id for d in docs)
+            self.add(docs, embeddings, normalized=normalized)
+            return replaced
+
+    def live_count(self) -> int:
+        """Vectors that searches can return, i.e. not tombstoned."""
+        return self.index.ntotal - len(self.tombstones)
+
+    def _tombstone(self, positions) -> int:
+        fresh = np.setdiff1d(np.asarray(positions, dtype=np.int64), self.tombstones)
+        if not len(fresh):
+            return 0
+        self.tombstones = np.union1d(self.tombstones, fresh)
+        self.version += 1
+        ratio = self.params.compact_ratio
+        if ratio > 0 and len(self.tombstones) >= ratio * self.index.ntotal and self.compaction is None:
+            self.compaction = threading.Thread(target=self._compact_in_background, name="faiss-compact", daemon=True)
+            self.compaction.start()
+        return len(fresh)
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("Background compaction failed")
+        finally:
+            self.compaction = None
+
+    def compact(self) -> int:
+        """Drop tombstoned vectors and documents; returns how many were reclaimed.
+
+        The compacted index, documents and full-precision copy are built
+        next to the current ones, which keep serving searches, and swapped
+        in at the end; only other writers wait. Exact indexes are copied
+        without the dropped rows. ANN indexes are rebuilt from their own
+        stored vectors (keeping IVF training), which costs a pass over the
+        index but never re-embeds.
+        """
+        with self._write_lock, span("compact"):
+            positions = self.tombstones
+            if not len(positions):
+                return 0
+            index = self._compacted_index(positions)
+            full = self.full.without(positions) if self.full is not None else None
+            docs = self.docs.without(positions)
+            with self._lock:
+                self.index, self.full, self.docs = index, full, docs
+                self.tombstones = np.zeros(0, dtype=np.int64)
+                self.version += 1
+            logger.info("Compacted %d deleted vectors", len(positions))
+            return len(positions)
+
+    def _compacted_index(self, positions: np.ndarray):
+        """A new index holding every vector except `positions`, in order."""
+        if self.index_type == "flat":
+            # flat indexes (also SQ/PQ-coded) remove in order, matching the
+            # documents' compaction
+            index = faiss.clone_index(self.index)
+            index.remove_ids(positions)
+            return index
+        keep = np.setdiff1d(np.arange(self.index.ntotal, dtype="int64"), positions)
+        vectors = self._vectors(keep)
+        if self.index_type == "hnsw":
+            index = self._new_index("hnsw", 0, self.storage)
+            if len(keep):
+                self._train(index, vectors, f"hnsw/{self.storage}")
+        else:
+            # a trained IVF index without its lists
+            index = faiss.clone_index(self.index)
+            index.reset()
+        if len(keep):
+            index.add(vectors)
+        return index
+
+    def bytes_per_vector(self) -> int:
+        """Approximate index memory per vector in the current structure."""
+        return bytes_per_vector(self.dim, self.index_type, self.storage, self.params)
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size of the index plus in-memory documents.
+
+        The full-precision copy is memory-mapped and not counted.
+        """
+        return self.index.ntotal * self.bytes_per_vector() + self.docs.memory_bytes()
+
     def persist(self, path: str) -> None:
-        # store faiss index and docs
-        faiss.write_index(self.index, path + ".index")
-        with open(path + ".meta", "wb") as f:
-            pickle.dump(self.docs, f)
+        with self._write_lock, self._lock, span("persist"):
+            # finish any deferred training so the saved index is the final one
+            self._build()
+            # store faiss index, columnar docs and the index parameters
+            faiss.write_index(self.index, path + ".index")
+            self.docs.persist(path + ".docs")
+            if self.full is not None:
+                self.full.save(path + ".vectors.f32")
+            # tombstones are saved as they are; compaction is not forced here
+            if len(self.tombstones):
+                np.save(path + ".tombstones.npy", self.tombstones)
+            elif os.path.exists(path + ".tombstones.npy"):
+                os.remove(path + ".tombstones.npy")
+            with open(path + ".params.json", "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "index_type": self.index_type,
+                        "storage": self.storage,
+                        "dim": self.dim,
+                        "params": asdict(self.params),
+                    },
+                    f,
+                    indent=2,
+                )
 
     def load(self, path: str) -> None:
-        if os.path.exists(path + ".index") and os.path.exists(path + ".meta"):
-            self.index = faiss.read_index(path + ".index")
-            with open(path + ".meta", "rb") as f:
-                self.docs = pickle.load(f)
+        with span("load"):
+            has_docs = os.path.isdir(path + ".docs")
+            if os.path.exists(path + ".index") and (has_docs or os.path.exists(path + ".meta")):
+                self.index = faiss.read_index(path + ".index")
+                if has_docs:
+                    # memory-mapped; Documents are materialized per search hit
+                    self.docs = DocStore.load(path + ".docs")
+                else:
+                    # legacy pickled list; converted to columns on the next persist
+                    with open(path + ".meta", "rb") as f:
+                        self.docs = DocStore(pickle.load(f))
+                if os.path.exists(path + ".params.json"):
+                    with open(path + ".params.json", encoding="utf-8") as f:
+                        saved = json.load(f)
+                    self.params = IndexParams.from_dict(saved["params"])
+                    self.index_type = saved["index_type"]
+                    self.storage = saved.get("storage", "pq" if self.index_type == "ivf_pq" else "float32")
+                else:
+                    # indexes written before index types existed are exact
+                    self.index_type, self.storage = "flat", "float32"
+                self.full = None
+                if self._keeps_full_copy():
+                    self.full = self._open_full_copy(path + ".vectors.f32")
+                self.tombstones = np.zeros(0, dtype=np.int64)
+                if os.path.exists(path + ".tombstones.npy"):
+                    self.tombstones = np.load(path + ".tombstones.npy")
+                self.version += 1
+
+    def _open_full_copy(self, path: str) -> Optional[FullPrecisionVectors]:
+        if not os.path.exists(path):
+            if self.index.ntotal == 0:
+                return FullPrecisionVectors(self.dim)
+            logger.warning("No full-precision copy at %s; searching without re-ranking", path)
+            return None
+        full = FullPrecisionVectors.open(path, self.dim)
+        if len(full) != self.index.ntotal:
+            logger.warning(
+                "%s holds %d vectors but the index %d; searching without re-ranking",
+                path, len(full), self.index.ntotal,
+            )
+            return None
+        return full
@@ -0,0 +1,87 @@
+"""Search filters on `Document.source` and metadata.
+
+A filter is a mapping of field to a value or a list of values, e.g.
+`{"source": ["a.pdf", "b.pdf"], "page": 3}`. The field `source` matches
+`Document.source`; any other field matches that metadata key. Values within
+a list are OR-ed, fields are AND-ed. Values must be JSON scalars (strings,
+numbers, booleans or null). Numbers compare by value, so a filter on `3`
+matches metadata `3.0` and vice versa; booleans never match numbers.
+"""
+
+from typing import Any, Dict, Iterator, Optional, Tuple
+import json
+
+from ..core.models import Document
+
+# Normalized form: field -> sorted tuple of JSON-encoded values.
+NormalizedFilter = Dict[str, Tuple[str, ...]]
+
+_SCALARS = (str, int, float, bool, type(None))
+# stands in for an absent metadata key; never indexed, so never matches
+_MISSING = object()
+
+
+def encode_value(value: Any) -> str:
+    """Canonical key for one value in the secondary indexes.
+
+    Used for both indexed metadata and filter values, so integral floats are
+    keyed as ints (`3.0` -> `"3"`). `bool` is an `int` subclass and is checked
+    first, so `True` stays `"true"` and does not match `1`.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return json.dumps(value)
+
+
+def normalize_filter(filter: Optional[Dict[str, Any]]) -> Optional[NormalizedFilter]:
+    """Validate `filter` and return its normalized form (None for no filter).
+
+    Raises `ValueError` for anything that is not a mapping of field names to
+    scalars or lists of scalars.
+    """
+    if not filter:
+        return None
+    if not isinstance(filter, dict):
+        raise ValueError("filter must be a mapping of field -> value or list of values")
+    normalized: NormalizedFilter = {}
+    for field, value in filter.items():
+        if not isinstance(field, str):
+            raise ValueError("filter fields must be strings")
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        for v in values:
+            if not isinstance(v, _SCALARS):
+                raise ValueError(
+                    f"filter values must be strings, numbers, booleans or null; got {type(v).__name__} for {field!r}"
+                )
+        normalized[field] = tuple(sorted({encode_value(v) for v in values}))
+    return normalized
+
+
+def filter_key(filter: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Stable string for `filter`, used in cache keys (None for no filter)."""
+    normalized = normalize_filter(filter)
+    return None if normalized is None else json.dumps(normalized, sort_keys=True)
+
+
+def encoded_values(value: Any) -> Iterator[str]:
+    """Index keys for one field value: the value itself, or each element of a
+    list. Nested objects and missing values are not indexed."""
+    for v in value if isinstance(value, list) else [value]:
+        if isinstance(v, _SCALARS):
+            yield encode_value(v)
+
+
+def field_value(doc: Document, field: str) -> Any:
+    """The value `field` refers to: `doc.source` or a metadata entry."""
+    return doc.source if field == "source" else doc.metadata.get(field, _MISSING)
+
+
+def matches(doc: Document, filter: Optional[NormalizedFilter]) -> bool:
+    """Whether `doc` satisfies a normalized filter (reference implementation)."""
+    if filter is None:
+        return True
+    return all(
+        not set(values).isdisjoint(encoded_values(field_value(doc, field))) for field, values in filter.items()
+    )
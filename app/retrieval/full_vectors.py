@@ -0,0 +1,110 @@
+"""Full-precision copy of a store's vectors, kept on disk.
+
+Quantized indexes (float16, int8, PQ) only hold approximate vectors. To
+recover exact scores, `FaissVectorStore` asks its index for a few times more
+candidates than requested and re-scores them against this copy. The copy is
+a raw float32 file read through a memory map, so it costs page cache, not
+heap: only the candidate rows a query touches are paged in.
+"""
+
+from typing import Optional
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Rows copied at a time when compacting.
+_COPY_CHUNK = 65_536
+
+
+class FullPrecisionVectors:
+    """Append-only float32 matrix in a file, addressed by row position.
+
+    A new instance writes to an anonymous temporary file in `tmp_dir` that
+    disappears with the process. `open` maps a persisted file read-only and
+    switches to a private temporary copy on the first write, so the
+    persisted file only ever changes through `save`.
+    """
+
+    def __init__(self, dim: int, tmp_dir: Optional[str] = None):
+        self.dim = dim
+        self.tmp_dir = tmp_dir
+        self._file = tempfile.TemporaryFile(dir=tmp_dir)
+        self._path: Optional[str] = None  # set while mapping a persisted file
+        self._rows = 0
+        self._map: Optional[np.ndarray] = None
+
+    @classmethod
+    def open(cls, path: str, dim: int, tmp_dir: Optional[str] = None) -> "FullPrecisionVectors":
+        size = os.path.getsize(path)
+        if size % (4 * dim):
+            raise ValueError(f"{path} is not a float32 matrix with {dim} columns")
+        vectors = cls.__new__(cls)
+        vectors.dim = dim
+        vectors.tmp_dir = tmp_dir
+        vectors._file = None
+        vectors._path = path
+        vectors._rows = size // (4 * dim)
+        vectors._map = None
+        return vectors
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _array(self) -> np.ndarray:
+        if self._map is None:
+            if self._rows == 0:
+                return np.empty((0, self.dim), dtype=np.float32)
+            source = self._path if self._file is None else self._file
+            self._map = np.memmap(source, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._map
+
+    def _writable(self):
+        """The private temp file, copied from the persisted file if needed."""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.tmp_dir)
+            with open(self._path, "rb") as src:
+                shutil.copyfileobj(src, self._file)
+            self._path = None
+        self._map = None
+        return self._file
+
+    def append(self, vectors: np.ndarray) -> None:
+        f = self._writable()
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        f.flush()
+        self._rows += len(vectors)
+
+    def take(self, positions: np.ndarray) -> np.ndarray:
+        """Rows at `positions` as an in-memory float32 array."""
+        return np.asarray(self._array()[positions], dtype=np.float32)
+
+    def without(self, positions) -> "FullPrecisionVectors":
+        """A copy without the rows at `positions`, streamed to a new
+        temporary file; this one stays readable meanwhile."""
+        keep = np.setdiff1d(np.arange(self._rows, dtype=np.int64), positions)
+        src = self._array()
+        kept = FullPrecisionVectors(self.dim, self.tmp_dir)
+        for start in range(0, len(keep), _COPY_CHUNK):
+            kept._file.write(np.ascontiguousarray(src[keep[start : start + _COPY_CHUNK]]).tobytes())
+        kept._file.flush()
+        kept._rows = len(keep)
+        return kept
+
+    def save(self, path: str) -> None:
+        if self._file is None and os.path.abspath(path) == os.path.abspath(self._path):
+            return
+        # write aside and rename: readers may have the old file mapped
+        with open(path + ".tmp", "wb") as dst:
+            if self._file is None:
+                with open(self._path, "rb") as src:
+                    shutil.copyfileobj(src, dst)
+            else:
+                self._file.seek(0)
+                shutil.copyfileobj(self._file, dst)
+        os.replace(path + ".tmp", path)
+
+    def disk_bytes(self) -> int:
+        return self._rows * self.dim * 4
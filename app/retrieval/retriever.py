@@ -1,15 +1,106 @@
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from ..core.cache import TTLCache
+from ..core.metrics import span
 from ..core.models import Document
-from ..embeddings.embedder import SentenceEmbedder
-from .faiss_store import FaissVectorStore
-from ..core.interfaces import Retriever
+from ..embeddings.cache import normalize_text
+from ..core.interfaces import Embedder, Retriever, VectorStore
+from .filters import filter_key
 
 
 class SemanticRetriever(Retriever):
-    def __init__(self, embedder: SentenceEmbedder, store: FaissVectorStore):
+    """Embeds the query and searches the store.
+
+    With `cache_size > 0` the normalized query text is cached in two exact
+    LRU tiers: the query embedding, and the search results per `k` and
+    filter. Results are only reused while the store's `version` is unchanged.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        store: VectorStore,
+        cache_size: int = 0,
+        cache_ttl: float = 300.0,
+    ):
         self.embedder = embedder
         self.store = store
+        self.embedding_cache = TTLCache(cache_size, cache_ttl, name="query_embedding")
+        self.results_cache = TTLCache(cache_size, cache_ttl, name="query_results")
+        self._results_version = self.version
+
+    @property
+    def version(self):
+        """Snapshot id of the underlying store (changes on every mutation)."""
+        return getattr(self.store, "version", None)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Return the normalized query embedding as a 1-D float32 array."""
+        key = normalize_text(query)
+        emb = self.embedding_cache.get(key)
+        if emb is None:
+            emb = self.embedder.embed_array([query], normalize=True)[0]
+            self.embedding_cache.put(key, emb)
+        return emb
+
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        """Return normalized embeddings for `queries` as an (n, dim) array.
+
+        Cached queries are reused; all misses are encoded in one call.
+        """
+        keys = [normalize_text(q) for q in queries]
+        found: Dict[str, np.ndarray] = {}
+        for key in keys:
+            emb = self.embedding_cache.get(key)
+            if emb is not None:
+                found[key] = emb
+        missing: Dict[str, str] = {}
+        for key, query in zip(keys, queries):
+            if key not in found:
+                missing.setdefault(key, query)
+        if missing:
+            computed = self.embedder.embed_array(list(missing.values()), normalize=True)
+            for key, emb in zip(missing, computed):
+                found[key] = emb
+                self.embedding_cache.put(key, emb)
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def _check_version(self):
+        version = self.version
+        if version != self._results_version:
+            self.results_cache.clear()
+            self._results_version = version
+        return version
+
+    def retrieve(
+        self, query: str, k: int = 5, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Top-`k` chunks for `query`; `filter` (e.g. `{"source": "a.pdf"}`)
+        is pushed down into the store search."""
+        with span("retrieve"):
+            version = self._check_version()
+            key = (normalize_text(query), k, filter_key(filter), version)
+            results = self.results_cache.get(key)
+            if results is None:
+                results = self.store.search(self.embed_query(query), k, normalized=True, filter=filter)
+                self.results_cache.put(key, results)
+            return list(results)
 
-    def retrieve(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
-        emb = self.embedder.embed([query])[0]
-        return self.store.search(emb, k)
+    def retrieve_batch(
+        self, queries: Sequence[str], k: int = 5, filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Retrieve for N queries with one encoder call and one FAISS call."""
+        with span("retrieve_batch", items=len(queries)):
+            version = self._check_version()
+            fkey = filter_key(filter)
+            keys = [(normalize_text(q), k, fkey, version) for q in queries]
+            results: List = [self.results_cache.get(key) for key in keys]
+            todo = [i for i, r in enumerate(results) if r is None]
+            if todo:
+                matrix = self.embed_queries([queries[i] for i in todo])
+                for i, hits in zip(todo, self.store.search_batch(matrix, k, normalized=True, filter=filter)):
+                    results[i] = hits
+                    self.results_cache.put(keys[i], hits)
+            return [list(r) for r in results]
@@ -0,0 +1,321 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import contextvars
+import heapq
+import json
+import logging
+import os
+import threading
+import zlib
+import numpy as np
+from ..core.models import Document
+from ..core.interfaces import VectorStore, EmbeddingMatrix, EmbeddingVector
+from ..core.metrics import span
+from .faiss_store import FaissVectorStore, IndexParams
+
+logger = logging.getLogger(__name__)
+
+# `source`: all chunks of a file share a shard, so re-ingesting or deleting a
+# file touches one shard. `hash`: chunks are spread by id, which balances
+# shards when a few files dominate the corpus.
+SHARD_KEYS = ("source", "hash")
+
+
+def shard_path(path: str, shard: int) -> str:
+    """Persist prefix of one shard; its files are `<prefix>.index`, `.docs`, ..."""
+    return f"{path}.shard{shard:03d}"
+
+
+class _ShardedDocs:
+    """Read-only view of the documents of every shard, shard by shard."""
+
+    def __init__(self, store: "ShardedVectorStore"):
+        self._store = store
+
+    def __len__(self) -> int:
+        return sum(len(s.docs) for s in self._store.shards)
+
+    def __iter__(self) -> Iterator[Document]:
+        return chain.from_iterable(s.docs for s in self._store.shards)
+
+
+class ShardedVectorStore(VectorStore):
+    """A `VectorStore` split into independent `FaissVectorStore` shards.
+
+    Documents are routed to a shard by a stable hash of their source (or id,
+    see `SHARD_KEYS`). Searches run on every shard in parallel on a thread
+    pool (FAISS releases the GIL) and the per-shard top-k lists are merged
+    with a heap. Each shard is persisted to its own files and `persist` only
+    rewrites shards that changed since they were last saved or loaded, so
+    adding a file or rebuilding one shard leaves the others untouched.
+
+    Args:
+        dim: embedding dimension.
+        params: index parameters shared by every shard.
+        shards: number of shards. A persisted layout overrides it on `load`.
+        shard_by: `source` or `hash`.
+        workers: search threads; 0 means one per shard.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        params: Optional[IndexParams] = None,
+        shards: int = 4,
+        shard_by: str = "source",
+        workers: int = 0,
+    ):
+        if shards < 1:
+            raise ValueError(f"need at least one shard, got {shards}")
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"unknown shard key {shard_by!r}; expected one of {SHARD_KEYS}")
+        self.dim = dim
+        self.params = params or IndexParams()
+        self.shard_by = shard_by
+        self.workers = workers
+        self.shards: List[FaissVectorStore] = [FaissVectorStore(dim, self.params) for _ in range(shards)]
+        self.docs = _ShardedDocs(self)
+        # shard versions at the last persist/load of `_saved_path`
+        self._saved: List[Optional[int]] = [None] * shards
+        self._saved_path: Optional[str] = None
+        # keeps `version` increasing when a shard object is replaced
+        self._epoch = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.RLock()
+
+    @property
+    def version(self) -> int:
+        """Changes whenever any shard changes (see `FaissVectorStore.version`)."""
+        return self._epoch + sum(s.version for s in self.shards)
+
+    @property
+    def index_type(self) -> str:
+        return self.shards[0].index_type
+
+    @property
+    def storage(self) -> str:
+        return self.shards[0].storage
+
+    @property
+    def full(self):
+        return self.shards[0].full
+
+    def shard_for(self, doc: Document) -> int:
+        """Index of the shard `doc` belongs to; stable across processes."""
+        return self._shard_of(doc.source if self.shard_by == "source" else doc.id)
+
+    def _shard_of(self, key: str) -> int:
+        return zlib.crc32((key or "").encode("utf-8")) % len(self.shards)
+
+    def shard_sizes(self) -> List[int]:
+        return [len(s.docs) for s in self.shards]
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers or len(self.shards), thread_name_prefix="shard-search"
+                )
+            return self._pool
+
+    def _map(self, fn: Callable[[Any], Any], items: Optional[list] = None) -> list:
+        """`fn(item)` for every item (default: every shard) on the pool, in order.
+
+        Each call runs in its own copy of the caller's context so the shards'
+        spans land in the request's trace.
+        """
+        items = self.shards if items is None else items
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        pool = self._executor()
+        futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [f.result() for f in futures]
+
+    def close(self) -> None:
+        """Shut down the search threads; they are restarted on the next search."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+    def add(self, docs: List[Document], embeddings: EmbeddingMatrix, normalized: bool = False) -> None:
+        """Route each doc to its shard; only those shards change."""
+        if len(docs) == 0:
+            return
+        arr = np.asarray(embeddings, dtype=np.float32)
+        if arr.shape[0] != len(docs):
+            raise ValueError(f"got {len(docs)} docs but {arr.shape[0]} embeddings")
+        groups: Dict[int, List[int]] = {}
+        for i, doc in enumerate(docs):
+            groups.setdefault(self.shard_for(doc), []).append(i)
+        for shard, rows in groups.items():
+            self.shards[shard].add([docs[i] for i in rows], arr[rows], normalized=normalized)
+
+    def rebuild_shard(
+        self, shard: int, docs: List[Document], embeddings: EmbeddingMatrix, normalized: bool = False
+    ) -> None:
+        """Replace shard `shard` with a fresh index of `docs`.
+
+        Every doc must route to `shard`; the other shards are not touched
+        and the next `persist` rewrites only this one.
+        """
+        wrong = [d.id for d in docs if self.shard_for(d) != shard]
+        if wrong:
+            raise ValueError(f"{len(wrong)} documents belong to other shards, e.g. {wrong[0]!r}")
+        fresh = FaissVectorStore(self.dim, self.params)
+        fresh.add(docs, embeddings, normalized=normalized)
+        fresh.build()
+        with self._lock:
+            self._epoch += self.shards[shard].version + 1
+            self.shards[shard] = fresh
+            self._saved[shard] = None
+
+    def build(self) -> None:
+        """Build every shard's configured index (in parallel)."""
+        self._map(lambda s: s.build())
+
+    def search(
+        self, embedding: EmbeddingVector, k: int, normalized: bool = False, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        vec = np.asarray(embedding, dtype=np.float32)
+        if vec.ndim == 2 and vec.shape[0] != 1:
+            raise ValueError("search takes a single embedding; use search_batch for several")
+        return self.search_batch(vec.reshape(1, -1), k, normalized=normalized, filter=filter)[0]
+
+    def search_batch(
+        self,
+        embeddings: EmbeddingMatrix,
+        k: int,
+        normalized: bool = False,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search every shard for the top `k` and merge the lists per query.
+
+        Timed as `search_shards`; each shard's own lookup is a `search` span.
+        """
+        mat = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if mat.ndim == 1:
+            mat = mat.reshape(1, -1)
+        if mat.shape[0] == 0:
+            return []
+        if not normalized:
+            norms = np.linalg.norm(mat, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            mat = mat / norms
+        with span("search_shards", items=mat.shape[0]):
+            per_shard = self._map(lambda s: s.search_batch(mat, k, normalized=True, filter=filter))
+            return [
+                heapq.nlargest(k, chain.from_iterable(hits), key=lambda hit: hit[1])
+                for hits in zip(*per_shard)
+            ]
+
+    def embeddings_of(self, docs: Sequence[Document]) -> Optional[np.ndarray]:
+        """Stored vectors of `docs`, each read from the shard it routes to."""
+        if not docs:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        rows = []
+        for doc in docs:
+            row = self.shards[self.shard_for(doc)].embeddings_of([doc])
+            if row is None:
+                return None
+            rows.append(row)
+        return np.vstack(rows)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Tombstone chunks by id in whichever shards hold them."""
+        doomed = set(ids)
+        return sum(self._map(lambda s: s.delete(doomed)))
+
+    def delete_by_source(self, source: str) -> int:
+        """Tombstone every chunk of `source`; one shard when sharded by source."""
+        if self.shard_by == "source":
+            return self.shards[self._shard_of(source)].delete_by_source(source)
+        return sum(self._map(lambda s: s.delete_by_source(source)))
+
+    def upsert(self, docs: List[Document], embeddings: EmbeddingMatrix, normalized: bool = False) -> int:
+        """Replace the chunks with the ids of `docs` (adding the new ones)."""
+        replaced = self.delete(d.id for d in docs)
+        self.add(docs, embeddings, normalized=normalized)
+        return replaced
+
+    def compact(self) -> int:
+        """Compact every shard that has tombstones (in parallel)."""
+        return sum(self._map(lambda s: s.compact()))
+
+    def live_count(self) -> int:
+        return sum(s.live_count() for s in self.shards)
+
+    def bytes_per_vector(self) -> int:
+        return self.shards[0].bytes_per_vector()
+
+    def memory_bytes(self) -> int:
+        return sum(s.memory_bytes() for s in self.shards)
+
+    def persist(self, path: str) -> None:
+        """Persist changed shards to `shard_path(path, i)` and the layout to
+        `path + ".shards.json"`."""
+        with self._lock:
+            if path != self._saved_path:
+                self._saved = [None] * len(self.shards)
+            dirty = [i for i, s in enumerate(self.shards) if self._saved[i] != s.version]
+            if dirty:
+                logger.info("Persisting %d of %d shards", len(dirty), len(self.shards))
+
+            def save(i: int) -> int:
+                shard = self.shards[i]
+                shard.persist(shard_path(path, i))
+                return shard.version
+
+            for i, version in zip(dirty, self._map(save, dirty)):
+                self._saved[i] = version
+            self._saved_path = path
+            with open(path + ".shards.json", "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "shards": len(self.shards),
+                        "shard_by": self.shard_by,
+                        "dim": self.dim,
+                        "params": asdict(self.params),
+                    },
+                    f,
+                    indent=2,
+                )
+
+    def load(self, path: str) -> None:
+        """Load every shard in parallel; the persisted shard count and key win
+        over the constructor's. An unsharded index at `path` is loaded as a
+        single shard."""
+        layout_path = path + ".shards.json"
+        if not os.path.exists(layout_path):
+            if os.path.exists(path + ".index"):
+                logger.warning(
+                    "%s.index is an unsharded index; serving it as one shard (re-ingest with --rebuild "
+                    "to spread it over %d shards)", path, len(self.shards)
+                )
+                shard = FaissVectorStore(self.dim, self.params)
+                shard.load(path)
+                with self._lock:
+                    self.params = shard.params
+                    self._epoch += sum(s.version for s in self.shards) + 1
+                    self.shards = [shard]
+                    # not saved in the sharded layout yet
+                    self._saved = [None]
+                    self._saved_path = None
+                    self.close()
+            return
+        with open(layout_path, encoding="utf-8") as f:
+            layout = json.load(f)
+        with self._lock, span("load_shards", items=layout["shards"]):
+            if layout["shards"] != len(self.shards) or layout["shard_by"] != self.shard_by:
+                logger.info("Using the persisted layout: %d shards by %s", layout["shards"], layout["shard_by"])
+            self.params = IndexParams.from_dict(layout["params"])
+            self.shard_by = layout["shard_by"]
+            shards = [FaissVectorStore(self.dim, self.params) for _ in range(layout["shards"])]
+            self._map(lambda i: shards[i].load(shard_path(path, i)), list(range(len(shards))))
+            self._epoch += sum(s.version for s in self.shards) + 1
+            self.shards = shards
+            self._saved = [s.version for s in shards]
+            self._saved_path = path
+            self.close()
@@ -0,0 +1,135 @@
+"""Background ingestion jobs for the web server.
+
+`/api/ingest` saves the upload and enqueues an `IngestJob`; a fixed pool of
+worker threads drains a bounded queue and updates each job's progress
+counters, which `/api/ingest/{job_id}` reports.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from .limits import ServerBusy
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestJob:
+    """Progress of one upload through parse -> chunk -> embed -> index."""
+
+    document_id: str
+    filename: str
+    path: str
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued | parsing | embedding | done | reused | failed
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    parse_started_at: Optional[float] = None
+    embed_started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "reused", "failed")
+
+    def eta_seconds(self) -> Optional[float]:
+        """Remaining time for the current phase, from its observed rate."""
+        now = time.time()
+        if self.status == "parsing" and self.pages_parsed and self.parse_started_at:
+            rate = self.pages_parsed / max(now - self.parse_started_at, 1e-6)
+            return (self.pages_total - self.pages_parsed) / rate
+        if self.status == "embedding" and self.chunks_embedded and self.embed_started_at:
+            rate = self.chunks_embedded / max(now - self.embed_started_at, 1e-6)
+            return (self.chunks_total - self.chunks_embedded) / rate
+        return 0.0 if self.finished else None
+
+    def to_dict(self) -> dict:
+        eta = self.eta_seconds()
+        return {
+            "job_id": self.job_id,
+            "document_id": self.document_id,
+            "filename": self.filename,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_parsed": self.pages_parsed,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "eta_seconds": None if eta is None else round(eta, 1),
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs jobs on `workers` threads fed by a queue of at most `max_queue`.
+
+    `submit` raises `ServerBusy` when the queue is full so the endpoint can
+    answer 429 instead of accepting unbounded work.
+    """
+
+    def __init__(self, run: Callable[[IngestJob], None], workers: int, max_queue: int, max_history: int = 1000):
+        self._run = run
+        self._queue: "queue.Queue[IngestJob]" = queue.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, IngestJob] = {}
+        self._by_document: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+        self.max_history = max_history
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._worker, name=f"ingest-job-{i}", daemon=True).start()
+
+    def submit(self, job: IngestJob) -> IngestJob:
+        """Queue `job`, or return the in-flight job for the same document."""
+        with self._lock:
+            running = self._by_document.get(job.document_id)
+            if running is not None and not running.finished:
+                return running
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise ServerBusy() from None
+            self._remember(job)
+            return job
+
+    def record(self, job: IngestJob) -> IngestJob:
+        """Track a job that completed without queueing (e.g. a reused upload)."""
+        with self._lock:
+            self._remember(job)
+        return job
+
+    def _remember(self, job: IngestJob) -> None:
+        self._jobs[job.job_id] = job
+        self._by_document[job.document_id] = job
+        # forget the oldest finished jobs so status history stays bounded
+        if len(self._jobs) > self.max_history:
+            for job_id in [j for j, jb in self._jobs.items() if jb.finished][: len(self._jobs) - self.max_history]:
+                old = self._jobs.pop(job_id)
+                if self._by_document.get(old.document_id) is old:
+                    del self._by_document[old.document_id]
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def pending_for(self, document_id: str) -> Optional[IngestJob]:
+        job = self._by_document.get(document_id)
+        return job if job is not None and not job.finished else None
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as exc:
+                logger.exception("Ingest job %s failed", job.job_id)
+                job.status = "failed"
+                job.error = str(exc)
+            finally:
+                job.finished_at = job.finished_at or time.time()
+                self._queue.task_done()
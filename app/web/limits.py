@@ -0,0 +1,53 @@
+"""Admission control for the async web server."""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class ServerBusy(Exception):
+    """Raised when a limiter's wait queue is full; endpoints map it to 429."""
+
+
+class ConcurrencyLimiter:
+    """Bounds in-flight work and the queue waiting for it.
+
+    At most `max_active` requests run at once and at most `max_waiting` wait
+    for a slot; anything beyond that raises `ServerBusy` immediately so
+    overload shows up as backpressure instead of an ever-growing queue.
+    """
+
+    def __init__(self, max_active: int, max_waiting: int):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self._slots = asyncio.Semaphore(max_active)
+        self._waiting = 0
+        self.active = 0
+        self.rejected = 0
+
+    async def acquire(self) -> None:
+        """Wait for a slot, or raise `ServerBusy` if the queue is full.
+
+        Prefer `slot()`; use this pair directly only when the slot must
+        outlive the handler, e.g. for the duration of a streamed response.
+        """
+        if self._slots.locked() and self._waiting >= self.max_waiting:
+            self.rejected += 1
+            raise ServerBusy()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        self.active += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
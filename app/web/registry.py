@@ -0,0 +1,255 @@
+"""Per-document vector stores for the web server, bounded by a memory budget.
+
+Each uploaded PDF gets its own `FaissVectorStore`, keyed by a document id
+derived from the file's SHA-256, so re-uploading the same file reuses the
+existing store. Stores are persisted under `root/<doc_id>/` and listed in
+`root/catalog.json`; when the loaded stores exceed the memory budget the
+least-recently-used ones are dropped from memory and reloaded on demand.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
+import heapq
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+
+from ..core.interfaces import Agent, VectorStore
+from ..retrieval.faiss_store import FaissVectorStore
+
+logger = logging.getLogger(__name__)
+
+
+class StoreGroup:
+    """Read-only view that searches several stores and merges their top-k.
+
+    It offers only what a retriever reads (`search`, `search_batch`,
+    `embeddings_of` and `version`); changes go to the member stores.
+    """
+
+    def __init__(self, stores: Sequence[VectorStore]):
+        self.stores = list(stores)
+
+    @property
+    def version(self):
+        return tuple(getattr(s, "version", None) for s in self.stores)
+
+    def search(self, embedding, k: int, normalized: bool = False, filter=None):
+        hits = [
+            hit for store in self.stores for hit in store.search(embedding, k, normalized=normalized, filter=filter)
+        ]
+        return heapq.nlargest(k, hits, key=lambda hit: hit[1])
+
+    def search_batch(self, embeddings, k: int, normalized: bool = False, filter=None):
+        per_store = [store.search_batch(embeddings, k, normalized=normalized, filter=filter) for store in self.stores]
+        return [heapq.nlargest(k, (hit for rows in per_row for hit in rows), key=lambda hit: hit[1])
+                for per_row in zip(*per_store)]
+
+    def embeddings_of(self, docs):
+        rows = []
+        for doc in docs:
+            row = next((r for r in (s.embeddings_of([doc]) for s in self.stores) if r is not None), None)
+            if row is None:
+                return None
+            rows.append(row)
+        return np.vstack(rows) if rows else None
+
+
+@dataclass
+class _Entry:
+    store: FaissVectorStore
+    agent: Agent
+    persisted_version: Optional[int]
+
+
+class StoreRegistry:
+    """LRU registry of per-document stores with spill to disk.
+
+    Args:
+        root: directory holding persisted stores and `catalog.json`.
+        memory_budget: bytes of loaded stores (per `FaissVectorStore.memory_bytes`)
+            to keep in memory; 0 means unbounded.
+        new_store: builds an empty store for a given dimension.
+        new_agent: builds an agent over a single store or a read-only
+            `StoreGroup`.
+        max_groups: multi-document agents kept warm for repeated requests.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        memory_budget: int,
+        new_store: Callable[[int], FaissVectorStore],
+        new_agent: Callable[[Union[VectorStore, StoreGroup]], Agent],
+        max_groups: int = 32,
+    ):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.new_store = new_store
+        self.new_agent = new_agent
+        self.max_groups = max_groups
+        self.evictions = 0
+        self._loaded: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._groups: "OrderedDict[Tuple[str, ...], Agent]" = OrderedDict()
+        # stores still being written by an ingest job; never evicted
+        self._pinned: Set[str] = set()
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self._catalog_path = os.path.join(root, "catalog.json")
+        self._catalog: Dict[str, dict] = {}
+        if os.path.exists(self._catalog_path):
+            with open(self._catalog_path, encoding="utf-8") as f:
+                self._catalog = json.load(f)
+
+    # -- catalog -------------------------------------------------------------
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._catalog
+
+    def _store_path(self, doc_id: str) -> str:
+        return os.path.join(self.root, doc_id, "index")
+
+    def _save_catalog(self) -> None:
+        # pinned stores are not on disk yet; a restart must not list them
+        saved = {doc_id: info for doc_id, info in self._catalog.items() if doc_id not in self._pinned}
+        tmp = self._catalog_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=2)
+        os.replace(tmp, self._catalog_path)
+
+    def documents(self) -> List[dict]:
+        with self._lock:
+            return [
+                {"document_id": doc_id, "loaded": doc_id in self._loaded, **info}
+                for doc_id, info in self._catalog.items()
+            ]
+
+    def stats(self) -> Dict[str, int]:
+        """Sizes for the `/metrics` gauges: documents, loaded stores, vectors and bytes."""
+        with self._lock:
+            stores = [e.store for e in self._loaded.values()]
+            return {
+                "documents": len(self._catalog),
+                "loaded": len(stores),
+                "vectors": sum(s.live_count() for s in stores),
+                "memory_bytes": sum(s.memory_bytes() for s in stores),
+                "evictions": self.evictions,
+            }
+
+    # -- store lifecycle -----------------------------------------------------
+
+    def add(self, doc_id: str, store: FaissVectorStore, filename: str, pinned: bool = False) -> None:
+        """Register a freshly built store and persist it right away.
+
+        A `pinned` store is still being filled (e.g. by a background ingest
+        job): it is searchable immediately but lives only in memory, and is
+        neither evicted nor persisted until `unpin`. Persisting builds the
+        configured index, which would train IVF/PQ/int8 structures on just
+        the vectors added so far.
+        """
+        with self._lock:
+            self._catalog[doc_id] = {"filename": filename, "dim": store.dim, "chunks": store.live_count()}
+            self._loaded[doc_id] = _Entry(store, self.new_agent(store), None)
+            self._loaded.move_to_end(doc_id)
+            if pinned:
+                self._pinned.add(doc_id)
+            else:
+                self._spill(doc_id, self._loaded[doc_id])
+            self._enforce_budget(keep={doc_id})
+
+    def unpin(self, doc_id: str) -> None:
+        """Persist a pinned store's final state and make it evictable again."""
+        with self._lock:
+            self._pinned.discard(doc_id)
+            entry = self._loaded.get(doc_id)
+            if entry is not None:
+                self._spill(doc_id, entry)
+            self._enforce_budget(keep=set())
+
+    def discard(self, doc_id: str) -> None:
+        """Forget a document: drop it from memory, the catalog and disk."""
+        with self._lock:
+            self._loaded.pop(doc_id, None)
+            self._pinned.discard(doc_id)
+            self._groups.clear()
+            if self._catalog.pop(doc_id, None) is not None:
+                self._save_catalog()
+            shutil.rmtree(os.path.dirname(self._store_path(doc_id)), ignore_errors=True)
+
+    def store(self, doc_id: str) -> FaissVectorStore:
+        return self._entry(doc_id).store
+
+    def _entry(self, doc_id: str) -> _Entry:
+        entry = self._loaded.get(doc_id)
+        if entry is not None:
+            self._loaded.move_to_end(doc_id)
+            return entry
+        info = self._catalog.get(doc_id)
+        if info is None:
+            raise KeyError(doc_id)
+        logger.info("Reloading store for document %s", doc_id)
+        store = self.new_store(info["dim"])
+        store.load(self._store_path(doc_id))
+        entry = _Entry(store, self.new_agent(store), store.version)
+        self._loaded[doc_id] = entry
+        return entry
+
+    def agent_for(self, doc_ids: Sequence[str]) -> Agent:
+        """Agent answering over one document or the union of several.
+
+        Loads any evicted stores from disk; raises `KeyError` for unknown ids.
+        """
+        ids = tuple(sorted(set(doc_ids)))
+        if not ids:
+            raise KeyError("no document id given")
+        with self._lock:
+            entries = [self._entry(doc_id) for doc_id in ids]
+            self._enforce_budget(keep=set(ids))
+            if len(ids) == 1:
+                return entries[0].agent
+            agent = self._groups.get(ids)
+            if agent is None:
+                agent = self.new_agent(StoreGroup([e.store for e in entries]))
+                self._groups[ids] = agent
+                while len(self._groups) > self.max_groups:
+                    self._groups.popitem(last=False)
+            self._groups.move_to_end(ids)
+            return agent
+
+    def _enforce_budget(self, keep: Set[str]) -> None:
+        if self.memory_budget <= 0:
+            return
+        total = sum(e.store.memory_bytes() for e in self._loaded.values())
+        for doc_id in list(self._loaded):
+            if total <= self.memory_budget:
+                break
+            if doc_id in keep or doc_id in self._pinned:
+                continue
+            entry = self._loaded.pop(doc_id)
+            total -= entry.store.memory_bytes()
+            self._spill(doc_id, entry)
+            self.evictions += 1
+            # group agents hold references to member stores; drop them so
+            # the evicted store's memory is actually released
+            self._groups.clear()
+            logger.info("Evicted store for document %s (loaded total now ~%d bytes)", doc_id, total)
+
+    def _spill(self, doc_id: str, entry: _Entry) -> None:
+        if entry.store.version != entry.persisted_version:
+            os.makedirs(os.path.dirname(self._store_path(doc_id)), exist_ok=True)
+            entry.store.persist(self._store_path(doc_id))
+            entry.persisted_version = entry.store.version
+            self._catalog[doc_id]["chunks"] = entry.store.live_count()
+            self._save_catalog()
+
+    def flush(self) -> None:
+        """Persist every loaded store that changed since it was last saved;
+        pinned stores are left to `unpin`."""
+        with self._lock:
+            for doc_id, entry in self._loaded.items():
+                if doc_id not in self._pinned:
+                    self._spill(doc_id, entry)
@@ -1,22 +1,47 @@
 from fastapi import FastAPI, Request, UploadFile, File, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import functools
+import json
 import logging
 
-from ..main import build_components
-from ..ingestion.pdf_loader import PdfLoader
-from ..retrieval.faiss_store import FaissVectorStore
-from ..retrieval.retriever import SemanticRetriever
-import shutil
+from ..config.config import get_settings
+from ..core.metrics import CONTENT_TYPE, METRICS, in_context, trace
+from ..main import make_agent, make_embedder, make_llm, make_loader, make_retriever, make_store
+from ..retrieval.filters import normalize_filter
+from .jobs import IngestJob, JobManager
+from .limits import ConcurrencyLimiter, ServerBusy
+from .registry import StoreRegistry
+import hashlib
 import os
+import threading
+import time
+import uuid
 import pathlib
+import shutil
 import markdown
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="RAG Chat UI")
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # load the model in the background; /readyz reports when it is done
+    asyncio.get_running_loop().run_in_executor(cpu_executor, warm_up)
+    yield
+    # persist stores that changed since they were last saved
+    registry.flush()
+    if hasattr(llm, "aclose"):
+        await llm.aclose()
+    elif hasattr(llm, "close"):
+        llm.close()
+
+
+app = FastAPI(title="RAG Chat UI", lifespan=_lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -24,25 +49,164 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+HTTP_SECONDS = METRICS.histogram(
+    "rag_http_request_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+
+
+@app.middleware("http")
+async def _time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # the route template, not the raw path, keeps label cardinality bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    # streamed responses are timed to their first byte
+    HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route,
+                         status=str(response.status_code))
+    return response
+
+
 templates = Jinja2Templates(directory="app/web/templates")
 app.mount("/static", StaticFiles(directory="app/web/static"), name="static")
 
-# Build shared components once on startup (embedder + settings + default LLM)
-# Note: we will create a per-upload FAISS store so each uploaded PDF can be
-# queried in isolation. `current_agent` will point to the agent for the
-# most-recently uploaded document.
-settings, embedder, _, _, llm, _ = build_components()
+# Build shared components once on startup (embedder + settings + default LLM).
+# Construction is cheap: the embedding model loads during warm-up, so the
+# process answers /healthz immediately and /readyz once the model is loaded.
+# Note: every uploaded PDF gets its own FAISS store in the registry, keyed by
+# a content-hash document id, so documents can be queried in isolation or
+# together and concurrent users do not overwrite each other.
+settings = get_settings()
+embedder = make_embedder(settings)
+llm = make_llm(settings)
 
 # Prepare uploads folder
 UPLOAD_DIR = os.path.join(os.getcwd(), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Current active store/agent created when a PDF is uploaded
-current_store = None
-current_agent = None
+registry = StoreRegistry(
+    settings.store_registry_dir,
+    settings.store_memory_budget_mb * 1024 * 1024,
+    # one uploaded PDF per store: too small to be worth sharding
+    new_store=lambda dim: make_store(settings, dim, sharded=False),
+    new_agent=lambda store: make_agent(settings, make_retriever(settings, embedder, store), llm),
+)
+
+# Document used when a request names none: the most recently uploaded one.
+default_document_id = None
+
+# CPU-bound work (PDF parsing, embedding, FAISS search) runs on this bounded
+# pool so it never blocks the event loop; LLM calls are awaited natively.
+cpu_executor = ThreadPoolExecutor(max_workers=settings.server_cpu_workers, thread_name_prefix="rag-cpu")
+chat_limiter = ConcurrencyLimiter(settings.chat_max_concurrency, settings.chat_max_queue)
+
+
+def _registry_gauge(key: str):
+    return lambda: registry.stats()[key]
+
+
+METRICS.gauge("rag_documents", "Documents in the store registry catalog.", _registry_gauge("documents"))
+METRICS.gauge("rag_stores_loaded", "Per-document stores currently in memory.", _registry_gauge("loaded"))
+METRICS.gauge("rag_index_vectors", "Vectors in the loaded stores.", _registry_gauge("vectors"))
+METRICS.gauge("rag_index_memory_bytes", "Estimated memory of the loaded stores.", _registry_gauge("memory_bytes"))
+METRICS.gauge("rag_store_evictions", "Stores evicted to stay within the memory budget.", _registry_gauge("evictions"))
+METRICS.gauge("rag_chat_active", "Chat requests being answered.", lambda: chat_limiter.active)
+METRICS.gauge("rag_chat_rejected", "Chat requests rejected with 429.", lambda: chat_limiter.rejected)
+
+
+# Set once `warm_up` has loaded the embedding model.
+ready = threading.Event()
+warm_up_error = None
+
+
+def warm_up() -> None:
+    """Load the embedding model and run one embedding, then mark the server ready."""
+    global warm_up_error
+    start = time.perf_counter()
+    try:
+        embedder.warm_up()
+    except Exception as exc:
+        logger.exception("Warm-up failed")
+        warm_up_error = str(exc)
+        return
+    warm_up_error = None
+    ready.set()
+    logger.info("Warm-up finished in %.2fs", time.perf_counter() - start)
+
 
+def _busy() -> JSONResponse:
+    return JSONResponse({"error": "server busy, retry later"}, status_code=429, headers={"Retry-After": "1"})
 
 
+class _BadRequest(Exception):
+    """Client error raised by request helpers; mapped to a JSON 4xx response."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _requested_ids(payload) -> list:
+    """Document ids named by a request (`document_ids` list or `document_id`),
+    falling back to the most recently uploaded document."""
+    ids = payload.get("document_ids")
+    if ids is None:
+        single = payload.get("document_id") or default_document_id
+        ids = [single] if single else []
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise _BadRequest("document_ids must be a list of strings")
+    if not ids:
+        raise _BadRequest("no document uploaded; please upload a PDF first")
+    return ids
+
+
+def _requested_filter(payload):
+    """Optional `filter` on source/metadata (see `app.retrieval.filters`)."""
+    filter = payload.get("filter")
+    try:
+        normalize_filter(filter)
+    except ValueError as exc:
+        raise _BadRequest(str(exc)) from None
+    return filter or None
+
+
+async def _agent_for(payload):
+    ids = _requested_ids(payload)
+    unknown = [i for i in ids if i not in registry]
+    indexing = [i for i in unknown if jobs.pending_for(i) is not None]
+    if indexing:
+        # registered once the first embedding batch is indexed
+        raise _BadRequest(f"document(s) still being indexed: {', '.join(indexing)}", status_code=409)
+    if unknown:
+        raise _BadRequest(f"unknown document id(s): {', '.join(unknown)}", status_code=404)
+    # may reload evicted stores from disk, so keep it off the event loop
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, in_context(registry.agent_for, ids))
+
+
+def _bad_request(exc: _BadRequest) -> JSONResponse:
+    return JSONResponse({"error": str(exc)}, status_code=exc.status_code)
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return JSONResponse({"status": "ok"})
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once warm-up has loaded the embedding model, else 503."""
+    if ready.is_set():
+        return JSONResponse({"status": "ready"})
+    if warm_up_error is not None:
+        return JSONResponse({"status": "failed", "error": warm_up_error}, status_code=503)
+    return JSONResponse({"status": "warming up"}, status_code=503)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Counters, latency histograms and index gauges in the Prometheus text format."""
+    return Response(METRICS.render(), media_type=CONTENT_TYPE)
+
 
 @app.get("/", response_class=HTMLResponse)
 def index(request: Request):
@@ -97,66 +261,308 @@ def docs_view(request: Request, file: str):
 
 @app.post("/api/chat")
 async def chat_endpoint(req: Request):
+    """Answer `{"question": "...", "document_id(s)": ..., "filter": {...}}`.
+
+    With `"timings": true` (or `?timings=1`) the response also carries a
+    `timings` breakdown: total milliseconds (including time queued for a
+    slot) and milliseconds and call counts per pipeline stage.
+    """
     try:
         payload = await req.json()
         q = payload.get("question", "").strip()
         if not q:
             return JSONResponse({"error": "question required"}, status_code=400)
 
-        # Use the current agent bound to the uploaded PDF, if present.
-        global current_agent
-        if current_agent is None:
-            return JSONResponse({"error": "no document uploaded; please upload a PDF first"}, status_code=400)
-
-        resp = current_agent.answer(q)
-        return JSONResponse({"answer": resp})
+        search_filter = _requested_filter(payload)
+        with trace() as timings:
+            async with chat_limiter.slot():
+                # Scope the answer to the requested document(s) and filter.
+                agent = await _agent_for(payload)
+                resp = await agent.aanswer(q, executor=cpu_executor, filter=search_filter)
+        body = {"answer": resp}
+        if payload.get("timings") or req.query_params.get("timings") in ("1", "true"):
+            body["timings"] = timings.breakdown()
+        return JSONResponse(body)
+    except _BadRequest as exc:
+        return _bad_request(exc)
+    except ServerBusy:
+        return _busy()
     except Exception as exc:
         logger.exception("Error in chat endpoint")
         return JSONResponse({"error": str(exc)}, status_code=500)
 
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.api_route("/api/chat/stream", methods=["GET", "POST"])
+async def chat_stream_endpoint(req: Request):
+    """Stream the answer as Server-Sent Events.
+
+    Accepts `{"question": "...", "document_id(s)": ..., "filter": {...}}` as a JSON body (POST)
+    or `?question=&document_id=&filter=<json>` (GET, for `EventSource`). Emits `token` events carrying `{"text": ...}`, then a
+    single `done` event; failures mid-stream are reported as an `error` event.
+    """
+    try:
+        if req.method == "POST":
+            payload = await req.json()
+        else:
+            payload = {
+                "question": req.query_params.get("question", ""),
+                "document_id": req.query_params.get("document_id"),
+            }
+            if req.query_params.get("filter"):
+                try:
+                    payload["filter"] = json.loads(req.query_params["filter"])
+                except ValueError:
+                    raise _BadRequest("filter must be a JSON object") from None
+        q = payload.get("question", "").strip()
+        if not q:
+            return JSONResponse({"error": "question required"}, status_code=400)
+
+        search_filter = _requested_filter(payload)
+        agent = await _agent_for(payload)
+
+        # admission happens before the response starts so overload is still a 429
+        await chat_limiter.acquire()
+    except _BadRequest as exc:
+        return _bad_request(exc)
+    except ServerBusy:
+        return _busy()
+    except Exception as exc:
+        logger.exception("Error in chat stream endpoint")
+        return JSONResponse({"error": str(exc)}, status_code=500)
+
+    async def events():
+        try:
+            async for token in agent.aanswer_stream(q, executor=cpu_executor, filter=search_filter):
+                yield _sse("token", {"text": token})
+            yield _sse("done", {})
+        except Exception as exc:
+            logger.exception("Error while streaming answer")
+            yield _sse("error", {"error": str(exc)})
+
+    # disable proxy buffering so tokens reach the browser as they are produced
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return _SlotStreamingResponse(events(), chat_limiter, media_type="text/event-stream", headers=headers)
+
+
+class _SlotStreamingResponse(StreamingResponse):
+    """A `StreamingResponse` that releases a limiter slot once it is done.
+
+    The slot is released however sending ends, including when the client
+    disconnects before the body generator ever starts.
+    """
+
+    def __init__(self, content, limiter: ConcurrencyLimiter, **kwargs):
+        super().__init__(content, **kwargs)
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+
+def _serialize_hits(hits):
+    return [
+        {"id": doc.id, "text": doc.text, "source": doc.source, "metadata": doc.metadata, "score": score}
+        for doc, score in hits
+    ]
+
+
+@app.post("/api/retrieve/batch")
+async def retrieve_batch_endpoint(req: Request):
+    """Retrieve top-k chunks for many queries with one encoder and one FAISS call.
+
+    Payload: `{"queries": ["...", ...], "k": 5, "document_id(s)": ..., "filter": {...}}`; returns
+    `{"results": [[hit, ...], ...]}` with one list of hits per query, in order.
+    """
+    try:
+        payload = await req.json()
+        queries = payload.get("queries")
+        if not isinstance(queries, list) or not queries or not all(isinstance(q, str) for q in queries):
+            return JSONResponse({"error": "queries must be a non-empty list of strings"}, status_code=400)
+        k = payload.get("k", settings.top_k)
+        if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= settings.retrieve_max_k:
+            return JSONResponse(
+                {"error": f"k must be an integer from 1 to {settings.retrieve_max_k}"}, status_code=400
+            )
+        search_filter = _requested_filter(payload)
+
+        async with chat_limiter.slot():
+            retriever = (await _agent_for(payload)).retriever
+            batch = await asyncio.get_running_loop().run_in_executor(
+                cpu_executor, functools.partial(retriever.retrieve_batch, queries, k, filter=search_filter)
+            )
+        return JSONResponse({"results": [_serialize_hits(hits) for hits in batch]})
+    except _BadRequest as exc:
+        return _bad_request(exc)
+    except ServerBusy:
+        return _busy()
+    except Exception as exc:
+        logger.exception("Error in batch retrieve endpoint")
+        return JSONResponse({"error": str(exc)}, status_code=500)
+
+
+def _save_upload(fileobj, filename: str):
+    """Stream an upload to disk while hashing it.
+
+    Returns `(document_id, path)`; the file lands in `uploads/<document_id>/`
+    so different files with the same name never overwrite each other.
+    """
+    sha = hashlib.sha256()
+    tmp_path = os.path.join(UPLOAD_DIR, f".upload-{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        for block in iter(lambda: fileobj.read(1 << 20), b""):
+            sha.update(block)
+            f.write(block)
+    doc_id = sha.hexdigest()[:16]
+    dest_dir = os.path.join(UPLOAD_DIR, doc_id)
+    os.makedirs(dest_dir, exist_ok=True)
+    dest_path = os.path.join(dest_dir, os.path.basename(filename))
+    os.replace(tmp_path, dest_path)
+    return doc_id, dest_path
+
+
+def _run_ingest_job(job: IngestJob) -> None:
+    """Parse, chunk, embed and index one saved upload, updating `job` as it goes.
+
+    The store is registered (pinned) after the first embedding batch, so the
+    document can be queried while the rest of it is still being embedded.
+    """
+    job.status = "parsing"
+    job.parse_started_at = time.time()
+
+    def on_page(parsed: int, total: int) -> None:
+        job.pages_parsed, job.pages_total = parsed, total
+
+    docs = make_loader(settings).load(job.path, progress=on_page)
+    if not docs:
+        job.status = "failed"
+        job.error = "no text extracted from PDF"
+        return
+
+    job.chunks_total = len(docs)
+    job.status = "embedding"
+    job.embed_started_at = time.time()
+    store = None
+    try:
+        for start in range(0, len(docs), settings.embed_batch_size):
+            batch = docs[start : start + settings.embed_batch_size]
+            embeddings = embedder.embed_array([d.text for d in batch], normalize=True)
+            if store is None:
+                store = make_store(settings, embeddings.shape[1], sharded=False)
+                store.add(batch, embeddings, normalized=True)
+                registry.add(job.document_id, store, job.filename, pinned=True)
+            else:
+                store.add(batch, embeddings, normalized=True)
+            job.chunks_embedded += len(batch)
+    except Exception:
+        if store is not None:
+            # never leave a half-indexed document behind
+            registry.discard(job.document_id)
+        raise
+    registry.unpin(job.document_id)
+    job.status = "done"
+    job.finished_at = time.time()
+
+
+jobs = JobManager(_run_ingest_job, settings.ingest_max_concurrency, settings.ingest_max_queue)
+
+
+def _start_ingest(doc_id: str, path: str, filename: str) -> IngestJob:
+    job = IngestJob(document_id=doc_id, filename=filename, path=path)
+    pending = jobs.pending_for(doc_id)
+    if pending is not None:
+        return pending
+    if doc_id in registry:
+        job.status = "reused"
+        job.finished_at = time.time()
+        return jobs.record(job)
+    return jobs.submit(job)
+
+
 @app.post("/api/ingest")
 async def ingest_endpoint(file: UploadFile = File(...)):
-    """Accept a PDF upload, ingest it into a FAISS store, and set the
-    active agent to serve chat queries only on this document.
+    """Save a PDF upload and queue it for background ingestion.
+
+    Responds 202 with a `job_id` (poll `GET /api/ingest/{job_id}` for
+    progress) and the `document_id` to pass to the chat endpoints; the upload
+    also becomes the default document for requests that name none.
+    Re-uploading an identical file reuses its existing store, and a full job
+    queue answers 429.
     """
     # Validate content type loosely
     if not file.filename.lower().endswith(".pdf"):
         return JSONResponse({"error": "only PDF files are supported"}, status_code=400)
 
     try:
-        dest_path = os.path.join(UPLOAD_DIR, file.filename)
-        # Save uploaded file to disk
-        with open(dest_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        filename = os.path.basename(file.filename)
+        doc_id, path = await asyncio.get_running_loop().run_in_executor(
+            cpu_executor, _save_upload, file.file, filename
+        )
+        job = _start_ingest(doc_id, path, filename)
+
+        global default_document_id
+        default_document_id = doc_id
+
+        return JSONResponse(
+            {
+                "job_id": job.job_id,
+                "document_id": doc_id,
+                "filename": filename,
+                "status": job.status,
+                "reused": job.status == "reused",
+                "status_url": f"/api/ingest/{job.job_id}",
+            },
+            status_code=202,
+        )
+    except ServerBusy:
+        return _busy()
+    except Exception as exc:
+        logger.exception("Error ingesting uploaded PDF")
+        return JSONResponse({"error": str(exc)}, status_code=500)
 
-        # Ingest: load, chunk, embed, create a dedicated FAISS store
-        loader = PdfLoader()
-        docs = loader.load(dest_path)
-        texts = [d.text for d in docs]
-        embeddings = embedder.embed(texts)
 
-        if not embeddings:
-            return JSONResponse({"error": "no text extracted from PDF"}, status_code=400)
+@app.get("/api/ingest/{job_id}")
+def ingest_status_endpoint(job_id: str):
+    """Progress of an ingest job: pages parsed, chunks embedded and an ETA."""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job id"}, status_code=404)
+    return JSONResponse(job.to_dict())
 
-        # Create a fresh in-memory FAISS store for this upload
-        dim = len(embeddings[0])
-        store = FaissVectorStore(dim)
-        store.add(docs, embeddings)
 
-        # Create a retriever and agent bound to this store
-        retriever = SemanticRetriever(embedder, store)
-        from ..agent.agent import RagAgent
+@app.get("/api/documents")
+def documents_endpoint():
+    """List known documents with their ids, filenames and whether they are loaded."""
+    return JSONResponse({"documents": registry.documents(), "default_document_id": default_document_id})
 
-        agent = RagAgent(retriever, llm, top_k=settings.top_k, similarity_threshold=settings.similarity_threshold)
 
-        # Set as current active agent
-        global current_store, current_agent
-        current_store = store
-        current_agent = agent
+@app.delete("/api/documents/{document_id}")
+async def delete_document_endpoint(document_id: str):
+    """Delete an uploaded document: its store, its catalog entry and the saved PDF.
 
-        return JSONResponse({"status": "ok", "filename": file.filename})
-    except Exception as exc:
-        logger.exception("Error ingesting uploaded PDF")
-        return JSONResponse({"error": str(exc)}, status_code=500)
+    Answers 404 for unknown ids and 409 while the document is still being
+    ingested. Requests that named the document get a 404 afterwards. The
+    store holds only this document, so it is dropped whole rather than
+    tombstoned chunk by chunk.
+    """
+    if jobs.pending_for(document_id) is not None:
+        return JSONResponse({"error": "document is still being ingested"}, status_code=409)
+    if document_id not in registry:
+        return JSONResponse({"error": "unknown document id"}, status_code=404)
+
+    def remove() -> None:
+        registry.discard(document_id)
+        shutil.rmtree(os.path.join(UPLOAD_DIR, os.path.basename(document_id)), ignore_errors=True)
+
+    await asyncio.get_running_loop().run_in_executor(cpu_executor, remove)
+    global default_document_id
+    if default_document_id == document_id:
+        default_document_id = None
+    return JSONResponse({"document_id": document_id, "deleted": True})
@@ -1,12 +1,17 @@
+// Document id returned by the last upload; chat requests are scoped to it.
+let currentDocumentId = null;
+
 async function askQuestion() {
   const q = document.getElementById("question").value;
   const resEl = document.getElementById("answer");
   resEl.textContent = "...thinking...";
   try {
-    const resp = await fetch('/api/chat', {
+    // Stream tokens over Server-Sent Events so the answer appears as soon as
+    // the model starts producing it.
+    const resp = await fetch('/api/chat/stream', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ question: q }),
+      body: JSON.stringify({ question: q, document_id: currentDocumentId }),
     });
 
     // Handle non-JSON responses gracefully to avoid JSON.parse errors.
@@ -23,17 +28,37 @@ async function askQuestion() {
       return;
     }
 
-    if (contentType.includes('application/json')) {
-      const data = await resp.json();
-      if (data.error) {
-        resEl.textContent = 'Error: ' + data.error;
-      } else {
-        resEl.textContent = data.answer;
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let started = false;
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      // SSE events are separated by a blank line
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) >= 0) {
+        const raw = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = 'message';
+        let data = '';
+        for (const line of raw.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        const payload = data ? JSON.parse(data) : {};
+        if (event === 'token') {
+          if (!started) {
+            resEl.textContent = '';
+            started = true;
+          }
+          resEl.textContent += payload.text;
+        } else if (event === 'error') {
+          resEl.textContent = 'Error: ' + payload.error;
+          return;
+        }
       }
-    } else {
-      // Fallback: display raw text
-      const txt = await resp.text();
-      resEl.textContent = txt;
     }
   } catch (err) {
     resEl.textContent = 'Request failed: ' + err;
@@ -43,6 +68,40 @@ async function askQuestion() {
 document.getElementById('ask').addEventListener('click', askQuestion);
 
 
+function describeJob(job) {
+  if (job.status === 'parsing') {
+    return `Parsing pages ${job.pages_parsed}/${job.pages_total}`;
+  }
+  if (job.status === 'embedding') {
+    const eta = job.eta_seconds != null ? ` (~${Math.ceil(job.eta_seconds)}s left)` : '';
+    return `Embedding chunks ${job.chunks_embedded}/${job.chunks_total}${eta}`;
+  }
+  return 'Queued';
+}
+
+// Poll an ingest job until it finishes; questions can be asked as soon as
+// the first chunks are indexed, so this only updates the status line.
+async function pollIngest(url, filename, status) {
+  while (true) {
+    const resp = await fetch(url);
+    const job = await resp.json();
+    if (!resp.ok) {
+      status.textContent = 'Upload error: ' + (job.error || resp.status);
+      return;
+    }
+    if (job.status === 'done' || job.status === 'reused') {
+      status.textContent = 'Indexed: ' + (filename || 'ok');
+      return;
+    }
+    if (job.status === 'failed') {
+      status.textContent = 'Ingest failed: ' + (job.error || 'unknown error');
+      return;
+    }
+    status.textContent = describeJob(job) + ': ' + filename;
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+  }
+}
+
 async function uploadPdf() {
   const input = document.getElementById('pdf');
   const status = document.getElementById('upload-status');
@@ -70,7 +129,12 @@ async function uploadPdf() {
 
     if (contentType.includes('application/json')) {
       const data = await resp.json();
-      status.textContent = 'Uploaded: ' + (data.filename || 'ok');
+      currentDocumentId = data.document_id || null;
+      if (data.reused) {
+        status.textContent = 'Already indexed: ' + (data.filename || 'ok');
+      } else {
+        await pollIngest(data.status_url, data.filename, status);
+      }
     } else {
       status.textContent = await resp.text();
     }
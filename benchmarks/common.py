@@ -0,0 +1,152 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks must run offline on CPU, so by default they embed with
+`HashingEmbedder` instead of a downloaded model: it is deterministic, has no
+dependencies and gives similar texts similar vectors, which is all retrieval
+benchmarks need. Pass `--model` to a script to measure a real
+`SentenceEmbedder` when its weights are available locally.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import zlib
+
+import numpy as np
+
+from app.core.interfaces import Embedder
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder(Embedder):
+    """Bag-of-words feature hashing into `dim` signed buckets."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    @property
+    def dimension(self) -> int:
+        return self.dim
+
+    def embed_array(self, texts: Iterable[str], normalize: bool = False) -> np.ndarray:
+        texts = list(texts)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                h = zlib.crc32(word.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        if normalize:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+    def embed(self, texts: Iterable[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+
+def make_embedder(model: Optional[str], dim: int = 384) -> Embedder:
+    """`HashingEmbedder`, or a `SentenceEmbedder` for `model` when given."""
+    if not model:
+        return HashingEmbedder(dim)
+    from app.embeddings.embedder import SentenceEmbedder
+
+    return SentenceEmbedder(model)
+
+
+def make_random_model(path: str, layers: int = 6, hidden: int = 384, heads: int = 12,
+                      vocab: int = 5000, max_seq_length: int = 256) -> str:
+    """Write a randomly initialized BERT sentence-transformers model to `path`.
+
+    The defaults give all-MiniLM-L6-v2's shape, so encoder throughput
+    matches the real model's without downloading it; the vectors are
+    meaningless. The WordPiece vocabulary is `w0`..`w{vocab-1}` (see
+    `random_texts`). Returns `path`; an existing model there is reused.
+    """
+    if os.path.exists(os.path.join(path, "modules.json")):
+        return path
+    import tokenizers
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    hf_dir = os.path.join(path, "_hf")
+    os.makedirs(hf_dir, exist_ok=True)
+    specials = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    words = {w: i for i, w in enumerate(specials + [f"w{i}" for i in range(vocab)])}
+    backend = tokenizers.Tokenizer(tokenizers.models.WordPiece(words, unk_token="[UNK]"))
+    backend.normalizer = tokenizers.normalizers.BertNormalizer()
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.BertPreTokenizer()
+    backend.post_processor = tokenizers.processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    BertTokenizerFast(tokenizer_object=backend, model_max_length=max_seq_length).save_pretrained(hf_dir)
+    config = BertConfig(vocab_size=len(words), hidden_size=hidden, num_hidden_layers=layers,
+                        num_attention_heads=heads, intermediate_size=4 * hidden, max_position_embeddings=512)
+    BertModel(config).save_pretrained(hf_dir)
+    transformer = models.Transformer(hf_dir, max_seq_length=max_seq_length)
+    pooling = models.Pooling(hidden, "mean")
+    SentenceTransformer(modules=[transformer, pooling], device="cpu").save(path)
+    return path
+
+
+def random_texts(n: int, seed: int = 0, vocab: int = 5000) -> List[str]:
+    """`n` texts of `make_random_model` words, 3 to ~250 tokens long, skewed
+    short the way chunk tails and headings make real corpora."""
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(3.5, 0.9, n), 3, 250).astype(int)
+    return [" ".join(f"w{i}" for i in rng.integers(0, vocab, length)) for length in lengths]
+
+
+def clustered_vectors(n: int, dim: int, seed: int = 0, spread: float = 0.5) -> np.ndarray:
+    """Unit vectors scattered around n/100 random centers."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim))
+    vecs = (centers[rng.integers(0, len(centers), n)] + spread * rng.standard_normal((n, dim))).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs
+
+
+def percentiles(samples: Sequence[float], scale: float = 1000.0) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of `samples` (seconds), reported in milliseconds."""
+    arr = np.asarray(samples, dtype=np.float64) * scale
+    if len(arr) == 0:
+        return {}
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+        "max_ms": round(float(arr.max()), 3),
+    }
+
+
+def environment() -> dict:
+    """Where and on what code a report was produced."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_report(report: dict, out: Optional[str]) -> None:
+    """Print `report` as JSON and optionally save it to `out`."""
+    text = json.dumps(report, indent=2)
+    print(text)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
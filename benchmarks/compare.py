@@ -0,0 +1,79 @@
+"""Compare two benchmark JSON reports, e.g. from two commits.
+
+Prints every timing, throughput and recall figure found in both reports
+with its relative change, and exits with status 1 when any of them moved the
+wrong way by more than `--threshold` (default 10%):
+
+    python benchmarks/compare.py bench-main.json bench-branch.json --threshold 0.15
+
+Latencies and durations (`*_ms`, `*seconds`) regress when they grow;
+throughputs (`per_second`, `qps`) and `recall_at_k` regress when they shrink.
+"""
+
+from typing import Dict, Iterator, Optional, Tuple
+import argparse
+import json
+import sys
+
+_HIGHER_IS_BETTER = ("per_second", "qps", "recall_at_k")
+_LOWER_IS_BETTER = ("_ms", "seconds")
+
+
+def _direction(key: str) -> Optional[int]:
+    """+1 when larger is better, -1 when smaller is better, None to ignore."""
+    if key.endswith(_HIGHER_IS_BETTER):
+        return 1
+    if key.endswith(_LOWER_IS_BETTER):
+        return -1
+    return None
+
+
+def flatten(report: dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in report.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, float(value)
+
+
+def compare(old: dict, new: dict, threshold: float = 0.10) -> Dict[str, dict]:
+    before = dict(flatten(old))
+    rows = {}
+    for path, value in flatten(new):
+        direction = _direction(path.rsplit(".", 1)[-1])
+        if direction is None or path not in before or path.startswith(("environment", "settings")):
+            continue
+        base = before[path]
+        change = (value - base) / base if base else 0.0
+        rows[path] = {
+            "old": base,
+            "new": value,
+            "change": round(change, 4),
+            "regression": direction * change < -threshold,
+        }
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    rows = compare(old, new, args.threshold)
+    width = max((len(p) for p in rows), default=10)
+    for path, row in rows.items():
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{path:<{width}}  {row['old']:>12.4g}  {row['new']:>12.4g}  {row['change']:>+8.1%}{flag}")
+    regressions = sum(row["regression"] for row in rows.values())
+    print(f"{len(rows)} metrics compared, {regressions} regressions beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Embedding benchmark: chunks/sec of `SentenceEmbedder` batching strategies.
+
+Encodes the same texts three ways, each in calls of `--call-size` texts as
+the ingestion pipeline makes them:
+
+- `baseline`: one `model.encode` per call with sentence-transformers'
+  default batch size of 32, i.e. what `SentenceEmbedder` did before texts
+  were bucketed by token length;
+- `bucketed`: `SentenceEmbedder.embed_array`, token-length buckets under a
+  `--batch-tokens` padded-token budget (see `token_budget_batches`);
+- `workers`: the same with `--workers` encode processes (skipped when 0);
+- `onnx` / `onnx_int8` with `--onnx`: `OnnxEmbedder` on ONNX Runtime with
+  float and int8 weights, with their cosine agreement with `bucketed`.
+
+Each also reports its padding: the share of encoded positions that are pad
+tokens. Without `--model` a randomly initialized model with
+all-MiniLM-L6-v2's shape is written to a temporary directory, so the run
+is offline but the encoder cost is realistic. Run from the repository root:
+
+    python benchmarks/embed.py --texts 2000 --workers 4 --onnx --out embed.json
+"""
+
+from typing import List, Optional
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from benchmarks.common import environment, make_random_model, random_texts, write_report  # noqa: E402
+from app.embeddings.embedder import SentenceEmbedder  # noqa: E402
+from app.embeddings.onnx_embedder import OnnxEmbedder  # noqa: E402
+
+ST_BATCH_SIZE = 32
+
+
+def _padding(lengths: List[int], batches: List[np.ndarray]) -> float:
+    lengths = np.asarray(lengths)
+    padded = sum(len(b) * int(lengths[b].max()) for b in batches)
+    return round(1.0 - int(lengths.sum()) / padded, 3)
+
+
+def _baseline_batches(texts: List[str], call_size: int) -> List[np.ndarray]:
+    # sentence-transformers sorts each call by character length, longest first
+    batches = []
+    for start in range(0, len(texts), call_size):
+        order = start + np.argsort([-len(t) for t in texts[start : start + call_size]], kind="stable")
+        batches += [order[i : i + ST_BATCH_SIZE] for i in range(0, len(order), ST_BATCH_SIZE)]
+    return batches
+
+
+def _timed(fn, texts: List[str], call_size: int) -> dict:
+    fn(texts[: min(len(texts), 8)])  # warm-up: lazy loading, first-call allocations
+    start = time.perf_counter()
+    for i in range(0, len(texts), call_size):
+        fn(texts[i : i + call_size])
+    seconds = time.perf_counter() - start
+    return {"seconds": round(seconds, 4), "chunks_per_second": round(len(texts) / seconds, 1)}
+
+
+def run(texts: int = 1000, model: Optional[str] = None, call_size: int = 256, batch_tokens: int = 8192,
+        max_batch_size: int = 128, workers: int = 0, layers: int = 6, hidden: int = 384,
+        onnx: bool = False) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        path = model or make_random_model(os.path.join(workdir, "model"), layers=layers, hidden=hidden,
+                                          heads=max(1, hidden // 32))
+        sample = random_texts(texts)
+        embedder = SentenceEmbedder(path, batch_tokens=batch_tokens, max_batch_size=max_batch_size)
+        st_model = embedder.model
+        lengths = embedder.token_lengths(sample)
+        bucketed = [
+            b + start
+            for start in range(0, len(sample), call_size)
+            for b in embedder.batches(sample[start : start + call_size])
+        ]
+
+        report = {
+            "model": model or f"random bert ({layers} layers, hidden {hidden})",
+            "texts": len(sample),
+            "mean_tokens": round(float(np.mean(lengths)), 1),
+            "call_size": call_size,
+            "batch_tokens": batch_tokens,
+            "max_batch_size": max_batch_size,
+            "baseline": _timed(
+                lambda t: st_model.encode(t, batch_size=ST_BATCH_SIZE, show_progress_bar=False,
+                                          normalize_embeddings=True),
+                sample, call_size,
+            ),
+            "bucketed": _timed(lambda t: embedder.embed_array(t, normalize=True), sample, call_size),
+        }
+        report["baseline"]["padding"] = _padding(lengths, _baseline_batches(sample, call_size))
+        report["bucketed"]["padding"] = _padding(lengths, bucketed)
+        if workers > 0:
+            pooled = SentenceEmbedder(path, batch_tokens=batch_tokens, max_batch_size=max_batch_size,
+                                      workers=workers)
+            try:
+                report["workers"] = {"processes": workers,
+                                     **_timed(lambda t: pooled.embed_array(t, normalize=True), sample, call_size)}
+            finally:
+                pooled.close()
+        if onnx:
+            reference = embedder.embed_array(sample, normalize=True)
+            for name, quantize in (("onnx", False), ("onnx_int8", True)):
+                runtime = OnnxEmbedder(path, cache_dir=os.path.join(workdir, "onnx"), quantize=quantize,
+                                       batch_tokens=batch_tokens, max_batch_size=max_batch_size)
+                start = time.perf_counter()
+                runtime.warm_up()  # exports (and quantizes) the model
+                report[name] = {"export_seconds": round(time.perf_counter() - start, 3),
+                                **_timed(lambda t: runtime.embed_array(t, normalize=True), sample, call_size)}
+                cosine = np.sum(runtime.embed_array(sample, normalize=True) * reference, axis=1)
+                report[name]["min_cosine"] = round(float(cosine.min()), 6)
+        base = report["baseline"]["chunks_per_second"]
+        for name in ("bucketed", "workers", "onnx", "onnx_int8"):
+            if name in report:
+                report[name]["speedup"] = round(report[name]["chunks_per_second"] / base, 2)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--model", help="sentence-transformers model (default: random MiniLM-shaped model)")
+    parser.add_argument("--call-size", type=int, default=256, help="texts per embed call (EMBED_BATCH_SIZE)")
+    parser.add_argument("--batch-tokens", type=int, default=8192)
+    parser.add_argument("--max-batch-size", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=0, help="also measure this many encode processes")
+    parser.add_argument("--onnx", action="store_true", help="also measure the ONNX Runtime backend")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(args.texts, args.model, args.call_size, args.batch_tokens, args.max_batch_size, args.workers,
+                 onnx=args.onnx)
+    write_report({"environment": environment(), "embed": report}, args.out)
+
+
+if __name__ == "__main__":
+    main()
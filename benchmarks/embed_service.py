@@ -0,0 +1,89 @@
+"""Embedding service benchmark: query embeddings under concurrency.
+
+`--concurrency` threads each embed single queries, as concurrent `/api/chat`
+requests do, two ways:
+
+- `direct`: every call encodes its query alone on a shared in-process
+  `SentenceEmbedder`;
+- `service`: calls go through `EmbeddingClient` to an `EmbeddingServer` in
+  the same process, which micro-batches them (`--max-wait-ms`,
+  `--max-batch`).
+
+Each reports queries/sec and p50/p95/p99 latency; `service` also reports
+requests per encoder call. Without `--model` a randomly initialized
+MiniLM-shaped model is used (see `make_random_model`). Run from the
+repository root:
+
+    python benchmarks/embed_service.py --queries 400 --concurrency 16 --out service.json
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import environment, make_random_model, percentiles, random_texts, write_report  # noqa: E402
+from app.embeddings.embedder import SentenceEmbedder  # noqa: E402
+from app.embeddings.service import EmbeddingClient, EmbeddingServer  # noqa: E402
+
+
+def _load(fn: Callable[[List[str]], object], queries: List[str], concurrency: int) -> dict:
+    def timed(query: str) -> float:
+        start = time.perf_counter()
+        fn([query])
+        return time.perf_counter() - start
+
+    fn(queries[:1])  # warm-up: connection, first-call allocations
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(timed, queries))
+    wall = time.perf_counter() - start
+    return dict(percentiles(samples), qps=round(len(queries) / wall, 1))
+
+
+def run(queries: int = 400, concurrency: int = 16, model: Optional[str] = None, max_batch: int = 64,
+        max_wait_ms: float = 5.0, layers: int = 6, hidden: int = 384) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        path = model or make_random_model(os.path.join(workdir, "model"), layers=layers, hidden=hidden,
+                                          heads=max(1, hidden // 32))
+        # query-sized texts
+        sample = [" ".join(t.split()[:24]) for t in random_texts(queries, seed=1)]
+        embedder = SentenceEmbedder(path)
+        embedder.warm_up()
+        report = {
+            "model": model or f"random bert ({layers} layers, hidden {hidden})",
+            "queries": len(sample),
+            "concurrency": concurrency,
+            "max_batch": max_batch,
+            "max_wait_ms": max_wait_ms,
+            "direct": _load(lambda t: embedder.embed_array(t, normalize=True), sample, concurrency),
+        }
+        with EmbeddingServer(embedder, os.path.join(workdir, "embed.sock"), max_batch=max_batch,
+                             max_wait=max_wait_ms / 1000.0) as server:
+            client = EmbeddingClient(server.path)
+            report["service"] = _load(lambda t: client.embed_array(t, normalize=True), sample, concurrency)
+            report["service"]["requests_per_batch"] = server.batcher.stats()["requests_per_batch"]
+        report["service"]["speedup"] = round(report["service"]["qps"] / report["direct"]["qps"], 2)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--model", help="sentence-transformers model (default: random MiniLM-shaped model)")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(args.queries, args.concurrency, args.model, args.max_batch, args.max_wait_ms)
+    write_report({"environment": environment(), "embed_service": report}, args.out)
+
+
+if __name__ == "__main__":
+    main()
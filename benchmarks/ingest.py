@@ -0,0 +1,122 @@
+"""Ingest benchmark: throughput of each stage over a synthetic PDF corpus.
+
+Runs the stages one after another in this process so each gets its own
+timing: `extract` (PDF text, `PdfLoader.extract`), `chunk`
+(`PdfLoader.chunk`), `embed` (`embed_array` in `--batch-size` batches), `add`
+(`FaissVectorStore.add`, including any index training) and `persist`. Run
+from the repository root:
+
+    python benchmarks/ingest.py --files 20 --pages 50 --index-type hnsw --out ingest.json
+
+Without `--corpus`, PDFs are generated into a temporary directory with
+`benchmarks/pdfgen.py`. Embedding uses the offline `HashingEmbedder` unless
+`--model` names a locally available sentence-transformers model.
+"""
+
+from typing import List, Optional
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import environment, make_embedder, write_report  # noqa: E402
+from benchmarks.pdfgen import make_corpus  # noqa: E402
+from app.ingestion.pdf_loader import PdfLoader  # noqa: E402
+from app.retrieval.faiss_store import FaissVectorStore, IndexParams  # noqa: E402
+
+
+def _stage(items: int, unit: str, seconds: float) -> dict:
+    return {
+        "items": items,
+        "unit": unit,
+        "seconds": round(seconds, 4),
+        "per_second": round(items / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def ingest(paths: List[str], embedder, params: IndexParams, batch_size: int, workdir: str):
+    """Ingest `paths` stage by stage; returns `(report, store, docs)`."""
+    loader = PdfLoader()
+    timings = {name: 0.0 for name in ("extract", "chunk", "embed", "add", "persist")}
+
+    start = time.perf_counter()
+    extracted = [(path, loader.extract(path)) for path in paths]
+    timings["extract"] = time.perf_counter() - start
+    pages = sum(len(p) for _, p in extracted)
+
+    start = time.perf_counter()
+    docs = [doc for path, page_texts in extracted for doc in loader.chunk(path, page_texts)]
+    timings["chunk"] = time.perf_counter() - start
+
+    store = FaissVectorStore(embedder.dimension, params)
+    for i in range(0, len(docs), batch_size):
+        batch = docs[i : i + batch_size]
+        start = time.perf_counter()
+        vectors = embedder.embed_array([d.text for d in batch], normalize=True)
+        timings["embed"] += time.perf_counter() - start
+        start = time.perf_counter()
+        store.add(batch, vectors, normalized=True)
+        timings["add"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    # finish any deferred index build here so `persist` only times the write
+    store.build()
+    timings["add"] += time.perf_counter() - start
+    start = time.perf_counter()
+    store.persist(os.path.join(workdir, "bench"))
+    timings["persist"] = time.perf_counter() - start
+
+    mb = sum(os.path.getsize(p) for p in paths) / 1e6
+    report = {
+        "files": len(paths),
+        "pages": pages,
+        "chunks": len(docs),
+        "pdf_mb": round(mb, 2),
+        "index": f"{store.index_type}/{store.storage}",
+        "bytes_per_vector": store.bytes_per_vector(),
+        "total_seconds": round(sum(timings.values()), 4),
+        "stages": {
+            "extract": _stage(pages, "pages", timings["extract"]),
+            "chunk": _stage(len(docs), "chunks", timings["chunk"]),
+            "embed": _stage(len(docs), "chunks", timings["embed"]),
+            "add": _stage(len(docs), "chunks", timings["add"]),
+            "persist": _stage(len(docs), "chunks", timings["persist"]),
+        },
+    }
+    return report, store, docs
+
+
+def run(files: int = 10, pages: int = 20, corpus: Optional[str] = None, model: Optional[str] = None,
+        index_type: str = "flat", storage: str = "float32", batch_size: int = 256) -> dict:
+    embedder = make_embedder(model)
+    params = IndexParams(index_type=index_type, storage=storage)
+    with tempfile.TemporaryDirectory() as workdir:
+        if corpus:
+            paths = sorted(os.path.join(corpus, f) for f in os.listdir(corpus) if f.lower().endswith(".pdf"))
+        else:
+            paths = make_corpus(os.path.join(workdir, "pdfs"), files, pages)
+        report, _, _ = ingest(paths, embedder, params, batch_size, workdir)
+    report["embedder"] = model or "hashing"
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10, help="synthetic PDFs to generate")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--corpus", help="directory of existing PDFs to ingest instead")
+    parser.add_argument("--model", help="sentence-transformers model (default: offline hashing embedder)")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--storage", default="float32")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(args.files, args.pages, args.corpus, args.model, args.index_type, args.storage, args.batch_size)
+    write_report({"environment": environment(), "ingest": report}, args.out)
+
+
+if __name__ == "__main__":
+    main()
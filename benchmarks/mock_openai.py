@@ -0,0 +1,170 @@
+"""A local OpenAI-compatible chat completions server for tests and load runs.
+
+Answers `POST /v1/chat/completions` (plain and `stream=True`) by echoing the
+last user message, after a configurable latency, and can fail the first
+requests with a given status to exercise retries. Run from the repository
+root and point the app at it:
+
+    python benchmarks/mock_openai.py --port 8081 --latency 0.5 --fail-first 2
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8081/v1 python -m app.main chat
+
+`MockOpenAIServer` counts requests and client connections, so tests can
+check retries, coalescing, hedging and keep-alive.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Set, Tuple
+import argparse
+import json
+import sys
+import threading
+import time
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    block_on_close = False
+
+    def handle_error(self, request, client_address) -> None:
+        # clients dropping idle keep-alive connections is not an error here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockOpenAIServer:
+    """Threaded mock server; use as a context manager or `start`/`stop`.
+
+    Args:
+        latency: seconds before each response (or its first stream chunk).
+        first_latency: latency of the first request only, e.g. to trigger a
+            hedged request; defaults to `latency`.
+        fail_first: the first N requests get `fail_status`.
+        fail_status: status of those failures (429 sends `Retry-After`).
+        retry_after: `Retry-After` header value for 429s.
+    """
+
+    def __init__(self, latency: float = 0.0, first_latency: Optional[float] = None, fail_first: int = 0,
+                 fail_status: int = 429, retry_after: str = "0", host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.first_latency = latency if first_latency is None else first_latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.requests = 0
+        self.connections: Set[Tuple[str, int]] = set()
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _next(self, client: Tuple[str, int]) -> int:
+        with self._lock:
+            self.requests += 1
+            self.connections.add(client)
+            return self.requests
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _json(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": f"no route {self.path}"}})
+                    return
+                n = server._next(self.client_address)
+                time.sleep(server.first_latency if n == 1 else server.latency)
+                if n <= server.fail_first:
+                    headers = {"Retry-After": server.retry_after} if server.fail_status == 429 else {}
+                    error = {"message": "mock failure", "type": "rate_limit_error" if server.fail_status == 429
+                             else "server_error", "code": None}
+                    self._json(server.fail_status, {"error": error}, headers)
+                    return
+                prompt = body["messages"][-1]["content"]
+                reply = f"echo: {prompt[:200]}"
+                if body.get("stream"):
+                    self._stream(body["model"], reply)
+                    return
+                self._json(200, {
+                    "id": f"chatcmpl-mock-{n}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(reply.split()),
+                              "total_tokens": len(prompt.split()) + len(reply.split())},
+                })
+
+            def _stream(self, model: str, reply: str) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for word in reply.split(" "):
+                    chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [{"index": 0, "delta": {"content": word + " "},
+                                                          "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each response")
+    parser.add_argument("--fail-first", type=int, default=0, help="fail this many requests first")
+    parser.add_argument("--fail-status", type=int, default=429)
+    args = parser.parse_args()
+    server = MockOpenAIServer(args.latency, fail_first=args.fail_first, fail_status=args.fail_status,
+                              host=args.host, port=args.port)
+    print(f"Mock OpenAI server at {server.url} (set OPENAI_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
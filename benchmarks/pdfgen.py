@@ -0,0 +1,136 @@
+"""Synthetic multi-page PDF generator.
+
+Writes text-only PDFs (one Helvetica text object per page) without any PDF
+library, so benchmarks can build corpora of any size offline. The text is
+deterministic for a given seed: paragraphs of sentences drawn from a fixed
+pseudo-vocabulary with a Zipf-like word distribution, so chunking and
+embedding see realistic repetition. Run from the repository root:
+
+    python benchmarks/pdfgen.py out_dir --files 20 --pages 50
+"""
+
+from typing import List, Sequence
+import argparse
+import os
+import random
+
+LINE_CHARS = 90
+LINES_PER_PAGE = 60
+_SYLLABLES = [
+    "ka", "lo", "mi", "ra", "te", "su", "no", "vi", "ze", "pa", "do", "re",
+    "qui", "an", "el", "or", "um", "is", "ta", "be", "co", "fu", "ge", "hi",
+]
+
+
+def vocabulary(size: int = 5000, seed: int = 0) -> List[str]:
+    """`size` distinct pseudo-words."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+class TextGenerator:
+    """Deterministic filler text with a Zipf-like word frequency."""
+
+    def __init__(self, seed: int = 0, vocab_size: int = 5000):
+        self.rng = random.Random(seed)
+        self.words = vocabulary(vocab_size, seed=0)
+        self.weights = [1.0 / (rank + 1) for rank in range(len(self.words))]
+
+    def sentence(self) -> str:
+        words = self.rng.choices(self.words, self.weights, k=self.rng.randint(8, 20))
+        return " ".join(words).capitalize() + "."
+
+    def paragraph(self) -> str:
+        return " ".join(self.sentence() for _ in range(self.rng.randint(3, 6)))
+
+    def page_lines(self, lines: int = LINES_PER_PAGE, width: int = LINE_CHARS) -> List[str]:
+        """`lines` wrapped lines; every paragraph starts on a new line.
+
+        No blank lines: `pypdf` drops them on extraction anyway, as it does
+        for real documents.
+        """
+        out: List[str] = []
+        while len(out) < lines:
+            line = ""
+            for word in self.paragraph().split():
+                if len(line) + len(word) + 1 > width:
+                    out.append(line)
+                    line = word
+                else:
+                    line = f"{line} {word}" if line else word
+            out.append(line)
+        return out[:lines]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: Sequence[Sequence[str]]) -> None:
+    """Write a PDF with one page per entry of `pages` (lists of text lines)."""
+    n = len(pages)
+    # objects: 1 catalog, 2 page tree, 3 font, then (page, content) pairs
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        (
+            "<< /Type /Pages /Kids [" + " ".join(f"{4 + 2 * i} 0 R" for i in range(n)) + f"] /Count {n} >>"
+        ).encode("ascii"),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, lines in enumerate(pages):
+        body = ["BT", "/F1 10 Tf", "12 TL", "50 770 Td"]
+        body += [f"({_escape(line)}) Tj T*" for line in lines]
+        body.append("ET")
+        stream = "\n".join(body).encode("latin-1", "replace")
+        objects.append(
+            (
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+            ).encode("ascii")
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_corpus(out_dir: str, files: int = 10, pages: int = 20, lines_per_page: int = LINES_PER_PAGE,
+                seed: int = 0) -> List[str]:
+    """Write `files` PDFs of `pages` pages each into `out_dir`; returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    gen = TextGenerator(seed)
+    paths = []
+    for i in range(files):
+        path = os.path.join(out_dir, f"synthetic-{seed}-{i:04d}.pdf")
+        write_pdf(path, [gen.page_lines(lines_per_page) for _ in range(pages)])
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20, help="pages per file")
+    parser.add_argument("--lines", type=int, default=LINES_PER_PAGE, help="text lines per page")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = make_corpus(args.out_dir, args.files, args.pages, args.lines, args.seed)
+    size = sum(os.path.getsize(p) for p in paths)
+    print(f"Wrote {len(paths)} PDFs ({args.pages} pages each, {size / 1e6:.1f} MB) to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Query benchmark: retrieval and answer latency percentiles.
+
+Ingests a synthetic PDF corpus (see `benchmarks/ingest.py`), then times
+queries sampled from the corpus text through `SemanticRetriever.retrieve`,
+`RagAgent.answer` and the first token of `RagAgent.answer_stream`. The LLM
+is a `DummyLLM` whose `--llm-latency` and `--token-delay` stand in for a real
+model's response time. Run from the repository root:
+
+    python benchmarks/query.py --queries 500 --llm-latency 0.05 --concurrency 8 --out query.json
+
+The retriever's query cache and the agent's answer cache are disabled so
+every query does the full work. With `--concurrency N`, answers are also
+issued from N threads to report latency and throughput under load.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import environment, make_embedder, percentiles, write_report  # noqa: E402
+from benchmarks.ingest import ingest  # noqa: E402
+from benchmarks.pdfgen import make_corpus  # noqa: E402
+from app.agent.agent import RagAgent  # noqa: E402
+from app.agent.context import ContextBuilder  # noqa: E402
+from app.llm.llm_client import DummyLLM  # noqa: E402
+from app.retrieval.faiss_store import IndexParams  # noqa: E402
+from app.retrieval.retriever import SemanticRetriever  # noqa: E402
+
+
+def sample_queries(docs, n: int, seed: int = 0, words: int = 12) -> List[str]:
+    """`n` short word windows cut from random chunks."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        tokens = rng.choice(docs).text.split()
+        start = rng.randrange(max(1, len(tokens) - words))
+        queries.append(" ".join(tokens[start : start + words]))
+    return queries
+
+
+def _timed(fn, items) -> List[float]:
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _first_token(agent: RagAgent, query: str) -> None:
+    next(iter(agent.answer_stream(query)))
+
+
+def measure(store, docs, embedder, queries: int = 200, k: int = 5, llm_latency: float = 0.0,
+            token_delay: float = 0.0, concurrency: int = 0, seed: int = 0) -> dict:
+    """Latency percentiles for queries over an already built `store`."""
+    texts = sample_queries(docs, queries, seed)
+    retriever = SemanticRetriever(embedder, store, cache_size=0)
+    llm = DummyLLM(token_delay=token_delay, latency=llm_latency)
+    # threshold below any cosine score: every query goes to the LLM
+    agent = RagAgent(retriever, llm, top_k=k, similarity_threshold=-1.0, context_builder=ContextBuilder())
+    for text in texts[:5]:
+        agent.answer(text)  # warm caches, allocators and lazy imports
+
+    report = {
+        "queries": len(texts),
+        "k": k,
+        "llm_latency_ms": llm_latency * 1000,
+        "retrieve": percentiles(_timed(lambda q: retriever.retrieve(q, k=k), texts)),
+        "answer": percentiles(_timed(agent.answer, texts)),
+        "first_token": percentiles(_timed(lambda q: _first_token(agent, q), texts)),
+    }
+    if concurrency > 1:
+        def one(query: str) -> float:
+            start = time.perf_counter()
+            agent.answer(query)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = list(pool.map(one, texts))
+        wall = time.perf_counter() - start
+        report["answer_concurrent"] = dict(
+            percentiles(samples), concurrency=concurrency, qps=round(len(texts) / wall, 1)
+        )
+    return report
+
+
+def run(files: int = 10, pages: int = 20, queries: int = 200, k: int = 5, model: Optional[str] = None,
+        index_type: str = "flat", storage: str = "float32", llm_latency: float = 0.0,
+        token_delay: float = 0.0, concurrency: int = 0) -> dict:
+    embedder = make_embedder(model)
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = make_corpus(os.path.join(workdir, "pdfs"), files, pages)
+        ingested, store, docs = ingest(paths, embedder, IndexParams(index_type=index_type, storage=storage),
+                                       256, workdir)
+        report = measure(store, docs, embedder, queries, k, llm_latency, token_delay, concurrency)
+    report.update(chunks=ingested["chunks"], index=ingested["index"], embedder=model or "hashing")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--model", help="sentence-transformers model (default: offline hashing embedder)")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--storage", default="float32")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="DummyLLM seconds before replying")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="DummyLLM seconds between streamed words")
+    parser.add_argument("--concurrency", type=int, default=0, help="also run answers from this many threads")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(args.files, args.pages, args.queries, args.k, args.model, args.index_type, args.storage,
+                 args.llm_latency, args.token_delay, args.concurrency)
+    write_report({"environment": environment(), "query": report}, args.out)
+
+
+if __name__ == "__main__":
+    main()
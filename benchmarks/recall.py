@@ -0,0 +1,147 @@
+"""Recall benchmark: approximate index configurations against exact search.
+
+Every configuration is built over the same vectors and its top-`k` ids are
+compared with an exact float32 `IndexFlatIP` on held-out queries. Run from
+the repository root:
+
+    python benchmarks/recall.py --n 100000 --config hnsw:ef_search=32 --config ivf_pq:nprobe=32
+
+A configuration is `index_type[/storage][:param=value,...]` with any
+`IndexParams` field, e.g. `hnsw/int8:rerank_factor=4,ef_search=128`. Without
+`--config` a default sweep over HNSW, IVF and the storage modes runs.
+Vectors are clustered synthetic unit vectors, or with `--corpus-files` the
+embedded chunks of a synthetic PDF corpus (queries are then sampled from the
+corpus text).
+
+Reported per configuration: `recall_at_k`, query latency percentiles,
+`build_seconds`, the store's `bytes_per_vector` estimate, the measured
+`index_bytes_per_vector` and the `disk_bytes_per_vector` of a re-ranking copy.
+"""
+
+from dataclasses import fields
+from typing import List, Optional, Sequence
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import clustered_vectors, environment, make_embedder, percentiles, write_report  # noqa: E402
+from app.core.models import Document  # noqa: E402
+from app.retrieval.faiss_store import FaissVectorStore, IndexParams  # noqa: E402
+
+DEFAULT_CONFIGS = [
+    "hnsw:ef_search=16",
+    "hnsw:ef_search=64",
+    "hnsw:ef_search=256",
+    "ivf_flat:nprobe=4",
+    "ivf_flat:nprobe=16",
+    "ivf_pq:nprobe=16",
+    "ivf_pq:nprobe=16,rerank_factor=4",
+    "flat/int8",
+    "hnsw/int8:rerank_factor=4",
+]
+
+
+def parse_config(spec: str, **defaults) -> IndexParams:
+    """`IndexParams` from `index_type[/storage][:param=value,...]`."""
+    head, _, tail = spec.partition(":")
+    index_type, _, storage = head.partition("/")
+    kwargs = dict(defaults, index_type=index_type)
+    if storage:
+        kwargs["storage"] = storage
+    types = {f.name: f.type for f in fields(IndexParams)}
+    for pair in filter(None, tail.split(",")):
+        key, _, value = pair.partition("=")
+        if key not in types:
+            raise ValueError(f"unknown IndexParams field {key!r} in {spec!r}")
+        kwargs[key] = value if types[key] in (str, "str") else int(value)
+    return IndexParams(**kwargs)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    return exact.search(queries, k)[1]
+
+
+def evaluate(params: IndexParams, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """Build a store with `params` over `vectors` and score it against `truth`."""
+    n, dim = vectors.shape
+    docs = [Document(id=str(i), text="", metadata={}, source="bench") for i in range(n)]
+    start = time.perf_counter()
+    store = FaissVectorStore(dim, params)
+    store.add(docs, vectors, normalized=True)
+    store.build()
+    build = time.perf_counter() - start
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = store.search(query, k, normalized=True)
+        latencies.append(time.perf_counter() - start)
+        hits += len({d.id for d, _ in found} & {str(i) for i in expected if i >= 0})
+    return {
+        "index": f"{store.index_type}/{store.storage}",
+        "recall_at_k": round(hits / truth.size, 4),
+        "query": percentiles(latencies),
+        "build_seconds": round(build, 3),
+        "bytes_per_vector": store.bytes_per_vector(),
+        "index_bytes_per_vector": round(len(faiss.serialize_index(store.index)) / n, 1),
+        "disk_bytes_per_vector": 4 * dim if store.full is not None else 0,
+    }
+
+
+def corpus_vectors(files: int, pages: int, queries: int, model: Optional[str]):
+    """Embedded chunks of a synthetic PDF corpus plus queries cut from it."""
+    from benchmarks.ingest import ingest
+    from benchmarks.pdfgen import make_corpus
+    from benchmarks.query import sample_queries
+
+    embedder = make_embedder(model)
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = make_corpus(os.path.join(workdir, "pdfs"), files, pages)
+        _, _, docs = ingest(paths, embedder, IndexParams(), 256, workdir)
+    vectors = embedder.embed_array([d.text for d in docs], normalize=True)
+    return vectors, embedder.embed_array(sample_queries(docs, queries, seed=1), normalize=True)
+
+
+def run(configs: Sequence[str] = DEFAULT_CONFIGS, n: int = 20_000, dim: int = 384, k: int = 10,
+        queries: int = 200, corpus_files: int = 0, corpus_pages: int = 20, model: Optional[str] = None,
+        **defaults) -> dict:
+    if corpus_files:
+        vectors, qs = corpus_vectors(corpus_files, corpus_pages, queries, model)
+        source = f"corpus ({corpus_files} files x {corpus_pages} pages)"
+    else:
+        vectors, qs = clustered_vectors(n, dim), clustered_vectors(queries, dim, seed=1)
+        source = "clustered"
+    truth = exact_top_k(vectors, qs, k)
+    results = {spec: evaluate(parse_config(spec, **defaults), vectors, qs, truth, k) for spec in configs}
+    return {"vectors": len(vectors), "dim": vectors.shape[1], "source": source, "k": k,
+            "queries": len(qs), "configs": results}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", action="append", help="index configuration; repeat for several")
+    parser.add_argument("--n", type=int, default=20_000, help="synthetic vectors")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--corpus-files", type=int, default=0, help="embed a synthetic PDF corpus instead")
+    parser.add_argument("--corpus-pages", type=int, default=20)
+    parser.add_argument("--model", help="sentence-transformers model for --corpus-files")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+    report = run(args.config or DEFAULT_CONFIGS, args.n, args.dim, args.k, args.queries,
+                 args.corpus_files, args.corpus_pages, args.model)
+    write_report({"environment": environment(), "recall": report}, args.out)
+
+
+if __name__ == "__main__":
+    main()
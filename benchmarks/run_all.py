@@ -0,0 +1,69 @@
+"""Run the ingest, query and recall benchmarks and write one JSON report.
+
+Everything runs offline on CPU with the synthetic corpus and the hashing
+embedder, so reports from different commits on the same machine are
+comparable with `benchmarks/compare.py`. Run from the repository root:
+
+    python benchmarks/run_all.py --out bench-$(git rev-parse --short HEAD).json
+    python benchmarks/compare.py bench-old.json bench-new.json
+
+`--quick` shrinks every workload to a smoke test that finishes in seconds.
+"""
+
+from typing import List, Optional
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import ingest, query, recall  # noqa: E402
+from benchmarks.common import environment, write_report  # noqa: E402
+
+
+def run(files: int = 10, pages: int = 20, queries: int = 200, vectors: int = 20_000,
+        index_type: str = "flat", llm_latency: float = 0.02, concurrency: int = 4,
+        recall_configs: Optional[List[str]] = None) -> dict:
+    start = time.perf_counter()
+    report = {
+        "environment": environment(),
+        "settings": {
+            "files": files,
+            "pages": pages,
+            "queries": queries,
+            "vectors": vectors,
+            "index_type": index_type,
+            "llm_latency": llm_latency,
+            "concurrency": concurrency,
+        },
+        "ingest": ingest.run(files, pages, index_type=index_type),
+        "query": query.run(files, pages, queries, index_type=index_type, llm_latency=llm_latency,
+                           concurrency=concurrency),
+        "recall": recall.run(recall_configs or recall.DEFAULT_CONFIGS, n=vectors, queries=min(queries, 200)),
+    }
+    report["wall_seconds"] = round(time.perf_counter() - start, 2)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10, help="synthetic PDFs")
+    parser.add_argument("--pages", type=int, default=20, help="pages per PDF")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--vectors", type=int, default=20_000, help="synthetic vectors for the recall sweep")
+    parser.add_argument("--index-type", default="flat", help="index for the ingest and query runs")
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="DummyLLM seconds before replying")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--quick", action="store_true", help="tiny workloads, for smoke testing")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    if args.quick:
+        args.files, args.pages, args.queries, args.vectors = 2, 3, 20, 2000
+    report = run(args.files, args.pages, args.queries, args.vectors, args.index_type, args.llm_latency,
+                 args.concurrency)
+    write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Startup-time benchmark: import cost and first-query latency.
+
+Every measurement runs in a fresh interpreter so module caches never hide
+import time. Run from the repository root:
+
+    python benchmarks/startup.py --repeat 3 --out startup.json
+
+Reported timings (seconds, median over `--repeat` runs):
+
+- `cli_help`: wall time of `python -m app.main --help`, interpreter included.
+- `import_cli`: `import app.main`.
+- `import_server`: `import app.web.server` (settings, registry, executors).
+- `server_warm_up`: `server.warm_up()`, i.e. model import + load + one embedding.
+- `build_components`: `app.main.build_components()` (dimension lookup, no model load).
+- `first_query` / `second_query`: `retriever.retrieve(...)` right after
+  `build_components`, cold and then warm.
+
+The embedding cache is pointed at a scratch file so the first query always
+reaches the model. A step that fails (for example because the model cannot
+be downloaded) is reported with its error instead of a timing.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_CLI = """
+import json, time
+t = time.perf_counter()
+import app.main
+print(json.dumps({"import_cli": time.perf_counter() - t}))
+"""
+
+_SERVER = """
+import json, time
+t = time.perf_counter()
+import app.web.server as server
+t1 = time.perf_counter()
+server.warm_up()
+result = {"import_server": t1 - t}
+if server.warm_up_error:
+    result["error"] = server.warm_up_error
+else:
+    result["server_warm_up"] = time.perf_counter() - t1
+print(json.dumps(result))
+"""
+
+_FIRST_QUERY = """
+import json, time
+from app.main import build_components
+t = time.perf_counter()
+settings, embedder, store, retriever, llm, agent = build_components()
+t1 = time.perf_counter()
+retriever.retrieve("what is this document about?", k=5)
+t2 = time.perf_counter()
+retriever.retrieve("which sections mention results?", k=5)
+t3 = time.perf_counter()
+print(json.dumps({"build_components": t1 - t, "first_query": t2 - t1, "second_query": t3 - t2}))
+"""
+
+_STEPS = [
+    ("cli_help", [sys.executable, "-m", "app.main", "--help"]),
+    ("import_cli", _IMPORT_CLI),
+    ("server", _SERVER),
+    ("first_query", _FIRST_QUERY),
+]
+
+
+def _run(code_or_args, env) -> dict:
+    args = code_or_args if isinstance(code_or_args, list) else [sys.executable, "-c", code_or_args]
+    start = time.perf_counter()
+    proc = subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        lines = (proc.stderr or proc.stdout).strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {proc.returncode}"}
+    if isinstance(code_or_args, list):
+        return {"cli_help": wall}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(repeat: int = 3) -> dict:
+    samples: dict = {}
+    errors: dict = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for i in range(repeat):
+            env = dict(
+                os.environ,
+                EMBEDDING_CACHE_PATH=os.path.join(scratch, f"cache-{i}.sqlite"),
+                STORE_REGISTRY_DIR=os.path.join(scratch, f"stores-{i}"),
+            )
+            for name, step in _STEPS:
+                result = _run(step, env)
+                if "error" in result:
+                    errors[name] = result.pop("error")
+                for key, seconds in result.items():
+                    samples.setdefault(name, []).append(seconds)
+    report = {name: round(statistics.median(values), 4) for name, values in samples.items()}
+    return {"repeat": repeat, "python": sys.version.split()[0], "timings": report, "errors": errors}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="fresh-interpreter runs per measurement")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(args.repeat)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Storage-mode benchmark: memory per vector versus recall.
+
+Builds one `FaissVectorStore` per storage mode over the same synthetic,
+clustered unit vectors and compares it with exact float32 search (a sweep of
+`benchmarks/recall.py` over `STORAGE_TYPES`). Run from the repository root:
+
+    python benchmarks/storage.py --n 50000 --dim 384 --index-type flat --out storage.json
+
+Reported per mode (with and without the full-precision re-ranking copy):
+
+- `bytes_per_vector`: the store's estimate, as used by the web server's
+  memory budget.
+- `index_bytes_per_vector`: measured size of the serialized FAISS index.
+- `disk_bytes_per_vector`: the memory-mapped float32 copy, if kept.
+- `recall_at_k`: overlap of the top-`k` ids with exact search.
+- `query`: single-query latency percentiles.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import clustered_vectors, environment, write_report  # noqa: E402
+from benchmarks.recall import evaluate, exact_top_k  # noqa: E402
+from app.retrieval.faiss_store import STORAGE_TYPES, IndexParams  # noqa: E402
+
+
+def run(n: int, dim: int, index_type: str, k: int, queries: int, rerank_factor: int, pq_m: int) -> dict:
+    vecs = clustered_vectors(n, dim)
+    qs = clustered_vectors(queries, dim, seed=1)
+    truth = exact_top_k(vecs, qs, k)
+
+    modes = {}
+    for storage in STORAGE_TYPES:
+        for factor in sorted({0, rerank_factor}):
+            if storage == "float32" and factor:
+                continue
+            params = IndexParams(index_type=index_type, storage=storage, rerank_factor=factor, pq_m=pq_m)
+            name = storage if not factor else f"{storage}+rerank{factor}"
+            modes[name] = evaluate(params, vecs, qs, truth, k)
+    return {"n": n, "dim": dim, "index_type": index_type, "k": k, "queries": queries, "modes": modes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=20_000, help="vectors in the corpus")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--index-type", default="flat", choices=["flat", "hnsw", "ivf_flat"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--pq-m", type=int, default=48, help="PQ sub-quantizers (must divide --dim)")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(args.n, args.dim, args.index_type, args.k, args.queries, args.rerank_factor, args.pq_m)
+    write_report({"environment": environment(), "storage": report}, args.out)
+
+
+if __name__ == "__main__":
+    main()
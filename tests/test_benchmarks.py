@@ -0,0 +1,32 @@
+from app.ingestion.pdf_loader import PdfLoader
+from benchmarks import compare, ingest, query, recall
+from benchmarks.pdfgen import make_corpus
+
+
+def test_synthetic_pdfs_round_trip_through_loader(tmp_path):
+    paths = make_corpus(str(tmp_path), files=2, pages=3, lines_per_page=20)
+    pages = PdfLoader().extract(paths[0])
+    assert [p for p, _ in pages] == [1, 2, 3]
+    assert all(len(text.split()) > 100 for _, text in pages)
+    # deterministic: the same seed writes the same bytes
+    again = make_corpus(str(tmp_path / "again"), files=1, pages=3, lines_per_page=20)
+    assert open(again[0], "rb").read() == open(paths[0], "rb").read()
+
+
+def test_benchmarks_report_every_stage_and_metric():
+    report = ingest.run(files=1, pages=2)
+    assert set(report["stages"]) == {"extract", "chunk", "embed", "add", "persist"}
+    assert report["stages"]["extract"]["items"] == 2 and report["chunks"] > 0
+
+    latencies = query.run(files=1, pages=2, queries=10, concurrency=2)
+    for section in ("retrieve", "answer", "first_token", "answer_concurrent"):
+        assert latencies[section]["p50_ms"] <= latencies[section]["p99_ms"]
+
+    sweep = recall.run(["flat", "hnsw/float16:ef_search=8"], n=500, queries=10)
+    assert sweep["configs"]["flat"]["recall_at_k"] == 1.0
+    assert recall.parse_config("ivf_pq:nprobe=4,pq_m=8").pq_m == 8
+
+    slower = {"query": {"answer": {"p99_ms": 20.0}, "answer_concurrent": {"qps": 50.0}}}
+    faster = {"query": {"answer": {"p99_ms": 10.0}, "answer_concurrent": {"qps": 100.0}}}
+    assert not any(row["regression"] for row in compare.compare(slower, faster).values())
+    assert all(row["regression"] for row in compare.compare(faster, slower).values())
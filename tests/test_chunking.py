@@ -1,4 +1,6 @@
-from app.ingestion.pdf_loader import chunk_text
+import pytest
+
+from app.ingestion.pdf_loader import PdfLoader, TokenSizer, chunk_text, iter_chunks
 
 
 def test_chunk_text_basic():
@@ -7,3 +9,59 @@ def test_chunk_text_basic():
     assert len(chunks) >= 1
     for c in chunks:
         assert isinstance(c, str)
+
+
+def _pages(n):
+    return [(p, "\n\n".join(f"page {p} paragraph {i} " + "word " * (i * 7 % 30) for i in range(6))) for p in range(1, n + 1)]
+
+
+def _paragraphs(text):
+    return "\n\n".join(p.strip() for p in text.split("\n\n") if p.strip())
+
+
+def test_chunks_record_pages_and_offsets_and_stream():
+    pages = _pages(5)
+    text_of = dict(pages)
+    consumed = []
+
+    def stream():
+        for page in pages:
+            consumed.append(page[0])
+            yield page
+
+    chunks = iter_chunks(stream(), chunk_size=200, overlap=40)
+    first = next(chunks)
+    assert consumed == [1]  # pages are pulled lazily
+    chunks = [first] + list(chunks)
+    assert all(len(c.text) <= 200 for c in chunks)
+    for c in chunks:
+        # the offsets select exactly the chunk's paragraphs, up to separators
+        span = [text_of[p] for p in range(c.page_start, c.page_end + 1)]
+        span[-1] = span[-1][:c.char_end]
+        span[0] = span[0][c.char_start:]
+        assert c.text == _paragraphs("\n\n".join(span))
+    assert any(c.page_start < c.page_end for c in iter_chunks(pages, chunk_size=1000, overlap=0))
+
+    long_para = "x" * 450
+    windows = list(iter_chunks([(3, long_para)], chunk_size=200, overlap=50))
+    assert [(c.char_start, c.char_end) for c in windows] == [(0, 200), (150, 350), (300, 450)]
+    assert all(c.page_start == c.page_end == 3 for c in windows)
+
+    docs = PdfLoader(chunk_size=200, chunk_overlap=40).chunk("a.pdf", pages)
+    assert [d.text for d in docs] == [c.text for c in chunks]
+    assert docs[0].metadata == {"chunk_index": 0, "page": 1, "page_start": 1, "page_end": 1,
+                                "char_start": 0, "char_end": chunks[0].char_end}
+
+
+def test_token_sizing_keeps_chunks_within_the_token_limit():
+    tokenizers = pytest.importorskip("tokenizers")
+    transformers = pytest.importorskip("transformers")
+    backend = tokenizers.Tokenizer(tokenizers.models.WordLevel({"[UNK]": 0}, unk_token="[UNK]"))
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    sizer = TokenSizer(transformers.PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="[UNK]"))
+
+    pages = _pages(3) + [(4, "long " * 100)]
+    chunks = list(iter_chunks(pages, chunk_size=32, overlap=8, sizer=sizer))
+    assert all(sizer.length(c.text) <= 32 for c in chunks)
+    windows = [c for c in chunks if c.page_start == 4]
+    assert len(windows) == 4 and windows[1].char_start < windows[0].char_end  # 100 tokens, step 24
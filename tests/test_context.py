@@ -0,0 +1,82 @@
+import numpy as np
+
+from app.agent.agent import RagAgent
+from app.agent.context import ContextBuilder, budget_for_model, suffix_prefix_overlap
+from app.core.metrics import CONTEXT_TOKENS_SAVED, trace
+from app.core.models import Document
+from app.llm.llm_client import DummyLLM
+from app.retrieval.faiss_store import FaissVectorStore
+
+
+def _doc(i, text, source="a.pdf"):
+    return Document(id=str(i), text=text, metadata={"chunk_index": i}, source=source)
+
+
+def test_overlapping_chunks_merge_and_duplicates_drop():
+    para = " ".join(f"word{i}" for i in range(120))
+    first, second = para[:400], para[300:]
+    results = [
+        (_doc(0, first), 0.9),
+        (_doc(1, second), 0.8),
+        (_doc(7, "an unrelated passage about shipping costs"), 0.7),
+        (_doc(3, "an unrelated passage about shipping costs!", source="b.pdf"), 0.6),
+    ]
+    embeddings = np.array([[1, 0, 0], [0.8, 0.6, 0], [0, 0, 1], [0, 0.01, 1]], dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    observed = CONTEXT_TOKENS_SAVED.count()
+    with trace() as timings:
+        packed = ContextBuilder(budget=10_000).build(results, embeddings)
+
+    assert packed.duplicates_dropped == 1 and packed.chunks_merged == 1
+    assert para + "\n---" in packed.text and packed.text.count("Source:") == 2
+    assert packed.tokens_saved > 0
+    # reported per request and in the process-wide histogram
+    assert timings.breakdown()["values"] == {"context_tokens_saved": packed.tokens_saved}
+    assert CONTEXT_TOKENS_SAVED.count() == observed + 1
+
+
+def test_packing_respects_the_budget():
+    results = [(_doc(i * 2, f"chunk {i} " + "x" * 400), 1.0 - i / 10) for i in range(5)]
+    builder = ContextBuilder(budget=250, mmr_lambda=1.0, duplicate_threshold=1.0)
+
+    packed = builder.build(results)
+
+    assert packed.tokens <= 250 and packed.chunks_used == 2
+    assert "chunk 0" in packed.text and "chunk 1" in packed.text
+    assert builder.stats()["tokens_saved"] == packed.tokens_saved > 0
+    # a budget below one chunk still yields the truncated best chunk
+    tiny = ContextBuilder(budget=40, mmr_lambda=1.0, duplicate_threshold=1.0).build(results)
+    assert tiny.tokens <= 40 and "chunk 0" in tiny.text
+
+
+def test_helpers():
+    assert suffix_prefix_overlap("abcdefghij" * 5, "ghij" + "abcdefghij" * 3 + "tail", 10) == 34
+    assert suffix_prefix_overlap("short", "other text entirely", 5) == 0
+    assert budget_for_model("gpt-4o-mini") == budget_for_model("gpt-4o") != budget_for_model("gpt-4")
+
+
+def test_blocks_cite_their_page_range():
+    docs = [Document(id=str(i), text=f"part {i}", source="a.pdf",
+                     metadata={"chunk_index": i, "page_start": i + 2, "page_end": i + 2}) for i in range(2)]
+    packed = ContextBuilder(budget=1000, duplicate_threshold=1.0).build([(docs[0], 0.9), (docs[1], 0.8)])
+    assert packed.text.startswith("Source: a.pdf, pp. 2-3 (score=0.900)")
+
+
+def test_agent_dedups_with_the_stored_chunk_vectors():
+    class _Retriever:
+        def __init__(self, store):
+            self.store = store
+            self.embedder = None  # chunks must not be re-embedded
+
+        def retrieve(self, query, k, filter=None):
+            return self.store.search([1.0, 0.0, 0.0], k)
+
+    store = FaissVectorStore(3)
+    texts = ["refunds take five days", "refunds take five days.", "shipping is free over 50 euros"]
+    store.add([_doc(i, t, source=f"{i}.pdf") for i, t in enumerate(texts)],
+              np.array([[1, 0, 0], [1, 0.01, 0], [0.6, 0.8, 0]], dtype=np.float32))
+    agent = RagAgent(_Retriever(store), DummyLLM(), top_k=3, context_builder=ContextBuilder(budget=1000))
+
+    answer = agent.answer("refunds?")
+    assert answer.count("refunds take five days") == 1 and "shipping" in answer
@@ -0,0 +1,91 @@
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+from app.core.models import Document
+from app.retrieval.doc_store import DocStore
+from app.retrieval.faiss_store import FaissVectorStore
+from app.retrieval.filters import matches, normalize_filter
+
+
+def _doc(i, source="a.pdf"):
+    return Document(id=f"id-{i}", text=f"chunk {i} é", metadata={"chunk_index": i}, source=source)
+
+
+def test_round_trip_append_and_without(tmp_path):
+    directory = str(tmp_path / "x.docs")
+    store = DocStore([_doc(i, "a.pdf" if i % 2 else "b.pdf") for i in range(5)])
+    store.persist(directory)
+
+    loaded = DocStore.load(directory)
+    assert len(loaded) == 5
+    assert loaded[3] == _doc(3, "a.pdf")
+    assert loaded.source_at(4) == "b.pdf"
+
+    loaded.extend([_doc(5), _doc(6)])
+    assert loaded.position_of("id-6") == 6
+    copy = loaded.without([0, 4, 6])
+    assert [d.id for d in copy] == ["id-1", "id-2", "id-3", "id-5"] and len(loaded) == 7
+    assert copy[1] == _doc(2, "b.pdf") and copy.source_at(2) == "a.pdf"
+    loaded = loaded.without([1, 5])
+    assert [d.id for d in loaded] == ["id-0", "id-2", "id-3", "id-4", "id-6"]
+
+    loaded.persist(directory)
+    again = DocStore.load(directory)
+    assert list(again) == list(loaded)
+    assert again[-1] == _doc(6)
+
+
+def test_store_reads_legacy_pickled_meta(tmp_path):
+    path = str(tmp_path / "legacy")
+    store = FaissVectorStore(4)
+    docs = [_doc(i) for i in range(3)]
+    store.add(docs, np.eye(3, 4, dtype="float32"))
+    store.persist(path)
+    # simulate an index written before the columnar store existed
+    shutil.rmtree(path + ".docs")
+    with open(path + ".meta", "wb") as f:
+        pickle.dump(docs, f)
+
+    legacy = FaissVectorStore(4)
+    legacy.load(path)
+    assert legacy.search(np.eye(1, 4, 2, dtype="float32")[0], k=1)[0][0] == docs[2]
+
+
+def test_select_uses_postings_across_persist_extend_and_without(tmp_path):
+    directory = str(tmp_path / "x.docs")
+    store = DocStore([_doc(i, "a.pdf" if i % 2 else "b.pdf") for i in range(6)])
+    odd_small = normalize_filter({"source": "a.pdf", "chunk_index": [1, 3, 7]})
+    assert list(store.select(odd_small)) == [1, 3]
+
+    store.persist(directory)
+    loaded = DocStore.load(directory)
+    assert "chunk_index" in loaded._base_postings  # metadata index was persisted
+    loaded.extend([_doc(7, "a.pdf"), _doc(8, "a.pdf")])
+    assert list(loaded.select(odd_small)) == [1, 3, 6]
+    loaded = loaded.without([0])
+    assert list(loaded.select(odd_small)) == [0, 2, 5]
+    assert list(loaded.select(normalize_filter({"missing": 1}))) == []
+
+
+def test_numbers_match_by_value_and_booleans_stay_apart(tmp_path):
+    metadata = [{"page": 3}, {"page": 3.0}, {"page": 4, "flag": True}, {"page": 5, "flag": 1}]
+    docs = [Document(id=str(i), text="", metadata=m, source="a.pdf") for i, m in enumerate(metadata)]
+    store = DocStore(docs)
+    for value in (3, 3.0, [3.0, 7]):
+        assert list(store.select(normalize_filter({"page": value}))) == [0, 1]
+    assert list(store.select(normalize_filter({"flag": True}))) == [2]
+    assert list(store.select(normalize_filter({"flag": 1.0}))) == [3]
+    assert [matches(d, normalize_filter({"page": 3.0})) for d in docs] == [True, True, False, False]
+
+    # postings persisted under the old encoding are re-keyed on load
+    directory = str(tmp_path / "x.docs")
+    store.persist(directory)
+    with open(os.path.join(directory, "postings.json"), encoding="utf-8") as f:
+        keys = json.load(f)
+    with open(os.path.join(directory, "postings.json"), "w", encoding="utf-8") as f:
+        json.dump([[field, "3.0" if [field, value] == ["page", "3"] else value] for field, value in keys], f)
+    assert list(DocStore.load(directory).select(normalize_filter({"page": 3}))) == [0, 1]
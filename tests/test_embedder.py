@@ -0,0 +1,62 @@
+"""SentenceEmbedder startup: nothing is loaded until first use, and the
+dimension comes from the model's config files. Encoding is batched by token
+length without changing the output order."""
+
+import json
+
+import numpy as np
+import pytest
+
+from app.embeddings.embedder import SentenceEmbedder, model_config_dimension, token_budget_batches
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data))
+
+
+def _fake_model(root, dense=None):
+    modules = [
+        {"idx": 0, "name": "0", "path": "", "type": "sentence_transformers.models.Transformer"},
+        {"idx": 1, "name": "1", "path": "1_Pooling", "type": "sentence_transformers.models.Pooling"},
+    ]
+    _write(root / "1_Pooling" / "config.json", {"word_embedding_dimension": 384, "pooling_mode_mean_tokens": True})
+    if dense:
+        modules.append({"idx": 2, "name": "2", "path": "2_Dense", "type": "sentence_transformers.models.Dense"})
+        _write(root / "2_Dense" / "config.json", {"in_features": 384, "out_features": dense})
+    _write(root / "modules.json", modules)
+    return str(root)
+
+
+def test_dimension_read_from_config_without_loading(tmp_path):
+    embedder = SentenceEmbedder(_fake_model(tmp_path / "mini"))
+    assert embedder.dimension == 384
+    assert not embedder.loaded
+    assert model_config_dimension(_fake_model(tmp_path / "dense", dense=128)) == 128
+    assert model_config_dimension(str(tmp_path / "missing")) is None
+
+
+def test_batches_bucket_by_length_within_token_budget():
+    lengths = [10, 200, 12, 190, 11, 50, 9, 100]
+    batches = token_budget_batches(lengths, batch_tokens=400, max_batch_size=3)
+    assert sorted(int(i) for b in batches for i in b) == list(range(8))
+    for batch in batches:
+        sizes = [lengths[i] for i in batch]
+        assert len(batch) <= 3 and len(batch) * max(sizes) <= 400
+        assert min(sizes) >= 0.8 * max(sizes)
+    assert [list(b) for b in batches][:2] == [[1, 3], [7]]
+
+
+def test_bucketed_encoding_keeps_input_order(tmp_path):
+    pytest.importorskip("sentence_transformers")
+    from benchmarks.common import make_random_model, random_texts
+
+    path = make_random_model(str(tmp_path / "tiny"), layers=1, hidden=32, heads=2, vocab=100)
+    texts = random_texts(40, vocab=100)
+    embedder = SentenceEmbedder(path, batch_tokens=256, max_batch_size=8)
+    assert len(embedder.batches(texts)) > 5
+    bucketed = embedder.embed_array(texts, normalize=True)
+    one_by_one = np.stack([embedder.model.encode([t], normalize_embeddings=True)[0] for t in texts])
+    assert bucketed.dtype == np.float32 and bucketed.flags["C_CONTIGUOUS"]
+    assert np.allclose(bucketed, one_by_one, atol=1e-5)
+    assert embedder.embed_array([]).shape == (0, 32)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from app.config.config import get_settings
+from app.core.interfaces import Embedder
+from app.embeddings.cache import CachedEmbedder
+
+
+class CountingEmbedder(Embedder):
+    model_name = "counting"
+
+    def __init__(self):
+        self.seen = []
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def embed(self, texts):
+        texts = list(texts)
+        self.seen.extend(texts)
+        return [[float(len(t)), 1.0, float(t.count("a"))] for t in texts]
+
+
+def test_batches_only_send_misses(tmp_path):
+    inner = CountingEmbedder()
+    cache = CachedEmbedder(inner, str(tmp_path / "c.sqlite"), memory_items=10)
+
+    first = cache.embed_array(["a b", "banana", "a  b"])
+    # "a  b" normalizes to "a b", so only two texts reach the model
+    assert inner.seen == ["a b", "banana"]
+    assert np.array_equal(first[0], first[2])
+
+    second = cache.embed_array(["banana", "new"], normalize=True)
+    assert inner.seen[-1] == "new" and len(inner.seen) == 3
+    assert np.allclose(np.linalg.norm(second, axis=1), 1.0)
+    assert cache.stats()["memory_hits"] == 1 and cache.misses == 4
+
+
+def test_disk_cache_survives_restart_and_evicts(tmp_path):
+    path = str(tmp_path / "new-dir" / "c.sqlite")  # the directory is created
+    cache = CachedEmbedder(CountingEmbedder(), path, max_disk_items=3)
+    cache.embed_array(["one", "two", "three", "four"])
+    assert cache.stats()["disk_items"] == 3
+    cache.close()
+    assert cache.inner.closed
+
+    inner = CountingEmbedder()
+    reopened = CachedEmbedder(inner, path)
+    reopened.embed_array(["four"])
+    assert inner.seen == [] and reopened.disk_hits == 1
+
+
+def test_default_cache_lives_next_to_the_index(monkeypatch, tmp_path):
+    monkeypatch.delenv("EMBEDDING_CACHE_PATH", raising=False)
+    monkeypatch.setenv("FAISS_INDEX_PATH", str(tmp_path / "corpus" / "faiss.index"))
+    assert get_settings().embedding_cache_path == str(tmp_path / "corpus" / "faiss.index.embeddings.sqlite")
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", "")
+    assert get_settings().embedding_cache_path == ""
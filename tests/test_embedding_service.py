@@ -0,0 +1,118 @@
+"""The shared embedding service batches concurrent clients' requests."""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.core.interfaces import Embedder
+from app.embeddings.service import EmbeddingClient, EmbeddingServer, MicroBatcher, read_frame, write_frames
+
+
+class _RecordingEmbedder(Embedder):
+    model_name = "recording"
+    dimension = 3
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_array(self, texts, normalize=False):
+        texts = list(texts)
+        if "boom" in texts:
+            raise ValueError("cannot embed boom")
+        with self._lock:
+            self.calls.append(len(texts))
+        time.sleep(self.delay)
+        out = np.array([[len(t), t.count("a"), 1.0] for t in texts], dtype=np.float32)
+        if normalize:
+            out /= np.linalg.norm(out, axis=1, keepdims=True)
+        return out
+
+
+def test_concurrent_requests_share_encoder_calls(tmp_path):
+    inner = _RecordingEmbedder()
+    path = str(tmp_path / "embed.sock")
+    with EmbeddingServer(inner, path, max_batch=16, max_wait=0.01) as server:
+        client = EmbeddingClient(path)
+        assert client.dimension == 3 and client.model_name == "recording"
+
+        texts = ["a" * i for i in range(1, 41)]
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(lambda t: client.embed_array([t], normalize=True), texts))
+        calls = list(inner.calls)
+        assert np.allclose(np.vstack(results), inner.embed_array(texts, normalize=True))
+        # 40 single-text requests took far fewer encoder calls, none above the cap
+        assert sum(calls) == 40 and len(calls) <= 10 and max(calls) <= 16
+        assert server.batcher.stats()["requests"] == 40
+
+        assert client.embed_array(["x", "yy"]).tolist() == [[1, 0, 1], [2, 0, 1]]
+        assert client.embed_array([]).shape == (0, 3)
+        with pytest.raises(RuntimeError, match="cannot embed boom"):
+            client.embed_array(["boom"])
+        # the connection survives a failed request
+        assert client.embed(["aa"]) == [[2.0, 2.0, 1.0]]
+
+    # the client reconnects to a restarted service
+    with EmbeddingServer(inner, path):
+        assert client.embed(["a"]) == [[1.0, 1.0, 1.0]]
+
+
+def test_a_failing_request_does_not_fail_its_batch(tmp_path):
+    inner = _RecordingEmbedder()
+    path = str(tmp_path / "embed.sock")
+    with EmbeddingServer(inner, path, max_batch=64, max_wait=0.05):
+        client = EmbeddingClient(path)
+
+        def embed(text):
+            try:
+                return client.embed([text])
+            except RuntimeError as exc:
+                return str(exc)
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(embed, ["a", "bb", "boom", "aaa", "b", "ab"]))
+        assert "cannot embed boom" in results[2]
+        assert [r[0][0] for i, r in enumerate(results) if i != 2] == [1, 2, 3, 1, 2]
+
+        # malformed requests are rejected before they reach the batcher
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        with sock:
+            for texts in ("abc", [1, 2], None):
+                write_frames(sock, json.dumps({"op": "embed", "texts": texts}).encode())
+                assert "texts must be a list of strings" in json.loads(read_frame(sock))["error"]
+
+
+def test_a_request_that_would_overflow_the_batch_starts_the_next_one():
+    inner = _RecordingEmbedder()
+    batcher = MicroBatcher(inner, max_batch=4, max_wait=0.2)
+    try:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(lambda n: batcher.embed(["a"] * n), [3, 3, 6]))
+    finally:
+        batcher.close()
+    assert [len(r) for r in results] == [3, 3, 6]
+    # any two requests together exceed the cap, so each went alone
+    assert sorted(inner.calls) == [3, 3, 6]
+
+
+def test_server_replaces_a_stale_socket_but_not_a_live_one(tmp_path):
+    path = str(tmp_path / "embed.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()  # the file stays behind, with nobody listening
+
+    inner = _RecordingEmbedder()
+    with EmbeddingServer(inner, path):
+        with pytest.raises(FileExistsError):
+            EmbeddingServer(inner, path)
+        assert EmbeddingClient(path).embed(["a"]) == [[1.0, 1.0, 1.0]]
@@ -0,0 +1,236 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.core.models import Document
+from app.retrieval.faiss_store import FaissVectorStore, IndexParams
+
+
+def _docs(n):
+    return [Document(id=str(i), text="text %d" % i, metadata={}, source="s.pdf") for i in range(n)]
+
+
+def test_add_and_search_accept_lists_and_arrays():
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((20, 8)).astype("float32")
+
+    from_list = FaissVectorStore(8)
+    from_list.add(_docs(20), vecs.tolist())
+    from_array = FaissVectorStore(8)
+    from_array.add(_docs(20), vecs)
+
+    hits_list = from_list.search(vecs[3].tolist(), k=3)
+    hits_array = from_array.search(vecs[3], k=3)
+    assert hits_list[0][0].id == hits_array[0][0].id == "3"
+    assert np.isclose(hits_list[0][1], hits_array[0][1])
+
+
+def test_add_does_not_mutate_caller_array():
+    vecs = np.full((2, 4), 3.0, dtype="float32")
+    before = vecs.copy()
+    store = FaissVectorStore(4)
+    store.add(_docs(2), vecs)
+    assert np.array_equal(vecs, before)
+
+
+def test_prenormalized_search_matches():
+    rng = np.random.default_rng(1)
+    vecs = rng.standard_normal((10, 6)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    store = FaissVectorStore(6)
+    store.add(_docs(10), vecs, normalized=True)
+    hits = store.search(vecs[7:8], k=1, normalized=True)
+    assert hits[0][0].id == "7"
+    assert np.isclose(hits[0][1], 1.0, atol=1e-5)
+
+
+def _clustered(n, dim=16, seed=2):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((8, dim))
+    return (centers[rng.integers(0, 8, n)] + 0.1 * rng.standard_normal((n, dim))).astype("float32")
+
+
+def test_ivf_trains_once_sample_is_buffered_and_round_trips(tmp_path):
+    vecs = _clustered(600)
+    store = FaissVectorStore(16, IndexParams(index_type="ivf_flat", nlist=8, nprobe=8, train_size=400))
+    store.add(_docs(300), vecs[:300])
+    assert store.index_type == "flat"  # still buffering the training sample
+    store.add(_docs(300), vecs[300:])
+    assert store.index_type == "ivf_flat" and store.index.ntotal == 600
+
+    path = str(tmp_path / "idx")
+    store.persist(path)
+    loaded = FaissVectorStore(16)
+    loaded.load(path)
+    assert loaded.index_type == "ivf_flat"
+    assert loaded.params.nlist == 8 and loaded.params.nprobe == 8
+    assert loaded.search(vecs[42], k=1)[0][1] > 0.99
+
+
+def test_hnsw_and_auto_selection(tmp_path):
+    vecs = _clustered(200)
+    hnsw = FaissVectorStore(16, IndexParams(index_type="hnsw", ef_search=32))
+    hnsw.add(_docs(200), vecs)
+    assert hnsw.index_type == "hnsw"
+    assert hnsw.search(vecs[5], k=1)[0][1] > 0.99
+
+    auto = FaissVectorStore(16, IndexParams(index_type="auto"))
+    auto.add(_docs(200), vecs)
+    auto.persist(str(tmp_path / "auto"))
+    # a small corpus stays exact
+    assert auto.index_type == "flat"
+
+
+def test_ivf_pq_keeps_exact_index_when_too_small_to_train(tmp_path):
+    store = FaissVectorStore(16, IndexParams(index_type="ivf_pq", pq_m=4))
+    store.add(_docs(50), _clustered(50))
+    store.persist(str(tmp_path / "small"))
+    assert store.index_type == "flat"
+
+
+@pytest.mark.parametrize("params", [IndexParams(), IndexParams(index_type="hnsw"),
+                                    IndexParams(index_type="ivf_flat", nlist=4, nprobe=4, train_size=100)])
+def test_delete_keeps_docs_and_vectors_aligned(params):
+    vecs = _clustered(200)
+    store = FaissVectorStore(16, params)
+    store.add(_docs(200), vecs)
+    assert store.delete(["3", "150", "missing"]) == 2
+    # tombstoned: masked at once, reclaimed by compaction
+    assert store.live_count() == 198 and store.index.ntotal == 200
+    assert all(d.id != "3" for d, _ in store.search(vecs[3], k=20))
+    assert store.compact() == 2
+    assert store.index.ntotal == len(store.docs) == 198
+    top = store.search(vecs[151], k=1)[0]
+    assert top[0].id == "151" and top[1] > 0.99
+
+
+@pytest.mark.parametrize("storage", ["float32", "pq"])
+def test_delete_by_source_upsert_and_background_compaction(tmp_path, storage):
+    vecs = _clustered(300)
+    docs = [Document(id=str(i), text="text %d" % i, metadata={}, source="f%d.pdf" % (i % 3)) for i in range(300)]
+    store = FaissVectorStore(16, IndexParams(storage=storage, pq_m=4, compact_ratio=0.5))
+    store.add(docs, vecs)
+    version = store.version
+
+    assert store.delete_by_source("f1.pdf") == 100 and store.version > version
+    hits = store.search(vecs[1], k=10)
+    assert len(hits) == 10 and all(d.source != "f1.pdf" for d, _ in hits)
+    assert store.search(vecs[1], k=5, filter={"source": "f1.pdf"}) == []
+
+    # replacing a chunk masks the old vector and indexes the new one
+    new = Document(id="0", text="rewritten", metadata={}, source="f0.pdf")
+    assert store.upsert([new], vecs[150:151]) == 1
+    top = store.search(vecs[150], k=2)
+    assert "rewritten" in [d.text for d, _ in top] and store.live_count() == 200
+
+    # tombstones survive a persist/load round trip
+    path = str(tmp_path / "idx")
+    store.persist(path)
+    loaded = FaissVectorStore(16)
+    loaded.load(path)
+    assert loaded.live_count() == 200 and all(d.source != "f1.pdf" for d, _ in loaded.search(vecs[1], k=10))
+
+    # passing compact_ratio starts a background compaction
+    assert loaded.delete_by_source("f2.pdf") == 100
+    if loaded.compaction is not None:
+        loaded.compaction.join(10)
+    assert loaded.index.ntotal == len(loaded.docs) == 100 and not len(loaded.tombstones)
+    assert {d.source for d, _ in loaded.search(vecs[0], k=100)} == {"f0.pdf"}
+
+    # a fully tombstoned index searches empty until it is compacted
+    only = FaissVectorStore(16, IndexParams(index_type="hnsw", storage=storage, pq_m=4, compact_ratio=0))
+    only.add(docs[:50], vecs[:50])
+    assert only.delete(d.id for d in docs[:50]) == 50 and only.live_count() == 0
+    assert only.search(vecs[0], k=5) == [] and only.search_batch(vecs[:2], k=5) == [[], []]
+
+
+def test_searches_run_while_compaction_builds(tmp_path):
+    vecs = _clustered(200)
+    store = FaissVectorStore(16, IndexParams(index_type="hnsw", storage="int8", rerank_factor=2))
+    store.add(_docs(200), vecs)
+    store.persist(str(tmp_path / "idx"))  # memory-mapped document columns
+    store.delete([str(i) for i in range(0, 200, 2)])
+
+    building, release = threading.Event(), threading.Event()
+    compacted_index = store._compacted_index
+
+    def slow_build(positions):
+        building.set()
+        release.wait(10)
+        return compacted_index(positions)
+
+    store._compacted_index = slow_build
+    compaction = threading.Thread(target=store.compact)
+    compaction.start()
+    assert building.wait(10)
+    # served from the old structures, tombstones still masked
+    hits = store.search(vecs[1], k=5)
+    assert hits[0][0].id == "1" and all(int(d.id) % 2 for d, _ in hits)
+    release.set()
+    compaction.join(10)
+    assert store.index.ntotal == len(store.docs) == len(store.full) == 100 and not len(store.tombstones)
+    assert [d.id for d in store.docs][:3] == ["1", "3", "5"]
+    assert store.search(vecs[3], k=1)[0][0].id == "3"
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+@pytest.mark.parametrize("exact_max", [0, 10_000])
+def test_filtered_search_only_returns_matches(index_type, exact_max):
+    # exact_max=0 pushes every filter into FAISS as an ID selector;
+    # 10_000 scores the selected vectors exactly
+    vecs = _clustered(400)
+    docs = [Document(id=str(i), text="", metadata={"page": i % 10}, source=f"f{i % 4}.pdf") for i in range(400)]
+    params = IndexParams(index_type=index_type, nlist=8, nprobe=2, train_size=400, filter_exact_max=exact_max)
+    store = FaissVectorStore(16, params)
+    store.add(docs, vecs)
+
+    wanted = {"source": ["f1.pdf", "f2.pdf"], "page": 5}
+    expected = [i for i in range(400) if i % 4 in (1, 2) and i % 10 == 5]
+    hits = store.search(vecs[0], k=5, filter=wanted)
+    assert len(hits) == 5 and all(int(d.id) in expected for d, _ in hits)
+    exact = sorted(expected, key=lambda i: -float(vecs[i] @ vecs[0] / np.linalg.norm(vecs[i]) / np.linalg.norm(vecs[0])))
+    if exact_max or index_type == "flat":
+        assert [d.id for d, _ in hits] == [str(i) for i in exact[:5]]
+    assert store.search(vecs[0], k=5, filter={"source": "nope.pdf"}) == []
+    with pytest.raises(ValueError):
+        store.search(vecs[0], k=5, filter={"page": {"gt": 3}})
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+@pytest.mark.parametrize("storage", ["float16", "int8", "pq"])
+def test_quantized_storage_reranks_with_full_precision_copy(tmp_path, index_type, storage):
+    vecs = _clustered(600)
+    params = IndexParams(index_type=index_type, storage=storage, pq_m=4, pq_nbits=6, nlist=8, nprobe=8,
+                         train_size=300, rerank_factor=8)
+    store = FaissVectorStore(16, params)
+    store.add(_docs(600), vecs)
+    store.build()
+    assert (store.index_type, store.storage) == (index_type, storage)
+    assert store.bytes_per_vector() < FaissVectorStore(16, IndexParams(index_type=index_type)).bytes_per_vector()
+
+    # re-scored against the float32 copy: exact scores, not quantized ones
+    query = vecs[42] / np.linalg.norm(vecs[42])
+    top = store.search(vecs[42], k=3)
+    assert top[0][0].id == "42" and np.isclose(top[0][1], 1.0, atol=1e-5)
+    exact = vecs[int(top[1][0].id)] @ query / np.linalg.norm(vecs[int(top[1][0].id)])
+    assert np.isclose(top[1][1], exact, atol=1e-5)
+
+    path = str(tmp_path / "idx")
+    store.persist(path)
+    loaded = FaissVectorStore(16)
+    loaded.load(path)
+    assert loaded.storage == storage and len(loaded.full) == 600
+    assert loaded.search(vecs[42], k=3) == top
+    # stored vectors come from the float32 copy
+    stored = loaded.embeddings_of([doc for doc, _ in top])
+    expected = vecs[[int(doc.id) for doc, _ in top]]
+    assert np.allclose(stored, expected / np.linalg.norm(expected, axis=1, keepdims=True), atol=1e-6)
+
+    assert loaded.delete(["3", "150"]) == 2 and loaded.compact() == 2
+    assert len(loaded.full) == loaded.index.ntotal == len(loaded.docs) == 598
+    assert loaded.search(vecs[151], k=3)[0][0].id == "151"
+    # the persisted copy is untouched until the next persist
+    reopened = FaissVectorStore(16)
+    reopened.load(path)
+    assert len(reopened.full) == 600
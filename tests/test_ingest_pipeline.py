@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from app.core.interfaces import Embedder, Loader
+from app.core.models import Document
+from app.ingestion.manifest import IngestManifest
+from app.ingestion.pdf_loader import chunk_id
+from app.ingestion.pipeline import IngestPipeline
+from app.retrieval.faiss_store import FaissVectorStore
+
+
+class FakeLoader(Loader):
+    """Turns "name:n" into n chunks; "bad:*" raises."""
+
+    def load(self, path):
+        name, n = path.split(":")
+        if name == "bad":
+            raise ValueError("unreadable")
+        return [Document(id=f"{name}-{i}", text=f"{name} chunk {i}", metadata={"chunk_index": i}, source=name)
+                for i in range(int(n))]
+
+
+class FakeEmbedder(Embedder):
+    def __init__(self):
+        self.batches = []
+
+    def embed(self, texts):
+        texts = list(texts)
+        self.batches.append(len(texts))
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0, 0.5] for t in texts]
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_pipeline_streams_fixed_size_batches(workers):
+    embedder = FakeEmbedder()
+    store = FaissVectorStore(4)
+    pipeline = IngestPipeline(embedder, store, loader=FakeLoader(), workers=workers, queue_depth=2, batch_size=4)
+
+    stats = pipeline.run(["a:3", "bad:1", "b:5", "c:2"])
+
+    assert stats.files == 3 and stats.failed == 1
+    assert stats.chunks == 10 == len(store.docs) == store.index.ntotal
+    assert embedder.batches == [4, 4, 2]
+    # input order is preserved so ids line up with FAISS positions
+    assert [d.id for d in store.docs[:4]] == ["a-0", "a-1", "a-2", "b-0"]
+    assert stats.stages["embed"].items == 10
+    assert "extract" in stats.summary()
+
+
+class LineLoader(Loader):
+    """One chunk per line of a text file, with content-hash ids."""
+
+    def load(self, path):
+        with open(path, encoding="utf-8") as f:
+            lines = [l for l in f.read().splitlines() if l]
+        return [Document(id=chunk_id(path, l), text=l, metadata={}, source=path) for l in lines]
+
+
+def test_manifest_skips_unchanged_and_replaces_changed_chunks(tmp_path):
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    a.write_text("alpha\nbeta\ngamma\n", encoding="utf-8")
+    b.write_text("one\ntwo\n", encoding="utf-8")
+
+    embedder, store, manifest = FakeEmbedder(), FaissVectorStore(4), IngestManifest()
+
+    def ingest(paths):
+        pipeline = IngestPipeline(embedder, store, loader=LineLoader(), workers=0, batch_size=8, manifest=manifest)
+        return pipeline.run([str(p) for p in paths])
+
+    first = ingest([a, b])
+    assert first.chunks == 5 and len(store.docs) == 5
+
+    a.write_text("alpha\nBETA\ngamma\n", encoding="utf-8")
+    second = ingest([a, b])
+    assert second.skipped == 1
+    assert second.removed == 1 and second.chunks == 1  # only the edited line is re-embedded
+    live = store.search(np.ones(4, dtype="float32"), k=10)
+    assert sorted(d.text for d, _ in live) == ["BETA", "alpha", "gamma", "one", "two"]
+    assert store.live_count() == 5
+
+    manifest.save(str(tmp_path / "m.json"))
+    reloaded = IngestManifest.load(str(tmp_path / "m.json"))
+    assert reloaded.chunk_ids(str(a)) == [chunk_id(str(a), t) for t in ("alpha", "BETA", "gamma")]
+
+
+class PageLoader(Loader):
+    """Pages separated by form feeds, one chunk per line, content-hash ids."""
+
+    def load(self, path):
+        with open(path, encoding="utf-8") as f:
+            pages = f.read().split("\f")
+        lines = [(page, l) for page, text in enumerate(pages, 1) for l in text.splitlines() if l]
+        return [Document(id=chunk_id(path, l), text=l, metadata={"page": page, "chunk_index": i}, source=path)
+                for i, (page, l) in enumerate(lines)]
+
+
+def test_inserted_page_rewrites_metadata_of_moved_chunks(tmp_path):
+    a = tmp_path / "a.txt"
+    a.write_text("alpha\nbeta\n", encoding="utf-8")
+    embedder, store, manifest = FakeEmbedder(), FaissVectorStore(4), IngestManifest()
+
+    def ingest():
+        pipeline = IngestPipeline(embedder, store, loader=PageLoader(), workers=0, batch_size=8, manifest=manifest)
+        return pipeline.run([str(a)])
+
+    ingest()
+    a.write_text("preface\f" + "alpha\nbeta\n", encoding="utf-8")
+    stats = ingest()
+
+    assert stats.removed == 0 and stats.chunks == 3  # the moved chunks were re-added, not dropped
+    assert store.live_count() == 3
+    query = np.ones(4, dtype="float32")
+    live = {d.text: d.metadata for d, _ in store.search(query, k=10)}
+    assert live == {"preface": {"page": 1, "chunk_index": 0},
+                    "alpha": {"page": 2, "chunk_index": 1},
+                    "beta": {"page": 2, "chunk_index": 2}}
+    assert sorted(d.text for d, _ in store.search(query, k=10, filter={"page": 2})) == ["alpha", "beta"]
+
+    # a pure text edit leaves the untouched chunk's metadata alone, so it is not re-embedded
+    a.write_text("preface\f" + "alpha\nBETA\n", encoding="utf-8")
+    assert ingest().chunks == 1
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+from app.llm.llm_client import LLM_RETRIES, OpenAILLM
+from app.llm.resilience import AsyncSingleFlight, RateLimiter, ahedge, is_retryable
+from benchmarks.mock_openai import MockOpenAIServer
+
+
+def _llm(server, **kwargs):
+    llm = OpenAILLM("test-key", base_url=server.url, **kwargs)
+    llm.retry.base_delay = 0.01
+    return llm
+
+
+def test_retries_rate_limits_over_one_pooled_connection():
+    retried = LLM_RETRIES.value(reason="429")
+    with MockOpenAIServer(fail_first=2) as server:
+        llm = _llm(server)
+        assert llm.generate("hello") == "echo: hello"
+        assert "".join(llm.stream("one two")).strip() == "echo: one two"
+        assert llm.generate("again") == "echo: again"
+    assert server.requests == 5 and LLM_RETRIES.value(reason="429") == retried + 2
+    # the three plain requests reused one keep-alive connection; the stream closes its own
+    assert len(server.connections) == 2
+
+
+def test_identical_concurrent_prompts_share_one_call():
+    async def burst(llm):
+        return await asyncio.gather(*(llm.agenerate("same question") for _ in range(8)), llm.agenerate("other"))
+
+    with MockOpenAIServer(latency=0.2) as server:
+        answers = asyncio.run(burst(_llm(server)))
+    assert answers[:8] == ["echo: same question"] * 8 and answers[8] == "echo: other"
+    assert server.requests == 2
+
+
+def test_slow_calls_are_hedged():
+    with MockOpenAIServer(first_latency=2.0) as server:
+        llm = _llm(server, hedge_after=0.3)
+        start = time.perf_counter()
+        assert llm.generate("quick?") == "echo: quick?"
+        assert time.perf_counter() - start < 1.5 and server.requests == 2
+        # a fast call is not hedged
+        asyncio.run(llm.agenerate("fast"))
+        assert server.requests == 3
+        llm.close()
+
+
+def test_rate_limiter_spaces_requests_and_tokens():
+    now = [0.0]
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600, burst_seconds=1, clock=lambda: now[0])
+    assert limiter.delay(5) == 0.0
+    assert limiter.delay(5) == 1.0  # second request within the 1-request burst
+    now[0] = 10.0
+    assert limiter.delay(30) == 2.0  # 30 tokens against a 10-token burst at 10 tokens/s
+    limiter.pause(5.0)
+    assert limiter.delay(0) >= 5.0
+
+
+def test_cancelled_leader_hands_the_call_to_a_follower():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.do("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(scenario())
+    # one follower re-ran the call, the other two shared its result
+    assert calls == [1, 1] and sorted(shared for _, shared in results) == [False, True, True]
+    assert {value for value, _ in results} == {2}
+
+
+def test_async_clients_are_closed_with_their_event_loop():
+    with MockOpenAIServer() as server:
+        llm = _llm(server)
+        asyncio.run(llm.agenerate("first loop"))
+        first = llm._async_client
+        assert first.is_closed()  # asyncio.run closed it before closing the loop
+
+        async def second():
+            assert await llm.agenerate("second loop") == "echo: second loop"
+            client = llm._async_client
+            assert client is not first and not client.is_closed()
+            await llm.aclose()
+            return client
+
+        assert asyncio.run(second()).is_closed()
+
+
+def test_cancelled_hedge_call_does_not_fail_the_other():
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(0.05)
+            raise asyncio.CancelledError()
+        await asyncio.sleep(0.1)
+        return "second"
+
+    assert asyncio.run(ahedge(fn, after=0.01)) == ("second", True)
+
+
+def test_conflicts_are_not_retried():
+    class Conflict(Exception):
+        status_code = 409
+
+    class Unavailable(Exception):
+        status_code = 503
+
+    assert not is_retryable(Conflict()) and is_retryable(Unavailable())
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.cache import TTLCache
+from app.core.metrics import CACHE_LOOKUPS, MetricsRegistry, in_context, span, trace
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    hist = registry.histogram("demo_seconds", "Demo latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.observe(value, stage='a"b')
+    registry.counter("demo_total", "Demo count.").inc(2)
+    registry.gauge("demo_size", "Demo gauge.", lambda: {("x",): 1.5}, ("kind",))
+    assert registry.render().splitlines() == [
+        "# HELP demo_seconds Demo latency.",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{stage="a\\"b",le="0.1"} 2',
+        'demo_seconds_bucket{stage="a\\"b",le="1"} 3',
+        'demo_seconds_bucket{stage="a\\"b",le="+Inf"} 4',
+        'demo_seconds_sum{stage="a\\"b"} 3.65',
+        'demo_seconds_count{stage="a\\"b"} 4',
+        "# HELP demo_total Demo count.",
+        "# TYPE demo_total counter",
+        "demo_total 2",
+        "# HELP demo_size Demo gauge.",
+        "# TYPE demo_size gauge",
+        'demo_size{kind="x"} 1.5',
+    ]
+    assert registry.histogram("demo_seconds", "again") is hist
+
+
+def test_spans_join_the_active_trace_across_executor_threads():
+    def work():
+        with span("inner", items=3):
+            pass
+
+    with ThreadPoolExecutor(1) as pool, trace() as t:
+        with span("outer"):
+            pool.submit(in_context(work)).result()
+        pool.submit(work).result()  # context not propagated: not in the trace
+    assert t.calls == {"inner": 1, "outer": 1}
+    assert t.stages["outer"] >= t.stages["inner"]
+
+    hits = CACHE_LOOKUPS.value(cache="test_ttl", result="hit")
+    cache = TTLCache(4, ttl=60, name="test_ttl")
+    cache.put("k", 1)
+    cache.get("k"), cache.get("missing")
+    assert CACHE_LOOKUPS.value(cache="test_ttl", result="hit") == hits + 1
+    assert CACHE_LOOKUPS.value(cache="test_ttl", result="miss") >= 1
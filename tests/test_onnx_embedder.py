@@ -0,0 +1,32 @@
+"""OnnxEmbedder matches the PyTorch embeddings and reuses its cached export."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+from app.embeddings import onnx_embedder  # noqa: E402
+from app.embeddings.embedder import SentenceEmbedder  # noqa: E402
+from app.embeddings.onnx_embedder import OnnxEmbedder  # noqa: E402
+from benchmarks.common import make_random_model, random_texts  # noqa: E402
+
+
+def test_onnx_embeddings_agree_with_torch(tmp_path, monkeypatch):
+    pytest.importorskip("onnx")  # for int8 quantization
+    path = make_random_model(str(tmp_path / "tiny"), layers=2, hidden=32, heads=2, vocab=100)
+    texts = random_texts(40, vocab=100) + ["", "UPPER Case w1, w2!"]
+    expected = SentenceEmbedder(path).embed_array(texts, normalize=True)
+
+    cache = str(tmp_path / "onnx")
+    fp32 = OnnxEmbedder(path, cache_dir=cache, batch_tokens=256, max_batch_size=8)
+    got = fp32.embed_array(texts, normalize=True)
+    assert got.dtype == np.float32 and got.shape == expected.shape
+    assert np.min(np.sum(got * expected, axis=1)) > 0.9999
+
+    # the cached export is reused: no torch export the second time
+    monkeypatch.setattr(onnx_embedder, "export_onnx", lambda *a, **k: pytest.fail("exported twice"))
+    int8 = OnnxEmbedder(path, cache_dir=cache, quantize=True)
+    assert int8.dimension == 32 and not int8.loaded
+    assert np.min(np.sum(int8.embed_array(texts, normalize=True) * expected, axis=1)) > 0.999
+    assert OnnxEmbedder(path, cache_dir=cache).embed_array([]).shape == (0, 32)
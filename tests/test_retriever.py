@@ -0,0 +1,118 @@
+import numpy as np
+
+from app.agent.agent import RagAgent
+from app.core.cache import SemanticCache, TTLCache
+from app.core.interfaces import Embedder, LLMClient
+from app.core.models import Document
+from app.retrieval.faiss_store import FaissVectorStore
+from app.retrieval.retriever import SemanticRetriever
+
+VOCAB = ["refund", "policy", "shipping", "days", "cost", "the", "what", "is"]
+
+
+class BagOfWordsEmbedder(Embedder):
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        return [[float(t.lower().split().count(w)) + 0.01 for w in VOCAB] for t in texts]
+
+
+class CountingLLM(LLMClient):
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt, **kwargs):
+        self.calls += 1
+        return "answer %d" % self.calls
+
+
+def _setup():
+    embedder = BagOfWordsEmbedder()
+    store = FaissVectorStore(len(VOCAB))
+    docs = [Document(id="1", text="refund policy days", metadata={}, source="a.pdf"),
+            Document(id="2", text="shipping cost", metadata={}, source="a.pdf")]
+    store.add(docs, embedder.embed_array([d.text for d in docs]))
+    return embedder, store
+
+
+def test_retriever_caches_until_store_changes():
+    embedder, store = _setup()
+    retriever = SemanticRetriever(embedder, store, cache_size=8)
+    calls = embedder.calls
+
+    first = retriever.retrieve("What is the refund policy?", k=1)
+    again = retriever.retrieve("  What is the  refund policy? ", k=1)
+    assert first == again and embedder.calls == calls + 1
+
+    store.add([Document(id="3", text="refund policy", metadata={}, source="b.pdf")],
+              embedder.embed_array(["refund policy"]))
+    calls = embedder.calls
+    retriever.retrieve("What is the refund policy?", k=1)
+    # the embedding is still cached, but results are recomputed for the new snapshot
+    assert embedder.calls == calls
+    assert retriever.results_cache.misses == 2
+
+
+def test_filters_scope_results_and_cache_entries():
+    embedder, store = _setup()
+    store.add([Document(id="3", text="refund policy days", metadata={}, source="b.pdf")],
+              embedder.embed_array(["refund policy days"]))
+    retriever = SemanticRetriever(embedder, store, cache_size=8)
+    only_b = retriever.retrieve("refund policy", k=3, filter={"source": "b.pdf"})
+    assert [d.id for d, _ in only_b] == ["3"]
+    assert len(retriever.retrieve("refund policy", k=3)) == 3
+
+    llm = CountingLLM()
+    agent = RagAgent(retriever, llm, top_k=1, answer_cache=SemanticCache(8, 60.0))
+    agent.answer("refund policy", filter={"source": "a.pdf"})
+    agent.answer("refund policy", filter={"source": "b.pdf"})
+    agent.answer("refund policy", filter={"source": ["b.pdf"]})
+    # different filters never share an answer; equivalent ones do
+    assert llm.calls == 2
+
+
+def test_agent_reuses_answers_for_near_identical_questions():
+    embedder, store = _setup()
+    llm = CountingLLM()
+    agent = RagAgent(SemanticRetriever(embedder, store, cache_size=8), llm,
+                     similarity_threshold=0.0, answer_cache=SemanticCache(8, ttl=60, max_distance=0.2))
+
+    assert agent.answer("refund policy days") == "answer 1"
+    assert agent.answer("the refund policy days") == "answer 1"
+    assert agent.answer("shipping cost") == "answer 2"
+
+    store.add([Document(id="3", text="cost", metadata={}, source="b.pdf")], embedder.embed_array(["cost"]))
+    assert agent.answer("refund policy days") == "answer 3"
+
+
+def test_ttl_expiry():
+    now = [0.0]
+    cache = TTLCache(2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    now[0] = 11
+    assert cache.get("a") is None
+
+    semantic = SemanticCache(2, ttl=10, clock=lambda: now[0])
+    vec = np.ones(3, dtype="float32") / np.sqrt(3)
+    semantic.put(vec, "x")
+    assert semantic.get(vec) == "x"
+    now[0] = 30
+    assert semantic.get(vec) is None
+
+
+def test_batch_retrieval_matches_single_queries():
+    embedder, store = _setup()
+    retriever = SemanticRetriever(embedder, store, cache_size=8)
+    queries = ["refund policy", "shipping cost", "refund policy"]
+    calls = embedder.calls
+
+    batch = retriever.retrieve_batch(queries, k=2)
+    assert embedder.calls == calls + 1  # one encoder call, duplicates folded
+    assert batch == [retriever.retrieve(q, k=2) for q in queries]
+
+    llm = CountingLLM()
+    agent = RagAgent(retriever, llm, similarity_threshold=0.0)
+    answers = agent.answer_batch(["refund policy", "shipping cost"])
+    assert answers == ["answer 1", "answer 2"]
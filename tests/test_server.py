@@ -0,0 +1,328 @@
+"""Server tests: concurrent /api/chat requests overlap instead of serializing,
+answers stream over SSE, and uploads are ingested by background jobs."""
+
+import asyncio
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import pytest
+
+from app.agent.agent import RagAgent
+from app.core.interfaces import Embedder, LLMClient
+from app.core.models import Document
+from app.llm.llm_client import DummyLLM
+from app.retrieval.faiss_store import FaissVectorStore, IndexParams
+from app.retrieval.retriever import SemanticRetriever
+from app.web.jobs import IngestJob, JobManager
+from app.web.registry import StoreRegistry
+
+LLM_LATENCY = 0.1
+
+
+class CharEmbedder(Embedder):
+    def embed(self, texts):
+        return [[float(t.count(c)) + 0.01 for c in "aeiou"] for t in texts]
+
+
+class SlowLLM(LLMClient):
+    """Takes `LLM_LATENCY` per call and records the most calls in flight at once."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    def generate(self, prompt, **kwargs):
+        time.sleep(LLM_LATENCY)
+        return "ok"
+
+    async def agenerate(self, prompt, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(LLM_LATENCY)
+        finally:
+            self.active -= 1
+        return "ok"
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    import app.main
+
+    monkeypatch.setenv("STORE_REGISTRY_DIR", str(tmp_path / "stores"))
+    monkeypatch.setenv("ANSWER_CACHE_SIZE", "0")
+    monkeypatch.setenv("QUERY_CACHE_SIZE", "0")
+    embedder, llm = CharEmbedder(), SlowLLM()
+    monkeypatch.setattr(app.main, "make_embedder", lambda settings: embedder)
+    monkeypatch.setattr(app.main, "make_llm", lambda settings: llm)
+    sys.modules.pop("app.web.server", None)
+    module = importlib.import_module("app.web.server")
+
+    for doc_id, text in [("doc-a", "a document about audio"), ("doc-b", "notes on opera")]:
+        store = FaissVectorStore(5)
+        docs = [Document(id=doc_id + "-0", text=text, metadata={}, source=doc_id + ".pdf")]
+        store.add(docs, embedder.embed_array([d.text for d in docs]))
+        module.registry.add(doc_id, store, doc_id + ".pdf")
+    module.default_document_id = "doc-a"
+    yield module
+    sys.modules.pop("app.web.server", None)
+
+
+async def _fire(app, n):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.post("/api/chat", json={"question": f"question {i}"}) for i in range(n)))
+
+
+def test_concurrent_chat_throughput_scales(server):
+    n = 32
+    responses = asyncio.run(_fire(server.app, n))
+    assert all(r.status_code == 200 for r in responses)
+    # the LLM calls overlapped instead of running one after another
+    assert server.llm.peak >= n // 2
+
+
+def test_overload_is_rejected_with_429(server):
+    server.chat_limiter = server.ConcurrencyLimiter(max_active=2, max_waiting=2)
+    responses = asyncio.run(_fire(server.app, 10))
+    codes = sorted(r.status_code for r in responses)
+    assert codes.count(200) == 4 and codes.count(429) == 6
+    assert all(r.headers["retry-after"] == "1" for r in responses if r.status_code == 429)
+
+
+def test_chat_stream_emits_tokens_then_done(server):
+    async def stream():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post("/api/chat/stream", json={"question": "audio"})
+            return resp, resp.text
+
+    server.registry.agent_for(["doc-a"]).llm = DummyLLM()
+    resp, body = asyncio.run(stream())
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in body.strip().split("\n\n")]
+    assert [e[0] for e in events[-1:]] == ["event: done"]
+    tokens = [json.loads(e[1][len("data: "):])["text"] for e in events if e[0] == "event: token"]
+    assert len(tokens) > 1
+    assert "".join(tokens).startswith("I am running in offline/dummy mode.")
+
+
+def test_chat_stream_releases_its_slot_when_sending_fails(server):
+    from starlette.requests import Request
+
+    server.chat_limiter = server.ConcurrencyLimiter(max_active=1, max_waiting=0)
+    body = json.dumps({"question": "audio"}).encode()
+    scope = {"type": "http", "method": "POST", "path": "/api/chat/stream", "query_string": b"",
+             "headers": [(b"content-type", b"application/json")]}
+
+    messages = []
+
+    async def receive():
+        # the request body, then the client is gone
+        messages.append(None)
+        if len(messages) == 1:
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # the client is gone before the first byte
+        raise OSError("connection reset")
+
+    async def run():
+        for _ in range(3):
+            messages.clear()
+            response = await server.chat_stream_endpoint(Request(scope, receive))
+            with pytest.raises(OSError):
+                await response(scope, receive, send)
+            # released at once, not whenever the unstarted generator is collected
+            assert server.chat_limiter.active == 0
+
+    asyncio.run(run())
+
+
+def test_chat_scopes_to_requested_documents(server):
+    async def ask(payload):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/retrieve/batch", json=payload)
+
+    both = asyncio.run(ask({"queries": ["opera audio"], "k": 5, "document_ids": ["doc-a", "doc-b"]}))
+    assert sorted(h["source"] for h in both.json()["results"][0]) == ["doc-a.pdf", "doc-b.pdf"]
+    only_b = asyncio.run(ask({"queries": ["opera audio"], "k": 5, "document_id": "doc-b"}))
+    assert [h["source"] for h in only_b.json()["results"][0]] == ["doc-b.pdf"]
+    missing = asyncio.run(ask({"queries": ["x"], "document_id": "nope"}))
+    assert missing.status_code == 404
+    for k in (0, -1, 10**9, "5", 2.5):
+        assert asyncio.run(ask({"queries": ["x"], "k": k})).status_code == 400
+
+
+def test_delete_document_endpoint(server):
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            deleted = await client.delete("/api/documents/doc-a")
+            again = await client.delete("/api/documents/doc-a")
+            chat = await client.post("/api/chat", json={"question": "audio", "document_id": "doc-a"})
+            listing = (await client.get("/api/documents")).json()
+            return deleted, again, chat, listing
+
+    deleted, again, chat, listing = asyncio.run(scenario())
+    assert deleted.status_code == 200 and again.status_code == 404 and chat.status_code == 404
+    assert [d["document_id"] for d in listing["documents"]] == ["doc-b"]
+    assert listing["default_document_id"] is None
+
+
+def test_registry_evicts_lru_store_and_reloads_it(server):
+    registry = server.registry
+    registry.memory_budget = 1  # anything beyond the store in use is evicted
+    registry.agent_for(["doc-b"])
+    assert [d["loaded"] for d in registry.documents()] == [False, True]
+    hits = registry.agent_for(["doc-a"]).retriever.retrieve("audio", k=1)
+    assert hits[0][0].source == "doc-a.pdf"
+    assert registry.evictions == 2
+
+    # a multi-document view only reads; changes go to the member stores
+    retriever = registry.agent_for(["doc-a", "doc-b"]).retriever
+    assert not any(hasattr(retriever.store, name) for name in ("add", "persist", "load"))
+    assert {d.source for d, _ in retriever.retrieve("audio", k=4)} == {"doc-a.pdf", "doc-b.pdf"}
+
+
+class PagedLoader:
+    """Stands in for `PdfLoader`: six one-sentence chunks over three pages."""
+
+    def load(self, path, progress=None):
+        for page in (1, 2, 3):
+            progress(page, 3)
+        return [Document(id=f"c{i}", text=f"chunk {i} about audio", metadata={}, source=path) for i in range(6)]
+
+
+class GatedEmbedder(CharEmbedder):
+    """Embeds the first chunk batch at once, later ones after `release`."""
+
+    def __init__(self):
+        self.batches = 0
+        self.release = threading.Event()
+
+    def embed(self, texts):
+        if texts[0].startswith("chunk"):
+            self.batches += 1
+            if self.batches > 1:
+                self.release.wait(5)
+        return super().embed(texts)
+
+
+def test_ingest_runs_as_background_job(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "make_loader", lambda settings: PagedLoader())
+    monkeypatch.setattr(server, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(server.settings, "embed_batch_size", 2)
+    gated = GatedEmbedder()
+    monkeypatch.setattr(server, "embedder", gated)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post("/api/ingest", files={"file": ("paper.pdf", b"%PDF-fake", "application/pdf")})
+            assert resp.status_code == 202
+            job = resp.json()
+            doc_id = job["document_id"]
+
+            # the first batch is searchable while later ones are still embedding
+            for _ in range(100):
+                status = (await client.get(job["status_url"])).json()
+                if status["chunks_embedded"]:
+                    break
+                await asyncio.sleep(0.02)
+            assert status["status"] == "embedding" and status["pages_parsed"] == status["pages_total"] == 3
+            assert status["chunks_embedded"] == 2 and status["chunks_total"] == 6
+            early = await client.post("/api/chat", json={"question": "audio", "document_id": doc_id})
+            assert early.status_code == 200
+
+            gated.release.set()
+            for _ in range(100):
+                status = (await client.get(job["status_url"])).json()
+                if status["status"] == "done":
+                    break
+                await asyncio.sleep(0.02)
+            assert status["chunks_embedded"] == 6 and status["eta_seconds"] == 0.0
+
+            again = await client.post("/api/ingest", files={"file": ("copy.pdf", b"%PDF-fake", "application/pdf")})
+            assert again.json()["reused"] and again.json()["document_id"] == doc_id
+            missing = await client.get("/api/ingest/nope")
+            assert missing.status_code == 404
+            return doc_id
+
+    doc_id = asyncio.run(scenario())
+    assert len(server.registry.store(doc_id).docs) == 6
+
+
+def test_job_history_is_bounded():
+    manager = JobManager(lambda job: None, workers=1, max_queue=1, max_history=3)
+    for i in range(10):
+        manager.record(IngestJob(f"doc-{i}", "x.pdf", "x.pdf", status="done"))
+    running = manager.submit(IngestJob("doc-live", "y.pdf", "y.pdf", status="parsing"))
+    # the per-document index is pruned with the job history
+    assert len(manager._jobs) == len(manager._by_document) == 3
+    assert manager.pending_for("doc-live") is running and manager.pending_for("doc-0") is None
+
+
+def test_ready_only_after_warm_up(server):
+    async def probe():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/healthz")).status_code, (await client.get("/readyz")).status_code
+
+    assert asyncio.run(probe()) == (200, 503)
+    server.warm_up()
+    assert asyncio.run(probe()) == (200, 200)
+
+
+def test_chat_timings_and_metrics_endpoint(server):
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            plain = await client.post("/api/chat", json={"question": "audio"})
+            timed = await client.post("/api/chat", json={"question": "audio", "timings": True})
+            return plain, timed, await client.get("/metrics")
+
+    plain, timed, metrics = asyncio.run(scenario())
+    assert "timings" not in plain.json()
+    timings = timed.json()["timings"]
+    assert {"answer", "retrieve", "search", "build_prompt"} <= set(timings["stages"])
+    assert timings["stages"]["search"]["calls"] == 1
+    assert timings["values"]["context_tokens_saved"] >= 0
+    assert timings["total_ms"] >= timings["stages"]["answer"]["ms"] >= LLM_LATENCY * 1000
+
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = metrics.text.splitlines()
+    assert "rag_index_vectors 2" in lines and "rag_documents 2" in lines
+    assert any(line.startswith('rag_stage_seconds_bucket{stage="search",le="+Inf"}') for line in lines)
+    assert any(line.startswith("rag_context_tokens_saved_count ") for line in lines)
+    assert any('route="/api/chat"' in line and 'status="200"' in line for line in lines)
+
+
+def test_pinned_store_is_trained_on_the_whole_document(tmp_path):
+    params = IndexParams(index_type="ivf_flat")
+    registry = StoreRegistry(str(tmp_path), 0, new_store=lambda dim: FaissVectorStore(dim, params),
+                             new_agent=lambda store: None)
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((1600, 8)).astype("float32")
+    docs = [Document(id=str(i), text=str(i), metadata={}, source="big.pdf") for i in range(1600)]
+
+    store = FaissVectorStore(8, params)
+    store.add(docs[:64], vecs[:64])
+    registry.add("big", store, "big.pdf", pinned=True)
+    assert store.index_type == "flat" and not os.path.exists(tmp_path / "big")
+    registry.flush()  # e.g. a shutdown mid-ingest
+    assert store.index_type == "flat" and not os.path.exists(tmp_path / "catalog.json")
+
+    store.add(docs[64:], vecs[64:])
+    registry.unpin("big")
+    # trained on all 1600 vectors (nlist = 4 * sqrt(n)), not the first 64
+    assert store.index_type == "ivf_flat" and store.index.nlist == 160
+    assert json.load(open(tmp_path / "catalog.json"))["big"]["chunks"] == 1600
@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+import os
+
+import numpy as np
+import pytest
+
+from app.core.models import Document
+from app.main import store_dimension
+from app.retrieval.faiss_store import FaissVectorStore, persisted_dim
+from app.retrieval.retriever import SemanticRetriever
+from app.retrieval.sharded_store import ShardedVectorStore, shard_path
+
+
+def _corpus(n=300, dim=16, files=12, seed=0):
+    rng = np.random.default_rng(seed)
+    vecs = rng.standard_normal((n, dim)).astype("float32")
+    docs = [Document(id=str(i), text="text %d" % i, metadata={}, source="f%d.pdf" % (i % files)) for i in range(n)]
+    return docs, vecs
+
+
+class _FixedEmbedder:
+    def __init__(self, vecs):
+        self.vecs = vecs
+
+    def embed_array(self, texts, normalize=False):
+        return np.stack([self.vecs[int(t.split()[-1])] for t in texts])
+
+
+def test_fan_out_matches_a_single_store():
+    docs, vecs = _corpus()
+    single = FaissVectorStore(16)
+    single.add(docs, vecs)
+    sharded = ShardedVectorStore(16, shards=4)
+    sharded.add(docs, vecs)
+
+    assert sum(sharded.shard_sizes()) == len(sharded.docs) == 300
+    # a file's chunks all live in one shard
+    sources = [{d.source for d in shard.docs} for shard in sharded.shards]
+    assert sum(len(s) for s in sources) == len(set().union(*sources)) == 12
+    by_id = ShardedVectorStore(16, shards=4, shard_by="hash")
+    by_id.add(docs, vecs)
+    assert min(by_id.shard_sizes()) > 50
+
+    queries = vecs[:20] + 0.05
+    expected = single.search_batch(queries, k=10)
+    got = sharded.search_batch(queries, k=10)
+    for want, hits in zip(expected, got):
+        assert [d.id for d, _ in hits] == [d.id for d, _ in want]
+        assert np.allclose([s for _, s in hits], [s for _, s in want], atol=1e-5)
+
+    filtered = sharded.search(vecs[5], k=3, filter={"source": "f5.pdf"})
+    assert filtered[0][0].id == "5" and all(d.source == "f5.pdf" for d, _ in filtered)
+    top = [d for d, _ in got[0]]
+    assert np.allclose(sharded.embeddings_of(top), single.embeddings_of(top), atol=1e-6)
+
+    # the retriever works unchanged, including its version-keyed result cache
+    retriever = SemanticRetriever(_FixedEmbedder(vecs), sharded, cache_size=8)
+    assert retriever.retrieve("text 7", k=1)[0][0].id == "7"
+    version = sharded.version
+    assert sharded.delete(["7"]) == 1 and sharded.version > version
+    assert retriever.retrieve("text 7", k=1)[0][0].id != "7"
+    sharded.close()
+
+
+def test_persist_rewrites_only_changed_shards(tmp_path):
+    docs, vecs = _corpus()
+    path = str(tmp_path / "corpus")
+    store = ShardedVectorStore(16, shards=3)
+    store.add(docs, vecs)
+    store.persist(path)
+    assert persisted_dim(path) == 16
+    mtimes = [os.stat(shard_path(path, i) + ".index").st_mtime_ns for i in range(3)]
+
+    # one new file only touches its own shard
+    extra = [Document(id="new", text="text 0", metadata={}, source="new.pdf")]
+    target = store.shard_for(extra[0])
+    store.add(extra, vecs[:1])
+    store.persist(path)
+    changed = [os.stat(shard_path(path, i) + ".index").st_mtime_ns != m for i, m in enumerate(mtimes)]
+    assert changed == [i == target for i in range(3)]
+
+    # rebuilding a shard replaces just that shard's contents
+    mine = [i for i, d in enumerate(docs) if store.shard_for(d) == target][:10]
+    store.rebuild_shard(target, [docs[i] for i in mine], vecs[mine])
+    assert len(store.shards[target].docs) == 10
+    with pytest.raises(ValueError):
+        store.rebuild_shard(target, [d for d in docs if store.shard_for(d) != target][:1], vecs[:1])
+    store.persist(path)
+
+    # the persisted layout wins over the constructor's shard count
+    loaded = ShardedVectorStore(16, shards=8)
+    loaded.load(path)
+    assert loaded.shard_sizes() == store.shard_sizes()
+    assert loaded.search(vecs[mine[0]], k=1)[0][0].id == docs[mine[0]].id
+
+
+def test_store_dimension_rejects_an_index_of_another_model(tmp_path):
+    path = str(tmp_path / "idx")
+    docs, vecs = _corpus(n=20)
+    store = ShardedVectorStore(16, shards=2)
+    store.add(docs, vecs)
+    store.persist(path)
+    settings = SimpleNamespace(faiss_index_path=path, embedding_model="other-model")
+
+    assert store_dimension(settings, SimpleNamespace(dimension=16)) == 16
+    with pytest.raises(ValueError, match="--rebuild"):
+        store_dimension(settings, SimpleNamespace(dimension=8))
+    # a rebuild replaces the index, so the model's dimension wins
+    assert store_dimension(settings, SimpleNamespace(dimension=8), rebuild=True) == 8
+
+
+def test_unsharded_index_loads_as_one_shard(tmp_path):
+    path = str(tmp_path / "idx")
+    docs, vecs = _corpus(n=50)
+    plain = FaissVectorStore(16)
+    plain.add(docs, vecs)
+    plain.persist(path)
+
+    store = ShardedVectorStore(16, shards=4)
+    store.load(path)
+    assert store.shard_sizes() == [50]
+    assert store.search(vecs[3], k=1)[0][0].id == "3"
+    store.add([Document(id="new", text="text 0", metadata={}, source="new.pdf")], vecs[:1])
+    store.persist(path)
+
+    reloaded = ShardedVectorStore(16, shards=4)
+    reloaded.load(path)
+    assert reloaded.shard_sizes() == [51]